@@ -0,0 +1,111 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar
+
+from db_service import SQLiteDBHandler
+from storage import StorageBackend
+
+T = TypeVar("T")
+
+# Чтений немного и они короткие, двух потоков хватает, чтобы не ждать запись
+DB_READ_WORKERS = 2
+
+
+class AsyncDBHandler:
+    """Асинхронный фасад над хранилищем (по умолчанию SQLiteDBHandler) для обработчиков бота.
+
+    Чтения выполняются в небольшом пуле потоков, записи - в единственном
+    потоке-писателе, очередь которого сериализует их. Event loop не ждёт
+    блокировку SQLite, пока её держат потоки парсеров.
+    """
+
+    def __init__(self, db: StorageBackend | None = None, read_workers: int = DB_READ_WORKERS) -> None:
+        self.db = db or SQLiteDBHandler()
+        self._reader = ThreadPoolExecutor(max_workers=read_workers, thread_name_prefix="db-read")
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-write")
+
+    async def _run(self, executor: ThreadPoolExecutor | None, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, partial(func, *args, **kwargs))
+
+    async def read(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Выполняет произвольный читающий метод хранилища в пуле чтения."""
+        return await self._run(self._reader, func, *args, **kwargs)
+
+    async def write(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Ставит произвольную запись в очередь потока-писателя и ждёт её commit.
+
+        Следующее чтение из обработчика гарантированно увидит эту запись.
+        """
+        return await self._run(self._writer, self._write_and_flush, func, *args, **kwargs)
+
+    def _write_and_flush(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        result = func(*args, **kwargs)
+        self.db.flush()
+        return result
+
+    def shutdown(self) -> None:
+        """Дожидается выполнения поставленных записей и останавливает потоки."""
+        self._writer.shutdown(wait=True)
+        self._reader.shutdown(wait=True)
+        self.db.shutdown()
+
+    # Настройки: попадания в кэш отдаются сразу, без перехода в поток
+    async def get_setting(self, user_id: int, key: str) -> Optional[str]:
+        cached = self.db.cached_settings(user_id)
+        if cached is not None:
+            return cached[0].get(key)
+        return await self.read(self.db.get_setting, user_id, key)
+
+    async def list_settings(self, user_id: int) -> Dict[str, str]:
+        cached = self.db.cached_settings(user_id)
+        if cached is not None:
+            return dict(cached[0])
+        return await self.read(self.db.list_settings, user_id)
+
+    async def list_typed_settings(self, user_id: int) -> Dict[str, Any]:
+        if self.db.cached_settings(user_id) is not None:
+            return self.db.list_typed_settings(user_id)
+        return await self.read(self.db.list_typed_settings, user_id)
+
+    async def set_setting(self, user_id: int, key: str, value: str) -> None:
+        await self.write(self.db.set_setting, user_id, key, value)
+
+    async def delete_setting(self, user_id: int, key: str) -> None:
+        await self.write(self.db.delete_setting, user_id, key)
+
+    # Поиски
+    async def list_active_searches(self, user_id: int | None = None, platform: str | None = None) -> List[Tuple]:
+        return await self.read(self.db.list_active_searches, user_id, platform)
+
+    async def add_search(self, user_id: int, platform: str, urls: List[str], settings: Dict[str, Any], name: str = "") -> int:
+        return await self.write(self.db.add_search, user_id, platform, urls, settings, name)
+
+    async def deactivate_search(self, search_id: int) -> None:
+        await self.write(self.db.deactivate_search, search_id)
+
+    async def clean_active_searches(self) -> None:
+        await self.write(self.db.clean_active_searches)
+
+    async def reset_search_counter(self) -> bool:
+        return await self.write(self.db.reset_search_counter)
+
+    # Полнотекстовый поиск
+    async def search_ads(self, query: str, platform: str | None = None) -> List[Tuple]:
+        return await self.read(self.db.search_ads, query, platform)
+
+    # Обслуживание
+    async def compact(self, retention_days: Dict[str, int] | None = None) -> Dict[str, Any]:
+        """Компактизация идёт долго, поэтому занимает поток общего пула, а не пула чтения."""
+        return await self._run(None, self.db.compact, retention_days)
+
+    # История сканирований
+    async def clean_scan_history(self) -> None:
+        await self.write(self.db.clean_scan_history)
+
+    async def clean_cian_scan_history(self) -> None:
+        await self.write(self.db.clean_cian_scan_history)
+
+    async def clean_cian_viewed(self) -> None:
+        await self.write(self.db.clean_cian_viewed)
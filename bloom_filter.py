@@ -0,0 +1,262 @@
+import atexit
+import hashlib
+import math
+import os
+import struct
+import time
+from pathlib import Path
+from threading import Lock
+from typing import Dict, Iterable, List, Tuple
+
+from loguru import logger
+
+from db_service import PLATFORM_TABLES, SQLiteDBHandler
+from storage import StorageBackend
+
+# Доля ложных срабатываний: столько уже известных объявлений уйдут на точную проверку в БД
+SEEN_FILTER_ERROR_RATE = 0.01
+# Минимальная ёмкость фильтра; при перестроении берётся с запасом x2 от числа ID
+SEEN_FILTER_MIN_CAPACITY = 100_000
+# Запас по времени при досчитывании записей, сделанных после сохранения снимка
+SNAPSHOT_CATCH_UP_MARGIN = 60
+
+_SNAPSHOT_MAGIC = b"BLM2"
+# Заголовок снимка; за ним - строка идентичности базы длиной из последнего поля и биты
+_SNAPSHOT_HEADER = struct.Struct("<4sQIQQddH")
+
+
+class BloomFilter:
+    """Битовый Bloom-фильтр для строковых ID.
+
+    Отрицательный ответ точный, положительный означает "возможно есть"
+    с вероятностью ошибки около error_rate при заполнении до capacity.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = SEEN_FILTER_ERROR_RATE) -> None:
+        self.capacity = max(1, capacity)
+        self.error_rate = error_rate
+        self.num_bits = max(64, int(-self.capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / self.capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str) -> Iterable[int]:
+        # Двойное хеширование: k позиций из одного 128-битного дайджеста
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.num_bits for i in range(self.num_hashes))
+
+    def add(self, item: str) -> None:
+        added = False
+        for pos in self._positions(item):
+            mask = 1 << (pos & 7)
+            if not self.bits[pos >> 3] & mask:
+                self.bits[pos >> 3] |= mask
+                added = True
+        # Повторные добавления не увеличивают счётчик заполнения
+        if added:
+            self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+    def save(self, path: Path, saved_at: float, identity: str = "") -> None:
+        """Атомарно записывает фильтр в файл: сначала во временный, затем rename.
+
+        identity - строка базы, по которой построен фильтр (см. SQLiteDBHandler.database_identity).
+        """
+        identity_bytes = identity.encode()
+        tmp_path = path.with_suffix(path.suffix + ".tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(_SNAPSHOT_HEADER.pack(
+                _SNAPSHOT_MAGIC, self.num_bits, self.num_hashes, self.count,
+                self.capacity, self.error_rate, saved_at, len(identity_bytes),
+            ))
+            f.write(identity_bytes)
+            f.write(self.bits)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: Path) -> tuple["BloomFilter", float, str]:
+        """Читает фильтр из файла, возвращает его, время сохранения снимка и строку базы."""
+        with open(path, "rb") as f:
+            header = f.read(_SNAPSHOT_HEADER.size)
+            (
+                magic, num_bits, num_hashes, count, capacity, error_rate, saved_at, identity_size,
+            ) = _SNAPSHOT_HEADER.unpack(header)
+            if magic != _SNAPSHOT_MAGIC:
+                raise ValueError(f"Неизвестный формат снимка {path}")
+            identity = f.read(identity_size).decode()
+            bits = bytearray(f.read())
+
+        if len(bits) != (num_bits + 7) // 8:
+            raise ValueError(f"Снимок {path} повреждён")
+
+        bloom = cls.__new__(cls)
+        bloom.capacity = capacity
+        bloom.error_rate = error_rate
+        bloom.num_bits = num_bits
+        bloom.num_hashes = num_hashes
+        bloom.bits = bits
+        bloom.count = count
+        return bloom, saved_at, identity
+
+
+class SeenAdsFilter:
+    """Bloom-фильтр всех известных ID объявлений одной площадки.
+
+    Отвечает "точно новое" без обращения к SQLite; только возможные
+    совпадения парсеры перепроверяют точным запросом. Фильтр строится
+    из истории сканирований и таблицы отправленных объявлений, хранится
+    снимком рядом с файлом базы (database.seen_avito.bloom) и при запуске
+    загружается из него, досчитывая записи, сделанные после сохранения
+    снимка. Снимок другой базы (не совпал путь, UUID или версия схемы)
+    не используется - фильтр строится заново. Для хранилищ в памяти
+    (persistent = False) снимок не ведётся.
+    """
+
+    def __init__(
+        self,
+        platform: str,
+        db: StorageBackend | None = None,
+        error_rate: float = SEEN_FILTER_ERROR_RATE,
+        snapshot_path: Path | None = None,
+    ) -> None:
+        self.platform = platform
+        self.db = db or SQLiteDBHandler()
+        self.error_rate = error_rate
+        self.persistent = getattr(self.db, "persistent", True)
+        self.identity = self.db.database_identity() if self.persistent else ""
+        if snapshot_path is None and self.persistent:
+            db_path = Path(self.db.db_path)
+            snapshot_path = db_path.with_name(f"{db_path.stem}.seen_{platform}.bloom")
+        self.snapshot_path = snapshot_path
+        self._lock = Lock()
+        self._dirty = False
+        # ID, добавленные во время перестроения, которые ещё могут отсутствовать в БД
+        self._pending: List[str] | None = None
+        self._bloom = self._load_or_build()
+
+    def _load_or_build(self) -> BloomFilter:
+        if self.persistent and self.snapshot_path.exists():
+            try:
+                start = time.perf_counter()
+                bloom, saved_at, identity = BloomFilter.load(self.snapshot_path)
+                if identity != self.identity:
+                    raise ValueError(f"снимок построен по другой базе ({identity or 'без отметки'})")
+                caught_up = 0
+                for ad_id in self.db.iter_ad_ids(self.platform, since=int(saved_at) - SNAPSHOT_CATCH_UP_MARGIN):
+                    bloom.add(ad_id)
+                    caught_up += 1
+                self._dirty = caught_up > 0
+                logger.info(
+                    f"Фильтр известных объявлений {self.platform}: загружен снимок "
+                    f"({bloom.count} ID, досчитано {caught_up}) за {(time.perf_counter() - start) * 1000:.0f} мс"
+                )
+                return bloom
+            except (OSError, ValueError, struct.error) as e:
+                logger.warning(f"Не удалось загрузить снимок {self.snapshot_path}: {e}. Перестраиваю фильтр")
+        return self._build()
+
+    def _build(self) -> BloomFilter:
+        start = time.perf_counter()
+        ids = list(self.db.iter_ad_ids(self.platform))
+        bloom = BloomFilter(max(SEEN_FILTER_MIN_CAPACITY, 2 * len(ids)), self.error_rate)
+        for ad_id in ids:
+            bloom.add(ad_id)
+        self._dirty = True
+        logger.info(
+            f"Фильтр известных объявлений {self.platform}: построен по БД "
+            f"({len(ids)} ID) за {(time.perf_counter() - start) * 1000:.0f} мс"
+        )
+        return bloom
+
+    def might_contain(self, ad_id: str) -> bool:
+        """False - объявление точно новое; True - нужна точная проверка в БД."""
+        return str(ad_id) in self._bloom
+
+    def add_many(self, ids: Iterable[str]) -> None:
+        ids = [str(ad_id) for ad_id in ids]
+        with self._lock:
+            for ad_id in ids:
+                self._bloom.add(ad_id)
+            if self._pending is not None:
+                self._pending.extend(ids)
+            self._dirty = True
+
+    def rebuild(self) -> None:
+        """Перестраивает фильтр по БД: после удаления старых записей и при переполнении."""
+        with self._lock:
+            self._pending = []
+        try:
+            self.db.flush()
+            bloom = self._build()
+            with self._lock:
+                for ad_id in self._pending:
+                    bloom.add(ad_id)
+                self._bloom = bloom
+        finally:
+            with self._lock:
+                self._pending = None
+
+    @property
+    def overfilled(self) -> bool:
+        return self._bloom.count > self._bloom.capacity
+
+    def save_snapshot(self) -> None:
+        """Сохраняет снимок на диск, если с прошлого сохранения были изменения."""
+        with self._lock:
+            if not self._dirty or not self.persistent:
+                return
+            saved_at = time.time()
+            self._bloom.save(self.snapshot_path, saved_at, self.identity)
+            self._dirty = False
+
+
+# Фильтры по (площадка, id хранилища): у каждого хранилища свой набор известных ID
+_filters: Dict[Tuple[str, int], SeenAdsFilter] = {}
+_filters_lock = Lock()
+
+
+def get_seen_filter(platform: str, db: StorageBackend | None = None) -> SeenAdsFilter:
+    """Возвращает общий для процесса фильтр площадки в хранилище db (по умолчанию SQLite),
+    создавая его при первом обращении."""
+    db = db or SQLiteDBHandler()
+    with _filters_lock:
+        key = (platform, id(db))
+        if key not in _filters:
+            _filters[key] = SeenAdsFilter(platform, db)
+        return _filters[key]
+
+
+def warm_seen_filters(db: StorageBackend | None = None) -> None:
+    """Создаёт фильтры всех площадок заранее.
+
+    Загрузка снимка или построение по БД читает историю целиком, поэтому
+    бот вызывает это в пуле потоков при старте, а не при создании первого
+    парсера.
+    """
+    for platform in PLATFORM_TABLES:
+        get_seen_filter(platform, db)
+
+
+def save_seen_filters() -> None:
+    """Сохраняет снимки всех созданных фильтров, переполненные перед этим перестраивает."""
+    for seen_filter in list(_filters.values()):
+        try:
+            if seen_filter.overfilled:
+                seen_filter.rebuild()
+            seen_filter.save_snapshot()
+        except OSError as e:
+            logger.error(f"Не удалось сохранить снимок фильтра {seen_filter.platform}: {e}")
+
+
+def rebuild_seen_filters() -> None:
+    """Перестраивает все созданные фильтры по БД и сохраняет их снимки."""
+    for seen_filter in list(_filters.values()):
+        seen_filter.rebuild()
+    save_seen_filters()
+
+
+atexit.register(save_seen_filters)
@@ -1,15 +1,20 @@
 import asyncio
+import html
 import json
 import os
+import tempfile
 import time
 from contextlib import suppress
 from dataclasses import dataclass
+from datetime import datetime
+from functools import partial
+from pathlib import Path
 from typing import Any, Dict, List, Tuple
 
 from aiogram import Bot, Dispatcher, Router, F
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
-from aiogram.filters import Command, StateFilter
+from aiogram.filters import Command, CommandObject, StateFilter
 from aiogram.filters.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.storage.memory import MemoryStorage
@@ -25,9 +30,13 @@ from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from loguru import logger
 import requests
 
-from db_service import SQLiteDBHandler
+from async_db import AsyncDBHandler
+from bloom_filter import rebuild_seen_filters, save_seen_filters, warm_seen_filters
+from exporter import EXPORT_FORMATS, export_ads
 from parser_avito import AvitoParse
 from parser_cian import CianParse
+from proxy_pool import get_proxy_pool, parse_proxy_list, requests_proxies
+from storage import create_storage
 
 TOKEN = os.getenv("BOT_TOKEN")
 if not TOKEN:
@@ -40,7 +49,16 @@ router = Router()
 dp.include_router(router)
 
 scheduler = AsyncIOScheduler()
-DB = SQLiteDBHandler()
+# Хранилище: sqlite (по умолчанию) или memory - без диска, для нагрузочных прогонов
+DB = AsyncDBHandler(create_storage(os.getenv("STORAGE_BACKEND", "sqlite")))
+
+# Как часто удалять из БД объявления старше срока хранения (DB_RETENTION_DAYS)
+COMPACT_INTERVAL_HOURS = 6
+# Как часто сохранять на диск снимки фильтров известных объявлений
+SEEN_FILTER_SNAPSHOT_MINUTES = 5
+# Тёплый перезапуск: история сканирований и активные поиски переживают рестарт.
+# WARM_RESTART=0 возвращает холодный старт с очисткой истории и остановкой поисков
+WARM_RESTART = os.getenv("WARM_RESTART", "1") != "0"
 
 class SearchStates(StatesGroup):
     waiting_for_urls = State()
@@ -68,6 +86,8 @@ class SearchJob:
     parser: Any = None
     total_new_ads: int = 0
     total_notified_ads: int = 0
+    # Время снятия блокировки IP, если последнее сканирование ею прервано (иначе 0)
+    blocked_until: float = 0.0
 
 ACTIVE: dict[int, SearchJob] = {}
 
@@ -185,7 +205,7 @@ def _parse_list(txt: str) -> List[str]:
     return [w.strip() for w in txt.split(";") if w.strip()]
 
 
-def user_settings(uid: int, platform: str = "avito") -> Dict[str, Any]:
+async def user_settings(uid: int, platform: str = "avito") -> Dict[str, Any]:
     """Получает настройки пользователя для указанной платформы."""
     if platform == "avito":
         s = DEFAULT_AVITO.copy()
@@ -193,7 +213,8 @@ def user_settings(uid: int, platform: str = "avito") -> Dict[str, Any]:
         s = DEFAULT_CIAN.copy()
     
     settings_prefix = f"{platform}_" if platform != "avito" else ""
-    user_settings = DB.list_settings(uid)
+    # Значения приходят из кэша настроек уже разобранными: числа, флаги, списки слов
+    user_settings = await DB.list_typed_settings(uid)
     
     platform_settings = {}
     for key, value in user_settings.items():
@@ -204,36 +225,73 @@ def user_settings(uid: int, platform: str = "avito") -> Dict[str, Any]:
             platform_settings[clean_key] = value
     
     s.update(platform_settings)
-    
-    if "min_price" in s:
-        s["min_price"] = int(s["min_price"])
-    if "max_price" in s:
-        s["max_price"] = int(s["max_price"])
-    if "pages" in s:
-        s["pages"] = int(s["pages"])
-    if "pause" in s:
-        s["pause"] = int(s["pause"])
-    if "new_only" in s:
-        s["new_only"] = bool(int(s.get("new_only", 0))) if isinstance(s.get("new_only"), str) else bool(s["new_only"])
-    
-    if "keywords" in s:
-        s["keywords"] = _parse_list(s["keywords"]) if isinstance(s["keywords"], str) else s["keywords"]
-    if "blacklist" in s:
-        s["blacklist"] = _parse_list(s["blacklist"]) if isinstance(s["blacklist"], str) else s["blacklist"]
-    
     return s
 
 
-def save(uid: int, key: str, value: Any, platform: str = "avito"):
+async def save(uid: int, key: str, value: Any, platform: str = "avito"):
     """Сохраняет настройку в базу данных с учетом платформы."""
     if platform != "avito":
         key = f"{platform}_{key}"
-    DB.set_setting(uid, key, str(value))
+    await DB.set_setting(uid, key, str(value))
 
 @router.message(Command("start"))
 async def cmd_start(m: Message):
     await m.answer(f"Здравствуйте, {m.from_user.first_name}! На что желаете поохотиться сегодня?", reply_markup=kb_main())
 
+@router.message(Command("find"))
+async def cmd_find(m: Message, command: CommandObject):
+    """Поиск по уже встречавшимся объявлениям: /find слова [avito|cian]."""
+    words = (command.args or "").split()
+    platform = None
+    if words and words[-1].lower() in ("avito", "cian"):
+        platform = words.pop().lower()
+    if not words:
+        await m.answer("Укажите слова для поиска, например: <code>/find квартира студия</code>")
+        return
+    
+    rows = await DB.search_ads(" ".join(words), platform)
+    if not rows:
+        await m.answer("Среди просмотренных объявлений ничего не найдено.")
+        return
+    
+    lines = []
+    for ad_platform, ad_id, title, price, url in rows:
+        platform_icon = "🏙️" if ad_platform == "cian" else "🏠"
+        lines.append(f"{platform_icon} <a href=\"{html.escape(url or '', quote=True)}\">{html.escape(title or ad_id)}</a> - {price or '-'}₽")
+    await m.answer("Найденные объявления:\n" + "\n".join(lines), disable_web_page_preview=True)
+
+@router.message(Command("export"))
+async def cmd_export(m: Message, command: CommandObject):
+    """Выгрузка собранных объявлений файлом: /export [avito|cian] [jsonl|csv] [дней]."""
+    platform, fmt, days = None, "jsonl", None
+    for arg in (command.args or "").lower().split():
+        if arg in ("avito", "cian"):
+            platform = arg
+        elif arg in EXPORT_FORMATS:
+            fmt = arg
+        elif arg.isdigit():
+            days = int(arg)
+        else:
+            await m.answer("Формат команды: <code>/export [avito|cian] [jsonl|csv] [дней]</code>")
+            return
+    
+    since = int(time.time()) - days * 86400 if days else None
+    path = Path(tempfile.gettempdir()) / f"ads_{m.from_user.id}_{int(time.time())}.{fmt}.gz"
+    try:
+        count = await asyncio.get_running_loop().run_in_executor(
+            None, partial(export_ads, path, fmt, platform, since, db=DB.db)
+        )
+        if not count:
+            await m.answer("Нет объявлений для выгрузки.")
+            return
+        await m.answer_document(FSInputFile(path), caption=f"Выгружено объявлений: {count}")
+    except Exception as e:
+        logger.error(f"Ошибка при выгрузке объявлений: {e}")
+        await m.answer("Не удалось выгрузить объявления.")
+    finally:
+        with suppress(FileNotFoundError):
+            path.unlink()
+
 @router.callback_query(F.data == "menu:avito")
 async def cb_avito_menu(cq: CallbackQuery):
     await cq.message.edit_text("Не забудьте проверить параметры перед новым поиском.", reply_markup=kb_avito())
@@ -248,9 +306,9 @@ async def cb_cian_menu(cq: CallbackQuery):
 async def cb_proxy(cq: CallbackQuery, state: FSMContext):
     # Получаем текущие настройки прокси
     user_id = cq.from_user.id
-    proxy = DB.get_setting(user_id, "proxy") or "Не настроено"
-    proxy_change_url = DB.get_setting(user_id, "proxy_change_url") or "Не настроено"
-    verified = "Да" if DB.get_setting(user_id, "proxy_verified") == "1" else "Нет"
+    proxy = await DB.get_setting(user_id, "proxy") or "Не настроено"
+    proxy_change_url = await DB.get_setting(user_id, "proxy_change_url") or "Не настроено"
+    verified = "Да" if await DB.get_setting(user_id, "proxy_verified") == "1" else "Нет"
     
     # Формируем текст для отображения текущих настроек
     proxy_text = (
@@ -266,7 +324,7 @@ async def cb_proxy(cq: CallbackQuery, state: FSMContext):
 
 @router.callback_query(F.data == "menu:show_searches")
 async def cb_show_searches(cq: CallbackQuery):
-    rows = DB.list_active_searches(cq.from_user.id)
+    rows = await DB.list_active_searches(cq.from_user.id)
     if not rows:
         await cq.answer("Активных поисков нет", show_alert=True)
         return
@@ -289,7 +347,7 @@ async def cb_show_searches(cq: CallbackQuery):
 
 @router.callback_query(F.data == "action:stop_search")
 async def cb_action_stop_search(cq: CallbackQuery, state: FSMContext):
-    rows = DB.list_active_searches(cq.from_user.id)
+    rows = await DB.list_active_searches(cq.from_user.id)
     if not rows:
         await cq.answer("Активных поисков нет", show_alert=True)
         return
@@ -328,7 +386,7 @@ async def cb_back(cq: CallbackQuery):
 
 @router.callback_query(F.data == "avito:show")
 async def cb_avito_show(cq: CallbackQuery):
-    s = user_settings(cq.from_user.id, "avito")
+    s = await user_settings(cq.from_user.id, "avito")
     txt = (
         f"<b>Параметры Авито</b>\n"
         f"Цена: {s['min_price']}–{s['max_price']}\n"
@@ -355,7 +413,7 @@ async def cb_avito_edit(cq: CallbackQuery):
 
 @router.callback_query(F.data == "cian:show")
 async def cb_cian_show(cq: CallbackQuery):
-    s = user_settings(cq.from_user.id, "cian")
+    s = await user_settings(cq.from_user.id, "cian")
     txt = (
         f"<b>Параметры ЦИАН</b>\n"
         f"Цена: {s['min_price']}–{s['max_price']}\n"
@@ -410,8 +468,8 @@ async def handle_search_name(message: Message, state: FSMContext):
             await bot.send_message(message.chat.id, "Не забудьте проверить параметры перед новым поиском.", reply_markup=kb_avito())
         return
     
-    st = user_settings(message.from_user.id, platform)
-    sid = DB.add_search(message.from_user.id, platform, urls, st, name)
+    st = await user_settings(message.from_user.id, platform)
+    sid = await DB.add_search(message.from_user.id, platform, urls, st, name)
     ev = asyncio.Event()
     
     job = SearchJob(sid, message.from_user.id, platform, urls, st, ev, first_run=True, name=name)
@@ -425,17 +483,25 @@ async def handle_search_name(message: Message, state: FSMContext):
     else:
         await run_avito(job)
     
-    job.first_run = False
+    # Прерванное блокировкой первичное сканирование повторится по расписанию
+    job.first_run = bool(job.blocked_until)
     
     interval_seconds = st["pause"]
+    job_options = {"next_run_time": datetime.fromtimestamp(job.blocked_until)} if job.blocked_until else {}
     
     if platform == "cian":
-        scheduler.add_job(run_cian, "interval", seconds=interval_seconds, args=[job], id=str(sid))
+        scheduler.add_job(run_cian, "interval", seconds=interval_seconds, args=[job], id=str(sid), **job_options)
     else:
-        scheduler.add_job(run_avito, "interval", seconds=interval_seconds, args=[job], id=str(sid))
+        scheduler.add_job(run_avito, "interval", seconds=interval_seconds, args=[job], id=str(sid), **job_options)
     
     display_name = f"Поиск {platform_name} #{sid}" if not name else f"Поиск {platform_name} #{sid}-{name}"
-    await message.reply(f"{display_name} запущен.\nПервичное сканирование завершено. Теперь будут приходить уведомления только о новых объявлениях.")
+    if job.blocked_until:
+        await message.reply(
+            f"{display_name} запущен.\n{platform_name} ограничил доступ с этого IP, первичное сканирование "
+            f"продолжится в {datetime.fromtimestamp(job.blocked_until):%H:%M}."
+        )
+    else:
+        await message.reply(f"{display_name} запущен.\nПервичное сканирование завершено. Теперь будут приходить уведомления только о новых объявлениях.")
     await state.clear()
     
     if platform == "cian":
@@ -453,7 +519,7 @@ async def cb_edit_param(cq: CallbackQuery, state: FSMContext):
         return
     
     if param == "kw":
-        s = user_settings(cq.from_user.id)
+        s = await user_settings(cq.from_user.id)
         current_kw = ", ".join(s["keywords"]) if s["keywords"] else "не задано"
         
         kb = InlineKeyboardBuilder()
@@ -467,7 +533,7 @@ async def cb_edit_param(cq: CallbackQuery, state: FSMContext):
         return
     
     if param == "black":
-        s = user_settings(cq.from_user.id)
+        s = await user_settings(cq.from_user.id)
         current_bl = ", ".join(s["blacklist"]) if s["blacklist"] else "не задано"
         
         kb = InlineKeyboardBuilder()
@@ -501,7 +567,7 @@ async def cb_edit_param_cian(cq: CallbackQuery, state: FSMContext):
     param = cq.data.split(":", 1)[1]
     
     if param == "kw":
-        s = user_settings(cq.from_user.id, "cian")
+        s = await user_settings(cq.from_user.id, "cian")
         current_kw = ", ".join(s["keywords"]) if s["keywords"] else "не задано"
         
         kb = InlineKeyboardBuilder()
@@ -515,7 +581,7 @@ async def cb_edit_param_cian(cq: CallbackQuery, state: FSMContext):
         return
     
     if param == "black":
-        s = user_settings(cq.from_user.id, "cian")
+        s = await user_settings(cq.from_user.id, "cian")
         current_bl = ", ".join(s["blacklist"]) if s["blacklist"] else "не задано"
         
         kb = InlineKeyboardBuilder()
@@ -546,7 +612,7 @@ async def cb_edit_param_cian(cq: CallbackQuery, state: FSMContext):
 
 @router.callback_query(F.data == "kw_cian:clear")
 async def cb_kw_cian_clear(cq: CallbackQuery):
-    save(cq.from_user.id, "keywords", "", platform="cian")
+    await save(cq.from_user.id, "keywords", "", platform="cian")
     await cq.message.edit_text("Ключевые слова ЦИАН очищены!")
     await asyncio.sleep(1)
     await cq.message.edit_text("Изменить параметры ЦИАН", reply_markup=kb_edit_params_cian())
@@ -563,7 +629,7 @@ async def cb_kw_cian_edit(cq: CallbackQuery, state: FSMContext):
 
 @router.callback_query(F.data == "black_cian:clear")
 async def cb_black_cian_clear(cq: CallbackQuery):
-    save(cq.from_user.id, "blacklist", "", platform="cian")
+    await save(cq.from_user.id, "blacklist", "", platform="cian")
     await cq.message.edit_text("Черный список ЦИАН очищен!")
     await asyncio.sleep(1)
     await cq.message.edit_text("Изменить параметры ЦИАН", reply_markup=kb_edit_params_cian())
@@ -580,7 +646,7 @@ async def cb_black_cian_edit(cq: CallbackQuery, state: FSMContext):
 
 @router.callback_query(F.data == "kw:clear")
 async def cb_kw_clear(cq: CallbackQuery):
-    save(cq.from_user.id, "keywords", "")
+    await save(cq.from_user.id, "keywords", "")
     await cq.message.edit_text("Ключевые слова очищены!")
     await asyncio.sleep(1)
     await cq.message.edit_text("Изменить параметры", reply_markup=kb_edit_params_avito())
@@ -597,7 +663,7 @@ async def cb_kw_edit(cq: CallbackQuery, state: FSMContext):
 
 @router.callback_query(F.data == "black:clear")
 async def cb_black_clear(cq: CallbackQuery):
-    save(cq.from_user.id, "blacklist", "")
+    await save(cq.from_user.id, "blacklist", "")
     await cq.message.edit_text("Черный список очищен!")
     await asyncio.sleep(1)
     await cq.message.edit_text("Изменить параметры", reply_markup=kb_edit_params_avito())
@@ -615,7 +681,7 @@ async def cb_black_edit(cq: CallbackQuery, state: FSMContext):
 @router.callback_query(F.data.startswith("new_only:"))
 async def cb_new_only(cq: CallbackQuery):
     value = int(cq.data.split(":", 1)[1])
-    save(cq.from_user.id, "new_only", value)
+    await save(cq.from_user.id, "new_only", value)
     
     if value:
         await cq.message.edit_text("⚠️ <b>Внимание!</b> Для корректной работы функции 'Только новые' необходимо настроить прокси в главном меню.\n\nПараметр 'Только новые' установлен на: Да\n\nПараметры успешно сохранены!")
@@ -642,8 +708,8 @@ async def handle_price(message: Message, state: FSMContext):
             return
         
         mn, mx = map(int, parts)
-        save(message.from_user.id, "min_price", mn, platform)
-        save(message.from_user.id, "max_price", mx, platform)
+        await save(message.from_user.id, "min_price", mn, platform)
+        await save(message.from_user.id, "max_price", mx, platform)
         await message.reply(f"Параметр 'Цена' успешно обновлен: {mn}–{mx}₽")
         await state.clear()
         
@@ -670,7 +736,7 @@ async def handle_pages(message: Message, state: FSMContext):
             kb.button(text="⬅︎ Назад", callback_data=back_command)
             await message.reply("Количество страниц должно быть положительным числом.", reply_markup=kb.as_markup())
             return
-        save(message.from_user.id, "pages", pages, platform)
+        await save(message.from_user.id, "pages", pages, platform)
         await message.reply(f"Параметр 'Страницы' успешно обновлен: {pages}")
         await state.clear()
         
@@ -697,7 +763,7 @@ async def handle_pause(message: Message, state: FSMContext):
             kb.button(text="⬅︎ Назад", callback_data=back_command)
             await message.reply("Пауза должна быть положительным числом.", reply_markup=kb.as_markup())
             return
-        save(message.from_user.id, "pause", pause, platform)
+        await save(message.from_user.id, "pause", pause, platform)
         await message.reply(f"Параметр 'Пауза' успешно обновлен: {pause} сек")
         await state.clear()
         
@@ -717,7 +783,7 @@ async def handle_keywords(message: Message, state: FSMContext):
     platform = data.get("platform", "avito")
     
     keywords = _parse_list(txt)
-    save(message.from_user.id, "keywords", txt, platform)
+    await save(message.from_user.id, "keywords", txt, platform)
     keyword_list = ", ".join(keywords) if keywords else "список пуст"
     await message.reply(f"Параметр 'Ключевые слова' успешно обновлен: {keyword_list}")
     await state.clear()
@@ -734,7 +800,7 @@ async def handle_blacklist(message: Message, state: FSMContext):
     platform = data.get("platform", "avito")
     
     blacklist = _parse_list(txt)
-    save(message.from_user.id, "blacklist", txt, platform)
+    await save(message.from_user.id, "blacklist", txt, platform)
     blacklist_items = ", ".join(blacklist) if blacklist else "список пуст"
     await message.reply(f"Параметр 'Чёрный список' успешно обновлен: {blacklist_items}")
     await state.clear()
@@ -746,7 +812,7 @@ async def handle_blacklist(message: Message, state: FSMContext):
 
 @router.callback_query(F.data == "proxy:add")
 async def cb_proxy_add(cq: CallbackQuery, state: FSMContext):
-    rows = DB.list_active_searches(cq.from_user.id)
+    rows = await DB.list_active_searches(cq.from_user.id)
     active_searches_text = ""
     
     if rows:
@@ -776,6 +842,13 @@ async def handle_proxy(message: Message, state: FSMContext):
     proxy_text = message.text.strip()
     user_id = message.from_user.id
     
+    if not parse_proxy_list(proxy_text):
+        await message.reply("❌ Неверный формат прокси. Используйте один из форматов:\n"
+                            "• username:password@server:port\n"
+                            "• server:port:username:password\n"
+                            "Несколько прокси разделяйте символом ;")
+        return
+    
     await state.update_data(proxy=proxy_text)
     
     text = (
@@ -801,11 +874,11 @@ async def handle_proxy_url(message: Message, state: FSMContext):
         proxy_url = ""
     
     # Сохраняем настройки в базу данных
-    DB.set_setting(user_id, "proxy", proxy_text)
-    DB.set_setting(user_id, "proxy_change_url", proxy_url)
+    await DB.set_setting(user_id, "proxy", proxy_text)
+    await DB.set_setting(user_id, "proxy_change_url", proxy_url)
     
     # Сбрасываем статус проверки прокси при его изменении
-    DB.set_setting(user_id, "proxy_verified", "0")
+    await DB.set_setting(user_id, "proxy_verified", "0")
     
     # Обновляем настройки для всех активных поисков
     for job_id, job in ACTIVE.items():
@@ -814,15 +887,15 @@ async def handle_proxy_url(message: Message, state: FSMContext):
             job.settings["proxy_change_url"] = proxy_url
     
     # Сохраняем для всех платформ
-    DB.set_setting(user_id, "cian_proxy", proxy_text)
+    await DB.set_setting(user_id, "cian_proxy", proxy_text)
     
     # Уведомляем пользователя о сохранении
     await message.reply("Настройки прокси успешно сохранены.")
     
     # Показываем текущие настройки прокси
-    proxy = DB.get_setting(user_id, "proxy") or "Не настроено"
-    proxy_change_url = DB.get_setting(user_id, "proxy_change_url") or "Не настроено"
-    verified = "Да" if DB.get_setting(user_id, "proxy_verified") == "1" else "Нет"
+    proxy = await DB.get_setting(user_id, "proxy") or "Не настроено"
+    proxy_change_url = await DB.get_setting(user_id, "proxy_change_url") or "Не настроено"
+    verified = "Да" if await DB.get_setting(user_id, "proxy_verified") == "1" else "Нет"
     
     proxy_text = (
         "<b>Настройки прокси</b>\n\n"
@@ -841,8 +914,8 @@ async def verify_proxy(user_id: int, message_obj) -> None:
     Проверяет работу прокси и смену IP
     message_obj: может быть объектом сообщения или запросом callback
     """
-    proxy = DB.get_setting(user_id, "proxy") or ""
-    proxy_url = DB.get_setting(user_id, "proxy_change_url") or ""
+    proxy = await DB.get_setting(user_id, "proxy") or ""
+    proxy_url = await DB.get_setting(user_id, "proxy_change_url") or ""
     
     # Проверяем, настроен ли прокси
     if not proxy:
@@ -859,31 +932,17 @@ async def verify_proxy(user_id: int, message_obj) -> None:
         status_message = await bot.send_message(message_obj.chat.id, "🔄 Проверка прокси...\n\nПолучение текущего IP...")
     
     try:
-        # Создаем сессию с прокси
-        session = requests.Session()
-        if ":" in proxy and "@" in proxy:
-            # Формат username:password@server:port
-            proxies = {
-                "http": f"http://{proxy}",
-                "https": f"http://{proxy}"
-            }
-        elif proxy.count(":") == 3:
-            # Формат host:port:username:password
-            parts = proxy.split(":")
-            if len(parts) == 4:
-                host, port, username, password = parts
-                formatted_proxy = f"{username}:{password}@{host}:{port}"
-                proxies = {
-                    "http": f"http://{formatted_proxy}",
-                    "https": f"http://{formatted_proxy}"
-                }
-        else:
+        # Создаем сессию с прокси; из списка проверяется первый
+        proxies = parse_proxy_list(proxy)
+        if not proxies:
             await status_message.edit_text("❌ Неверный формат прокси. Используйте один из форматов:\n"
                                          "• username:password@server:port\n"
                                          "• server:port:username:password")
             return
         
-        session.proxies.update(proxies)
+        proxy = proxies[0]
+        session = requests.Session()
+        session.proxies.update(requests_proxies(proxy))
         
         # Получаем исходный IP
         try:
@@ -895,6 +954,7 @@ async def verify_proxy(user_id: int, message_obj) -> None:
                 return
                 
             original_ip = original_ip_response.text
+            get_proxy_pool().report_success(proxy, original_ip_response.elapsed.total_seconds())
             await status_message.edit_text(f"🔄 Проверка прокси...\n\nТекущий IP: {original_ip}\n\n"
                                         f"Выполняется смена IP...")
             
@@ -956,8 +1016,8 @@ async def verify_proxy(user_id: int, message_obj) -> None:
                 
                 if new_ip != original_ip:
                     # Сохраняем информацию о успешной проверке
-                    DB.set_setting(user_id, "proxy_verified", "1")
-                    DB.set_setting(user_id, "proxy_last_check", str(int(time.time())))
+                    await DB.set_setting(user_id, "proxy_verified", "1")
+                    await DB.set_setting(user_id, "proxy_last_check", str(int(time.time())))
                     
                     await status_message.edit_text(f"✅ Прокси работает! IP успешно изменен.\n\n"
                                                 f"Исходный IP: {original_ip}\n"
@@ -965,7 +1025,7 @@ async def verify_proxy(user_id: int, message_obj) -> None:
                                                 f"Время смены: {elapsed_time:.1f} сек.")
                 else:
                     # Сохраняем информацию о неуспешной проверке
-                    DB.set_setting(user_id, "proxy_verified", "0")
+                    await DB.set_setting(user_id, "proxy_verified", "0")
                     
                     await status_message.edit_text(f"❌ Не удалось сменить IP в течение 1 минуты.\n\n"
                                                 f"Исходный IP: {original_ip}\n\n"
@@ -992,9 +1052,9 @@ async def cb_proxy_verify_now(cq: CallbackQuery):
 @router.callback_query(F.data == "proxy:verify_later")
 async def cb_proxy_verify_later(cq: CallbackQuery):
     # Просто показываем настройки прокси
-    proxy = DB.get_setting(cq.from_user.id, "proxy") or "Не настроено"
-    proxy_change_url = DB.get_setting(cq.from_user.id, "proxy_change_url") or "Не настроено"
-    verified = "Да" if DB.get_setting(cq.from_user.id, "proxy_verified") == "1" else "Нет"
+    proxy = await DB.get_setting(cq.from_user.id, "proxy") or "Не настроено"
+    proxy_change_url = await DB.get_setting(cq.from_user.id, "proxy_change_url") or "Не настроено"
+    verified = "Да" if await DB.get_setting(cq.from_user.id, "proxy_verified") == "1" else "Нет"
     
     proxy_text = (
         "<b>Настройки прокси</b>\n\n"
@@ -1009,14 +1069,14 @@ async def cb_proxy_verify_later(cq: CallbackQuery):
 @router.callback_query(F.data == "proxy:del")
 async def cb_proxy_del(cq: CallbackQuery, state: FSMContext):
     user_id = cq.from_user.id
-    proxy = DB.get_setting(user_id, "proxy") or "Не настроено"
-    proxy_change_url = DB.get_setting(user_id, "proxy_change_url") or "Не настроено"
+    proxy = await DB.get_setting(user_id, "proxy") or "Не настроено"
+    proxy_change_url = await DB.get_setting(user_id, "proxy_change_url") or "Не настроено"
     
     if proxy == "Не настроено" and proxy_change_url == "Не настроено":
         await cq.answer("Прокси не настроены, нечего удалять", show_alert=True)
         return
     
-    rows = DB.list_active_searches(user_id)
+    rows = await DB.list_active_searches(user_id)
     active_searches_text = ""
     
     if rows:
@@ -1049,10 +1109,10 @@ async def cb_proxy_confirm(cq: CallbackQuery, state: FSMContext):
     user_id = cq.from_user.id
     
     if action == "yes":
-        DB.delete_setting(user_id, "proxy")
-        DB.delete_setting(user_id, "cian_proxy")
-        DB.delete_setting(user_id, "proxy_change_url")
-        DB.delete_setting(user_id, "proxy_verified")
+        await DB.delete_setting(user_id, "proxy")
+        await DB.delete_setting(user_id, "cian_proxy")
+        await DB.delete_setting(user_id, "proxy_change_url")
+        await DB.delete_setting(user_id, "proxy_verified")
         
         for job_id, job in ACTIVE.items():
             if job.user_id == user_id:
@@ -1064,9 +1124,9 @@ async def cb_proxy_confirm(cq: CallbackQuery, state: FSMContext):
         
         await cq.message.edit_text(f"Здравствуйте, {cq.from_user.first_name}! На что желаете поохотиться сегодня?", reply_markup=kb_main())
     else:
-        proxy = DB.get_setting(user_id, "proxy") or "Не настроено"
-        proxy_change_url = DB.get_setting(user_id, "proxy_change_url") or "Не настроено"
-        verified = "Да" if DB.get_setting(user_id, "proxy_verified") == "1" else "Нет"
+        proxy = await DB.get_setting(user_id, "proxy") or "Не настроено"
+        proxy_change_url = await DB.get_setting(user_id, "proxy_change_url") or "Не настроено"
+        verified = "Да" if await DB.get_setting(user_id, "proxy_verified") == "1" else "Нет"
         
         proxy_text = (
             "<b>Настройки прокси</b>\n\n"
@@ -1090,7 +1150,7 @@ async def handle_stop_search(message: Message, state: FSMContext):
         await bot.send_message(message.chat.id, f"Здравствуйте, {message.from_user.first_name}! На что желаете поохотиться сегодня?", reply_markup=kb_main())
         return
     
-    rows = DB.list_active_searches(message.from_user.id)
+    rows = await DB.list_active_searches(message.from_user.id)
     search_exists = any(row[0] == search_id for row in rows)
     
     if not search_exists:
@@ -1143,7 +1203,7 @@ async def cb_stop_confirm(cq: CallbackQuery):
             with suppress(Exception):
                 scheduler.remove_job(str(sid))
             
-            DB.deactivate_search(sid)
+            await DB.deactivate_search(sid)
             
             platform_name = job.platform.upper()
             await cq.message.edit_text(f"Поиск {platform_name} #{sid} остановлен.{stats_text}", parse_mode="HTML")
@@ -1158,7 +1218,9 @@ async def cb_stop_confirm(cq: CallbackQuery):
 
 async def run_avito(job: SearchJob):
     s = job.settings
-    parser = AvitoParse(
+    # Парсер создаётся в пуле потоков: конструктор читает БД (фильтр известных объявлений)
+    parser = await asyncio.get_running_loop().run_in_executor(None, partial(
+        AvitoParse,
         url=job.urls,
         count=s["pages"],
         proxy=s["proxy"],
@@ -1173,8 +1235,9 @@ async def run_avito(job: SearchJob):
         tg_token=TOKEN,
         chat_id=job.user_id,
         job_name=f"#{job.sid}" if not job.name else f"#{job.sid}-{job.name}",
-        first_run=job.first_run
-    )
+        first_run=job.first_run,
+        db_handler=DB.db
+    ))
     
     job.parser = parser
     
@@ -1185,10 +1248,24 @@ async def run_avito(job: SearchJob):
         job.total_new_ads += stats.get('total_new_ads', 0)
         job.total_notified_ads += stats.get('total_notified_ads', 0)
         logger.info(f"Поиск #{job.sid}: обновлена статистика. Всего найдено: {job.total_new_ads}, отправлено: {job.total_notified_ads}")
+    
+    job.blocked_until = parser.blocked_until
+    if job.blocked_until:
+        _defer_job(job)
+    elif job.first_run and scheduler.get_job(str(job.sid)):
+        # Отложенное после блокировки первичное сканирование завершилось
+        job.first_run = False
+
+def _defer_job(job: SearchJob) -> None:
+    """Переносит следующий запуск поиска на время снятия блокировки IP, не занимая поток ожиданием."""
+    if scheduler.get_job(str(job.sid)):
+        scheduler.modify_job(str(job.sid), next_run_time=datetime.fromtimestamp(job.blocked_until))
+    logger.warning(f"Поиск #{job.sid} отложен до {datetime.fromtimestamp(job.blocked_until):%H:%M:%S} из-за блокировки IP")
 
 async def run_cian(job: SearchJob):
     s = job.settings
-    parser = CianParse(
+    parser = await asyncio.get_running_loop().run_in_executor(None, partial(
+        CianParse,
         url=job.urls,
         count=s.get("pages", 5),
         proxy=s.get("proxy"),
@@ -1202,8 +1279,9 @@ async def run_cian(job: SearchJob):
         tg_token=TOKEN,
         chat_id=job.user_id,
         job_name=f"#{job.sid}" if not job.name else f"#{job.sid}-{job.name}",
-        first_run=job.first_run
-    )
+        first_run=job.first_run,
+        db_handler=DB.db
+    ))
     
     job.parser = parser
     
@@ -1216,37 +1294,64 @@ async def run_cian(job: SearchJob):
         logger.info(f"Поиск ЦИАН #{job.sid}: обновлена статистика. Всего найдено: {job.total_new_ads}, отправлено: {job.total_notified_ads}")
 
 async def _restore():
-    for row in DB.list_active_searches():
+    """Заново планирует активные поиски из БД от имени их владельцев.
+
+    История сканирований сохранена, поэтому поиски продолжают работу без
+    первичного прохода: уведомления придут только о новых объявлениях.
+    """
+    for row in await DB.list_active_searches():
         sid = row[0]
         urls = row[1].split()
         st = json.loads(row[2])
         
         platform = st.get('platform', 'avito')
         
-        name = row[3] if len(row) > 3 else ""
+        name = row[3] or ""
+        user_id = row[4]
         
         ev = asyncio.Event()
-        ACTIVE[sid] = SearchJob(sid, 0, platform, urls, st, ev, first_run=False, name=name)
+        ACTIVE[sid] = SearchJob(sid, user_id, platform, urls, st, ev, first_run=False, name=name)
         
         if platform == "cian":
             scheduler.add_job(run_cian, "interval", seconds=st.get("pause", 300), args=[ACTIVE[sid]], id=str(sid))
         else:
             scheduler.add_job(run_avito, "interval", seconds=st.get("pause", 120), args=[ACTIVE[sid]], id=str(sid))
 
+async def run_compaction():
+    try:
+        report = await DB.compact()
+        logger.info(f"Компактизация БД: удалено {report['deleted']}, освобождено {report['reclaimed_bytes'] // 1024} КБ")
+        # Удалённые ID остались бы в фильтрах ложными совпадениями
+        await asyncio.get_running_loop().run_in_executor(None, rebuild_seen_filters)
+    except Exception as e:
+        logger.error(f"Ошибка при компактизации БД: {e}")
+
+async def run_seen_filter_snapshot():
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, save_seen_filters)
+    except Exception as e:
+        logger.error(f"Ошибка при сохранении снимков фильтров: {e}")
+
 async def main():
-    DB.clean_scan_history()
-    DB.clean_cian_scan_history()
-    DB.clean_cian_viewed()
-    DB.clean_active_searches()
-    
-    success = DB.reset_search_counter()
-    if success:
-        logger.info("Счетчик поисков успешно сброшен до 1")
+    if WARM_RESTART:
+        await _restore()
+        logger.info(f"Тёплый перезапуск: восстановлено активных поисков: {len(ACTIVE)}")
     else:
-        logger.warning("Не удалось сбросить счетчик поисков")
+        await DB.clean_scan_history()
+        await DB.clean_cian_scan_history()
+        await DB.clean_cian_viewed()
+        await DB.clean_active_searches()
     
+    # Фильтры известных объявлений грузятся до первых задач и не блокируя цикл событий
+    await asyncio.get_running_loop().run_in_executor(None, warm_seen_filters, DB.db)
+    
+    scheduler.add_job(run_compaction, "interval", hours=COMPACT_INTERVAL_HOURS, id="db_compaction")
+    scheduler.add_job(run_seen_filter_snapshot, "interval", minutes=SEEN_FILTER_SNAPSHOT_MINUTES, id="seen_filter_snapshot")
     scheduler.start()
-    await dp.start_polling(bot)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        DB.shutdown()
 
 if __name__ == "__main__":
     asyncio.run(main())
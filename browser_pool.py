@@ -0,0 +1,185 @@
+import atexit
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from threading import Lock
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+from loguru import logger
+from seleniumbase import SB
+
+# Сколько страниц открывает один браузер, прежде чем его перезапустить
+BROWSER_MAX_PAGES = 150
+# Сколько секунд простаивающий браузер ждёт следующего сканирования
+BROWSER_MAX_IDLE = 600
+# Сколько простаивающих браузеров держать одновременно
+BROWSER_POOL_SIZE = 4
+
+# Профили блокировки ресурсов: шаблоны URL для CDP Network.setBlockedURLs.
+# Парсеры читают только текст DOM и атрибуты src, поэтому картинки, шрифты,
+# видео, счётчики и реклама не скачиваются; теги img с адресами остаются в DOM
+RESOURCE_BLOCK_PROFILES: Dict[str, Tuple[str, ...]] = {
+    "off": (),
+    "lean": (
+        # Изображения, в том числе CDN Авито без расширения в адресе
+        "*.jpg", "*.jpeg", "*.png", "*.gif", "*.webp", "*.avif", "*.ico",
+        "*img.avito.st/*",
+        # Шрифты и медиа
+        "*.woff", "*.woff2", "*.ttf", "*.otf", "*.mp4", "*.webm",
+        # Аналитика и рекламные фреймы
+        "*mc.yandex.ru/*", "*an.yandex.ru/*", "*yandex.ru/ads/*", "*ads.adfox.ru/*",
+        "*google-analytics.com/*", "*googletagmanager.com/*", "*doubleclick.net/*",
+        "*top-fwz1.mail.ru/*", "*sentry.io/*",
+    ),
+}
+
+
+@dataclass(slots=True)
+class PooledBrowser:
+    """Запущенный браузер SeleniumBase из пула."""
+    key: Tuple
+    agent: str
+    context: Any
+    sb: Any
+    pages: int = 0
+    created_at: float = field(default_factory=time.monotonic)
+    last_used: float = field(default_factory=time.monotonic)
+    # Браузер больше не выдаётся: упал, исчерпал лимит страниц или попал под блокировку
+    retired: bool = False
+
+    def count_page(self) -> None:
+        self.pages += 1
+
+    def is_alive(self) -> bool:
+        try:
+            return self.sb.execute_script("return 1") == 1
+        except Exception:
+            return False
+
+    def close(self) -> None:
+        try:
+            self.context.__exit__(None, None, None)
+        except Exception as e:
+            logger.debug(f"Ошибка при закрытии браузера: {e}")
+
+
+class BrowserPool:
+    """Пул долгоживущих браузеров Chrome, разделённых по прокси и режиму запуска.
+
+    Вместо запуска Chrome на каждый URL парсер берёт из пула тёплый браузер
+    с тем же ключом (прокси, режим отображения, sjw, профиль блокировки
+    ресурсов), проверяет, что он отвечает, и возвращает после сканирования.
+    User-Agent выбирается при запуске и остаётся за браузером до его
+    перезапуска. Браузер закрывается после max_pages страниц, если перестал
+    отвечать, при блокировке или после max_idle секунд простоя.
+    """
+
+    def __init__(
+        self,
+        max_pages: int = BROWSER_MAX_PAGES,
+        max_idle: float = BROWSER_MAX_IDLE,
+        max_size: int = BROWSER_POOL_SIZE,
+    ) -> None:
+        self.max_pages = max_pages
+        self.max_idle = max_idle
+        self.max_size = max_size
+        self._idle: List[PooledBrowser] = []
+        self._lock = Lock()
+
+    @staticmethod
+    def _block_resources(sb: Any, blocked_urls: Tuple[str, ...]) -> None:
+        """Включает блокировку запросов по шаблонам URL через CDP."""
+        if not blocked_urls:
+            return
+        try:
+            sb.driver.execute_cdp_cmd("Network.enable", {})
+            sb.driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": list(blocked_urls)})
+        except Exception as e:
+            logger.warning(f"Не удалось включить блокировку ресурсов через CDP: {e}")
+
+    @classmethod
+    def _launch(cls, key: Tuple, agent: str) -> PooledBrowser:
+        start = time.perf_counter()
+        options = dict(key)
+        blocked_urls = options.pop("blocked_urls", ())
+        context = SB(agent=agent, **options)
+        sb = context.__enter__()
+        cls._block_resources(sb, blocked_urls)
+        logger.info(f"Запущен браузер для пула за {time.perf_counter() - start:.1f} с")
+        return PooledBrowser(key=key, agent=agent, context=context, sb=sb)
+
+    def _take_idle(self, key: Tuple) -> PooledBrowser | None:
+        with self._lock:
+            for i in range(len(self._idle) - 1, -1, -1):
+                if self._idle[i].key == key:
+                    return self._idle.pop(i)
+        return None
+
+    def _expire_idle(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            expired = [b for b in self._idle if now - b.last_used > self.max_idle]
+            self._idle = [b for b in self._idle if b not in expired]
+        for browser in expired:
+            browser.close()
+
+    def checkout(self, agent: Callable[[], str], **options: Any) -> PooledBrowser:
+        """Выдаёт отвечающий браузер с такими же параметрами SB или запускает новый.
+
+        blocked_urls (кортеж шаблонов, см. RESOURCE_BLOCK_PROFILES) входит
+        в ключ пула, но передаётся не в SB, а в CDP после запуска.
+        """
+        self._expire_idle()
+        key = tuple(sorted(options.items()))
+        while (browser := self._take_idle(key)) is not None:
+            if browser.is_alive():
+                return browser
+            logger.warning("Браузер из пула не отвечает, закрываю")
+            browser.close()
+        return self._launch(key, agent())
+
+    def checkin(self, browser: PooledBrowser) -> None:
+        """Возвращает браузер в пул или закрывает его, если он отработал своё."""
+        browser.last_used = time.monotonic()
+        if browser.retired or browser.pages >= self.max_pages or not browser.is_alive():
+            logger.info(f"Браузер закрыт после {browser.pages} страниц")
+            browser.close()
+            return
+
+        with self._lock:
+            self._idle.append(browser)
+            # Лишние браузеры закрываются, начиная с дольше всех простаивающих
+            self._idle.sort(key=lambda b: b.last_used)
+            excess = self._idle[:max(0, len(self._idle) - self.max_size)]
+            del self._idle[:len(excess)]
+        for extra in excess:
+            extra.close()
+
+    @contextmanager
+    def browser(self, agent: Callable[[], str], **options: Any) -> Iterator[PooledBrowser]:
+        """Берёт браузер из пула на время блока with и возвращает его после."""
+        browser = self.checkout(agent, **options)
+        try:
+            yield browser
+        finally:
+            self.checkin(browser)
+
+    def close_all(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for browser in idle:
+            browser.close()
+
+
+_pool: BrowserPool | None = None
+_pool_lock = Lock()
+
+
+def get_browser_pool() -> BrowserPool:
+    """Возвращает общий для процесса пул браузеров."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = BrowserPool()
+            atexit.register(_pool.close_all)
+        return _pool
@@ -1,3 +1,13 @@
+from datetime import datetime
+
 
 class StopEventException(Exception):
     pass
+
+
+class IPBlockedException(Exception):
+    """Площадка заблокировала IP: сканирование прервано до blocked_until (unix-время)."""
+
+    def __init__(self, blocked_until: float) -> None:
+        super().__init__(f"IP заблокирован до {datetime.fromtimestamp(blocked_until):%H:%M:%S}")
+        self.blocked_until = blocked_until
@@ -1,12 +1,286 @@
+import atexit
 import json
+import logging
+import queue
+import re
 import sqlite3
 import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager, suppress
 from pathlib import Path
 from threading import Lock
-from typing import Any, Dict, List, Tuple, Optional
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Set, Tuple, Optional
 
 DB_FILE = Path(__file__).parent / "database.db"
 
+# Сколько ждать освобождения блокировки записи, прежде чем получить "database is locked"
+DB_BUSY_TIMEOUT = 30
+
+# Максимум пар (id, price) в одном запросе проверки: 2 параметра на пару,
+# с запасом до лимита SQLITE_MAX_VARIABLE_NUMBER
+DB_BATCH_SIZE = 400
+
+# Групповой commit: поток-писатель копит операции не дольше DB_WRITE_BATCH_MS
+# и не больше DB_WRITE_BATCH_SIZE штук, затем коммитит их одной транзакцией
+DB_WRITE_BATCH_MS = 50
+DB_WRITE_BATCH_SIZE = 500
+
+# Срок хранения записей по таблицам, в днях: объявления, которые не встречались
+# дольше этого срока, удаляются фоновой компактизацией. 0 - хранить бессрочно
+DB_RETENTION_DAYS: Dict[str, int] = {
+    "viewed": 30,
+    "cian_viewed": 30,
+    "scan_ads": 30,
+    "cian_scan_ads": 30,
+    "price_history": 90,
+    "ads": 90,
+}
+
+# Для каждой таблицы с ограниченным сроком хранения: столбец времени и первичный ключ
+DB_RETENTION_COLUMNS: Dict[str, Tuple[str, Tuple[str, ...]]] = {
+    "viewed": ("timestamp", ("id", "price")),
+    "cian_viewed": ("timestamp", ("id", "price")),
+    "scan_ads": ("last_seen", ("url", "ad_id")),
+    "cian_scan_ads": ("last_seen", ("url", "ad_id")),
+    "price_history": ("observed_at", ("platform", "ad_id", "observed_at")),
+    "ads": ("last_seen", ("id",)),
+}
+
+# Отправленные объявления хранятся, пока объявление встречается в листингах:
+# срок отсчитывается от last_seen в истории сканирований, а не от отправки
+DB_RETENTION_SEEN_IN: Dict[str, str] = {
+    "viewed": "scan_ads",
+    "cian_viewed": "cian_scan_ads",
+}
+
+# Таблицы каждой площадки: история сканирований и отправленные объявления
+PLATFORM_TABLES: Dict[str, Tuple[str, str]] = {
+    "avito": ("scan_ads", "viewed"),
+    "cian": ("cian_scan_ads", "cian_viewed"),
+}
+
+# Сколько объявлений возвращает полнотекстовый поиск по умолчанию
+FULLTEXT_SEARCH_LIMIT = 20
+# Слово для полнотекстового поиска: буквы и цифры, как у токенизатора unicode61
+FULLTEXT_TERM_RE = re.compile(r"[^\W_]+")
+
+# Сколько строк читать из курсора за раз при потоковой выгрузке
+DB_EXPORT_BATCH_SIZE = 1000
+
+# Столбцы выгружаемых объявлений (iter_ads)
+AD_EXPORT_COLUMNS = ("platform", "ad_id", "title", "description", "url", "price", "first_seen", "last_seen")
+
+# Сколько пользователей держать в кэше настроек (LRU)
+SETTINGS_CACHE_SIZE = 1024
+
+# Типы настроек: значения хранятся в БД строками, в кэше - уже разобранными.
+# Ключи площадок, кроме Авито, хранятся с префиксом "<площадка>_"
+SETTING_TYPES: Dict[str, type] = {
+    "min_price": int,
+    "max_price": int,
+    "pages": int,
+    "pause": int,
+    "new_only": bool,
+    "keywords": list,
+    "blacklist": list,
+}
+
+# Сколько строк удалять одной операцией при компактизации, чтобы не держать
+# блокировку записи долго, и сколько страниц освобождать за шаг incremental_vacuum
+DB_COMPACT_CHUNK_SIZE = 5000
+DB_VACUUM_PAGES = 2000
+
+# Настройки соединения: WAL позволяет читать параллельно с записью,
+# synchronous=NORMAL в режиме WAL не делает fsync на каждый commit
+DB_PRAGMAS: Tuple[Tuple[str, Any], ...] = (
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),
+    ("cache_size", -16000),        # ~16 МБ страничного кэша на соединение
+    ("mmap_size", 268435456),      # 256 МБ memory-mapped I/O
+    ("temp_store", "MEMORY"),
+)
+
+WriteOp = Callable[[sqlite3.Connection], Any]
+
+
+def fulltext_terms(query: str) -> List[str]:
+    """Разбивает запрос поиска на слова так же, как FTS5 разбивает текст объявлений."""
+    return FULLTEXT_TERM_RE.findall(query)
+
+
+def parse_setting(key: str, value: str) -> Any:
+    """Приводит строковое значение настройки к её типу; неизвестные ключи остаются строками."""
+    for platform in PLATFORM_TABLES:
+        if key.startswith(f"{platform}_") and key[len(platform) + 1:] in SETTING_TYPES:
+            key = key[len(platform) + 1:]
+            break
+
+    setting_type = SETTING_TYPES.get(key)
+    try:
+        if setting_type is int:
+            return int(value)
+        if setting_type is bool:
+            return bool(int(value))
+        if setting_type is list:
+            return [w.strip() for w in value.split(";") if w.strip()]
+    except (ValueError, TypeError):
+        pass
+    return value
+
+
+class SettingsCache:
+    """LRU-кэш настроек пользователей: сырые строки и разобранные значения.
+
+    Каждая запись настроек увеличивает поколение пользователя. Прочитанное
+    из БД кладётся в кэш, только если поколение за время чтения не менялось,
+    поэтому чтение, начатое до commit записи, не вернёт в кэш старые значения.
+    """
+
+    def __init__(self, max_users: int = SETTINGS_CACHE_SIZE) -> None:
+        self.max_users = max_users
+        self._entries: "OrderedDict[int, Tuple[Dict[str, str], Dict[str, Any]]]" = OrderedDict()
+        self._generations: Dict[int, int] = {}
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: int) -> Optional[Tuple[Dict[str, str], Dict[str, Any]]]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry
+
+    def generation(self, user_id: int) -> int:
+        with self._lock:
+            return self._generations.get(user_id, 0)
+
+    def put(self, user_id: int, generation: int, raw: Dict[str, str]) -> Tuple[Dict[str, str], Dict[str, Any]]:
+        entry = (raw, {key: parse_setting(key, value) for key, value in raw.items()})
+        with self._lock:
+            if self._generations.get(user_id, 0) == generation:
+                self._entries[user_id] = entry
+                self._entries.move_to_end(user_id)
+                while len(self._entries) > self.max_users:
+                    self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._entries.pop(user_id, None)
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+
+_STOP = object()
+
+
+class WriteBehindQueue:
+    """Единственный поток-писатель с групповым commit.
+
+    Операции записи из любых потоков ставятся в очередь и применяются пачками:
+    одна транзакция на пачку вместо commit на каждую операцию. Каждая операция
+    выполняется внутри SAVEPOINT, поэтому ошибка в одной не откатывает остальные.
+    """
+
+    def __init__(
+        self,
+        connect: Callable[[], sqlite3.Connection],
+        batch_ms: int = DB_WRITE_BATCH_MS,
+        batch_size: int = DB_WRITE_BATCH_SIZE,
+    ) -> None:
+        self._connect = connect
+        self.batch_interval = batch_ms / 1000
+        self.batch_size = batch_size
+        self._queue: "queue.Queue[Tuple[Any, Future]]" = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, op: WriteOp) -> Future:
+        """Ставит операцию в очередь, Future завершится после commit её пачки."""
+        if self._closed:
+            raise RuntimeError("Очередь записи в БД остановлена")
+        future: Future = Future()
+        self._queue.put((op, future))
+        return future
+
+    def flush(self, timeout: float | None = None) -> None:
+        """Барьер: ждёт, пока все ранее поставленные операции будут закоммичены."""
+        if self._closed:
+            return
+        future: Future = Future()
+        self._queue.put((None, future))
+        future.result(timeout)
+
+    def close(self) -> None:
+        """Коммитит всё, что осталось в очереди, и останавливает поток-писатель."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put((_STOP, Future()))
+        self._thread.join()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.batch_interval
+            # Барьер и остановка закрывают пачку сразу, не дожидаясь таймаута
+            while batch[-1][0] is not None and batch[-1][0] is not _STOP and len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            self._commit([item for item in batch if item[0] is not _STOP])
+            if batch[-1][0] is _STOP:
+                return
+
+    def _commit(self, batch: List[Tuple[Any, Future]]) -> None:
+        if not batch:
+            return
+        conn = self._connect()
+        results: List[Tuple[Future, Any, Exception | None]] = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for op, future in batch:
+                if op is None:
+                    results.append((future, None, None))
+                    continue
+                conn.execute("SAVEPOINT write_op")
+                try:
+                    result = op(conn)
+                except Exception as e:
+                    conn.execute("ROLLBACK TO write_op")
+                    conn.execute("RELEASE write_op")
+                    logging.error(f"Ошибка при записи в БД: {e}")
+                    results.append((future, None, e))
+                else:
+                    conn.execute("RELEASE write_op")
+                    results.append((future, result, None))
+            conn.execute("COMMIT")
+        except Exception as e:
+            with suppress(Exception):
+                conn.execute("ROLLBACK")
+            logging.error(f"Ошибка при групповом commit ({len(batch)} операций): {e}")
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
 
 class SQLiteDBHandler:
     _instance = None
@@ -18,23 +292,139 @@ class SQLiteDBHandler:
                 cls._instance = super().__new__(cls)
         return cls._instance
 
-    def __init__(self, db_path: Path | str = DB_FILE) -> None:
+    def __init__(self, db_path: Path | str = DB_FILE, write_behind: bool = True) -> None:
         if getattr(self, "_initialized", False):
             return
         self.db_path = str(db_path)
+        self._local = threading.local()
+        self._settings_cache = SettingsCache()
         self._create_tables()
+        self._create_fulltext_index()
         self._migrate_database()
+        self._writer: WriteBehindQueue | None = None
+        if write_behind:
+            self._writer = WriteBehindQueue(self._connect)
+            atexit.register(self.shutdown)
         self._initialized = True
 
+    def _connect(self) -> sqlite3.Connection:
+        """Возвращает соединение текущего потока, открывая его при первом обращении.
+
+        Соединение работает в режиме autocommit (isolation_level=None),
+        транзакции открываются явно через transaction().
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=DB_BUSY_TIMEOUT, isolation_level=None)
+            for pragma, value in DB_PRAGMAS:
+                conn.execute(f"PRAGMA {pragma}={value}")
+            self._local.conn = conn
+            self._local.tx_depth = 0
+        return conn
+
+    def _reader(self) -> sqlite3.Connection:
+        """Соединение для чтения с гарантией read-your-writes для текущего потока.
+
+        Если поток ставил записи в очередь без ожидания, сначала дожидается
+        их commit: парсер сразу видит то, что сам записал. Записи других
+        потоков видны после их commit (см. flush()).
+        """
+        if getattr(self._local, "pending_writes", False):
+            self.flush()
+        return self._connect()
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Группирует несколько операций записи в одну транзакцию.
+
+        Вложенные вызовы присоединяются к внешней транзакции, commit выполняется
+        один раз при выходе из самого внешнего блока.
+        """
+        conn = self._connect()
+        if not self._local.tx_depth and getattr(self._local, "pending_writes", False):
+            # Записи потока из очереди должны лечь раньше этой транзакции
+            self.flush()
+        if self._local.tx_depth:
+            self._local.tx_depth += 1
+            try:
+                yield conn
+            finally:
+                self._local.tx_depth -= 1
+            return
+
+        conn.execute("BEGIN IMMEDIATE")
+        self._local.tx_depth = 1
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
+        finally:
+            self._local.tx_depth = 0
+
+    def _write(self, op: WriteOp, wait: bool = False, on_commit: Callable[[], None] | None = None) -> Any:
+        """Выполняет операцию записи.
+
+        Внутри transaction() операция выполняется сразу в транзакции вызывающего
+        потока, иначе уходит в очередь группового commit. При wait=True
+        дожидается commit и возвращает результат операции. on_commit
+        вызывается после того, как запись стала видна другим соединениям.
+
+        Без wait запись отложенная: следующее чтение этого же потока
+        дождётся её (см. _reader()), другие потоки увидят её после commit
+        пачки или flush(). Поэтому записи, которые сразу читают другие
+        потоки (настройки, поиски), выполняются с wait=True.
+        """
+        if self._writer is None or getattr(self._local, "tx_depth", 0):
+            with self.transaction() as conn:
+                result = op(conn)
+            if on_commit is not None:
+                on_commit()
+            return result
+
+        future = self._writer.submit(op)
+        if on_commit is not None:
+            future.add_done_callback(lambda _: on_commit())
+        if wait:
+            return future.result()
+        self._local.pending_writes = True
+        return None
+
+    def flush(self, timeout: float | None = None) -> None:
+        """Дожидается commit всех поставленных в очередь записей."""
+        if self._writer is not None:
+            self._writer.flush(timeout)
+        self._local.pending_writes = False
+
+    def shutdown(self) -> None:
+        """Коммитит очередь записи и останавливает поток-писатель."""
+        if self._writer is not None:
+            self._writer.close()
+            # Дальнейшие записи выполняются синхронно в транзакции вызывающего потока
+            self._writer = None
+
+    def close(self) -> None:
+        """Закрывает соединение текущего потока."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
     def _create_tables(self) -> None:
-        with sqlite3.connect(self.db_path) as conn:
+        # auto_vacuum задаётся до создания первой таблицы; для старых баз
+        # включается при первой компактизации через разовый VACUUM
+        self._connect().execute("PRAGMA auto_vacuum=INCREMENTAL")
+        with self.transaction() as conn:
             c = conn.cursor()
             # Основные таблицы Авито
             c.execute(
                 """
                 CREATE TABLE IF NOT EXISTS viewed (
-                    id    INTEGER,
-                    price INTEGER,
+                    id        INTEGER,
+                    price     INTEGER,
+                    timestamp INTEGER DEFAULT (strftime('%s', 'now')),
                     PRIMARY KEY (id, price)
                 )
                 """
@@ -62,16 +452,21 @@ class SQLiteDBHandler:
                 )
                 """
             )
+            c.execute("CREATE INDEX IF NOT EXISTS idx_searches_active ON searches(active, user_id, platform)")
+            # Номера остановленных поисков, которые можно выдать заново
+            c.execute("CREATE TABLE IF NOT EXISTS search_free_ids (id INTEGER PRIMARY KEY)")
             c.execute(
                 """
-                CREATE TABLE IF NOT EXISTS scan_history (
-                    url       TEXT,
-                    ad_ids    TEXT,
-                    timestamp INTEGER DEFAULT (strftime('%s', 'now')),
-                    PRIMARY KEY (url)
-                )
+                CREATE TABLE IF NOT EXISTS scan_ads (
+                    url        TEXT,
+                    ad_id      TEXT,
+                    first_seen INTEGER DEFAULT (strftime('%s', 'now')),
+                    last_seen  INTEGER DEFAULT (strftime('%s', 'now')),
+                    PRIMARY KEY (url, ad_id)
+                ) WITHOUT ROWID
                 """
             )
+            c.execute("CREATE INDEX IF NOT EXISTS idx_scan_ads_ad_id ON scan_ads(ad_id)")
             
             # Таблицы для ЦИАН
             c.execute(
@@ -88,200 +483,631 @@ class SQLiteDBHandler:
             )
             c.execute(
                 """
-                CREATE TABLE IF NOT EXISTS cian_scan_history (
-                    url       TEXT,
-                    ad_ids    TEXT,
-                    timestamp INTEGER DEFAULT (strftime('%s', 'now')),
-                    PRIMARY KEY (url)
+                CREATE TABLE IF NOT EXISTS cian_scan_ads (
+                    url        TEXT,
+                    ad_id      TEXT,
+                    first_seen INTEGER DEFAULT (strftime('%s', 'now')),
+                    last_seen  INTEGER DEFAULT (strftime('%s', 'now')),
+                    PRIMARY KEY (url, ad_id)
+                ) WITHOUT ROWID
+                """
+            )
+            c.execute("CREATE INDEX IF NOT EXISTS idx_cian_scan_ads_ad_id ON cian_scan_ads(ad_id)")
+
+            # История цен обеих площадок: строка на каждое изменение цены.
+            # Первичный ключ кластерный (WITHOUT ROWID) и сам служит покрывающим
+            # индексом для поиска последней цены объявления
+            c.execute(
+                """
+                CREATE TABLE IF NOT EXISTS price_history (
+                    platform    TEXT,
+                    ad_id       TEXT,
+                    price       INTEGER,
+                    observed_at INTEGER,
+                    PRIMARY KEY (platform, ad_id, observed_at)
+                ) WITHOUT ROWID
+                """
+            )
+            c.execute("CREATE INDEX IF NOT EXISTS idx_price_history_observed_at ON price_history(observed_at)")
+
+            # Тексты объявлений обеих площадок для полнотекстового поиска (ads_fts)
+            c.execute(
+                """
+                CREATE TABLE IF NOT EXISTS ads (
+                    id          INTEGER PRIMARY KEY,
+                    platform    TEXT,
+                    ad_id       TEXT,
+                    title       TEXT,
+                    description TEXT,
+                    url         TEXT,
+                    price       INTEGER,
+                    first_seen  INTEGER DEFAULT (strftime('%s', 'now')),
+                    last_seen   INTEGER DEFAULT (strftime('%s', 'now')),
+                    UNIQUE (platform, ad_id)
                 )
                 """
             )
-            conn.commit()
+            c.execute("CREATE INDEX IF NOT EXISTS idx_ads_last_seen ON ads(last_seen)")
+
+    def _create_fulltext_index(self) -> None:
+        """Создаёт FTS5-индекс по таблице ads и триггеры, поддерживающие его.
+
+        Индекс external content: тексты хранятся только в ads, а триггеры
+        обновляют его лишь при изменении заголовка или описания. Если SQLite
+        собран без FTS5, поиск отключается, остальная работа не страдает.
+        """
+        try:
+            with self.transaction() as conn:
+                conn.execute(
+                    """
+                    CREATE VIRTUAL TABLE IF NOT EXISTS ads_fts USING fts5(
+                        title, description,
+                        content='ads', content_rowid='id',
+                        tokenize='unicode61 remove_diacritics 2'
+                    )
+                    """
+                )
+                conn.execute(
+                    """
+                    CREATE TRIGGER IF NOT EXISTS ads_fts_insert AFTER INSERT ON ads BEGIN
+                        INSERT INTO ads_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+                    END
+                    """
+                )
+                conn.execute(
+                    """
+                    CREATE TRIGGER IF NOT EXISTS ads_fts_delete AFTER DELETE ON ads BEGIN
+                        INSERT INTO ads_fts(ads_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+                    END
+                    """
+                )
+                conn.execute(
+                    """
+                    CREATE TRIGGER IF NOT EXISTS ads_fts_update AFTER UPDATE OF title, description ON ads
+                    WHEN old.title IS NOT new.title OR old.description IS NOT new.description BEGIN
+                        INSERT INTO ads_fts(ads_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+                        INSERT INTO ads_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+                    END
+                    """
+                )
+            self.fulltext_enabled = True
+        except sqlite3.OperationalError as e:
+            logging.warning(f"Полнотекстовый поиск недоступен: {e}")
+            self.fulltext_enabled = False
     
     def _migrate_database(self) -> None:
-        """Выполняет миграцию базы данных, добавляя новые столбцы при необходимости."""
-        with sqlite3.connect(self.db_path) as conn:
-            c = conn.cursor()
-            
-            c.execute("PRAGMA table_info(searches)")
-            columns = [column[1] for column in c.fetchall()]
-            
-            if "name" not in columns:
-                c.execute("ALTER TABLE searches ADD COLUMN name TEXT")
-                conn.commit()
-            
-            c.execute("SELECT id, settings_json FROM searches WHERE active=1")
-            rows = c.fetchall()
-            for row in rows:
-                search_id, settings_json = row
-                if settings_json:
-                    try:
-                        settings = json.loads(settings_json)
-                        if "platform" not in settings:
-                            settings["platform"] = "avito"
-                            c.execute(
-                                "UPDATE searches SET settings_json=? WHERE id=?",
-                                (json.dumps(settings, ensure_ascii=False), search_id)
-                            )
-                    except (json.JSONDecodeError, TypeError):
-                        pass
-            conn.commit()
+        """Применяет миграции схемы, которые ещё не выполнялись на этой базе.
+
+        Номер последней применённой миграции хранится в PRAGMA user_version,
+        поэтому на уже обновлённой базе запуск стоит одного запроса.
+        """
+        migrations = [
+            self._migrate_legacy_schema,
+            self._migrate_search_free_ids,
+            self._migrate_fulltext_seed,
+            self._migrate_scan_ad_index,
+            self._migrate_database_uuid,
+        ]
+        version = self._connect().execute("PRAGMA user_version").fetchone()[0]
+        for number, migration in enumerate(migrations[version:], start=version + 1):
+            with self.transaction() as conn:
+                migration(conn)
+                # user_version меняется в той же транзакции, что и сама миграция
+                conn.execute(f"PRAGMA user_version = {number}")
+
+    def _migrate_legacy_schema(self, conn: sqlite3.Connection) -> None:
+        """Миграция 1: столбцы, индексы и данные, которые раньше проверялись при каждом запуске."""
+        c = conn.cursor()
+
+        c.execute("PRAGMA table_info(searches)")
+        columns = [column[1] for column in c.fetchall()]
+        
+        if "name" not in columns:
+            c.execute("ALTER TABLE searches ADD COLUMN name TEXT")
+        
+        c.execute("PRAGMA table_info(viewed)")
+        if "timestamp" not in [column[1] for column in c.fetchall()]:
+            # ALTER TABLE не допускает DEFAULT-выражение, поэтому время
+            # проставляется явно: старым записям - момент миграции
+            c.execute("ALTER TABLE viewed ADD COLUMN timestamp INTEGER")
+            c.execute("UPDATE viewed SET timestamp = strftime('%s', 'now')")
+        
+        for table, (time_column, _) in DB_RETENTION_COLUMNS.items():
+            c.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{time_column} ON {table}({time_column})")
+        
+        c.execute("SELECT id, settings_json FROM searches WHERE active=1")
+        rows = c.fetchall()
+        for row in rows:
+            search_id, settings_json = row
+            if settings_json:
+                try:
+                    settings = json.loads(settings_json)
+                    if "platform" not in settings:
+                        settings["platform"] = "avito"
+                        c.execute(
+                            "UPDATE searches SET settings_json=? WHERE id=?",
+                            (json.dumps(settings, ensure_ascii=False), search_id)
+                        )
+                except (json.JSONDecodeError, TypeError):
+                    pass
+
+        self._migrate_scan_history(conn, "scan_history", "scan_ads")
+        self._migrate_scan_history(conn, "cian_scan_history", "cian_scan_ads")
+
+    @staticmethod
+    def _migrate_search_free_ids(conn: sqlite3.Connection) -> None:
+        """Миграция 2: заносит в список свободных номера остановленных поисков и пропуски."""
+        conn.execute("INSERT OR IGNORE INTO search_free_ids(id) SELECT id FROM searches WHERE active=0")
+        conn.execute(
+            """
+            WITH RECURSIVE seq(id) AS (
+                SELECT 1 UNION ALL SELECT id + 1 FROM seq WHERE id < (SELECT MAX(id) FROM searches)
+            )
+            INSERT OR IGNORE INTO search_free_ids(id)
+            SELECT id FROM seq WHERE id NOT IN (SELECT id FROM searches)
+            """
+        )
+
+    @staticmethod
+    def _migrate_fulltext_seed(conn: sqlite3.Connection) -> None:
+        """Миграция 3: заносит в полнотекстовый индекс уже отправленные объявления ЦИАН."""
+        conn.execute(
+            """
+            INSERT OR IGNORE INTO ads(platform, ad_id, title, url, price, first_seen, last_seen)
+            SELECT 'cian', id, title, url, price, timestamp, timestamp FROM cian_viewed
+            """
+        )
+
+    @staticmethod
+    def _migrate_scan_ad_index(conn: sqlite3.Connection) -> None:
+        """Миграция 4: индексы истории по ID объявления для срока хранения отправленных."""
+        for table in DB_RETENTION_SEEN_IN.values():
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_ad_id ON {table}(ad_id, last_seen)")
+
+    @staticmethod
+    def _migrate_database_uuid(conn: sqlite3.Connection) -> None:
+        """Миграция 5: постоянный UUID базы, по которому снимки фильтров узнают свою базу."""
+        conn.execute("CREATE TABLE IF NOT EXISTS db_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        conn.execute("INSERT OR IGNORE INTO db_meta(key, value) VALUES ('uuid', ?)", (uuid.uuid4().hex,))
+
+    def database_identity(self) -> str:
+        """Путь, UUID и версия схемы базы.
+
+        Снимки, построенные по другой базе (копии файла, пересозданной или
+        обновлённой миграцией базы), по этой строке отбраковываются.
+        """
+        conn = self._reader()
+        (db_uuid,) = conn.execute("SELECT value FROM db_meta WHERE key='uuid'").fetchone()
+        (version,) = conn.execute("PRAGMA user_version").fetchone()
+        return f"{Path(self.db_path).resolve()}|{db_uuid}|{version}"
+
+    @staticmethod
+    def _migrate_scan_history(conn: sqlite3.Connection, legacy_table: str, table: str) -> None:
+        """Переносит JSON-списки ID из старой таблицы истории в построчную и удаляет старую."""
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (legacy_table,)
+        ).fetchone()
+        if not exists:
+            return
+
+        for url, ad_ids, timestamp in conn.execute(f"SELECT url, ad_ids, timestamp FROM {legacy_table}").fetchall():
+            try:
+                ids = json.loads(ad_ids) if ad_ids else []
+            except (json.JSONDecodeError, TypeError):
+                continue
+            conn.executemany(
+                f"INSERT OR IGNORE INTO {table}(url, ad_id, first_seen, last_seen) VALUES (?, ?, ?, ?)",
+                ((url, str(ad_id), timestamp, timestamp) for ad_id in ids),
+            )
+        conn.execute(f"DROP TABLE {legacy_table}")
 
     def add_record(self, record_id: int, price: int) -> None:
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute("INSERT OR IGNORE INTO viewed(id, price) VALUES (?, ?)", (record_id, price))
-            conn.commit()
+        self._write(lambda conn: conn.execute(
+            "INSERT OR IGNORE INTO viewed(id, price, timestamp) VALUES (?, ?, strftime('%s', 'now'))",
+            (record_id, price),
+        ))
 
     def record_exists(self, record_id: int, price: int) -> bool:
-        with sqlite3.connect(self.db_path) as conn:
-            cur = conn.execute("SELECT 1 FROM viewed WHERE id=? AND price=?", (record_id, price))
-            return cur.fetchone() is not None
+        cur = self._reader().execute("SELECT 1 FROM viewed WHERE id=? AND price=?", (record_id, price))
+        return cur.fetchone() is not None
+
+    def _existing_pairs(self, table: str, pairs: Iterable[Tuple[Any, int]]) -> Set[Tuple[Any, int]]:
+        """Возвращает подмножество пар (id, price), которые уже есть в таблице.
+
+        Пары проверяются пачками по DB_BATCH_SIZE одним запросом с VALUES-списком.
+        """
+        pairs = list(dict.fromkeys(pairs))
+        found: Set[Tuple[Any, int]] = set()
+        conn = self._reader()
+        for i in range(0, len(pairs), DB_BATCH_SIZE):
+            chunk = pairs[i:i + DB_BATCH_SIZE]
+            values = ", ".join(["(?, ?)"] * len(chunk))
+            params = [value for pair in chunk for value in pair]
+            cur = conn.execute(
+                f"WITH page(id, price) AS (VALUES {values}) "
+                f"SELECT t.id, t.price FROM {table} t JOIN page p ON t.id = p.id AND t.price = p.price",
+                params,
+            )
+            found.update(cur.fetchall())
+        return found
+
+    def add_records(self, rows: Iterable[Tuple[int, int]]) -> None:
+        """Добавляет пачку пар (id, price) одной операцией executemany"""
+        rows = list(rows)
+        self._write(lambda conn: conn.executemany(
+            "INSERT OR IGNORE INTO viewed(id, price, timestamp) VALUES (?, ?, strftime('%s', 'now'))",
+            rows,
+        ))
+
+    def existing_records(self, pairs: Iterable[Tuple[int, int]]) -> Set[Tuple[int, int]]:
+        """Возвращает пары (id, price) из переданных, которые уже есть в viewed"""
+        return self._existing_pairs("viewed", pairs)
 
     def list_all_viewed_records(self) -> List[Tuple]:
-        with sqlite3.connect(self.db_path) as conn:
-            cur = conn.execute("SELECT id, price FROM viewed")
-            return cur.fetchall()
+        cur = self._reader().execute("SELECT id, price FROM viewed")
+        return cur.fetchall()
+
+    def _user_settings(self, user_id: int) -> Tuple[Dict[str, str], Dict[str, Any]]:
+        entry = self._settings_cache.get(user_id)
+        if entry is not None:
+            return entry
+        generation = self._settings_cache.generation(user_id)
+        cur = self._reader().execute("SELECT key, value FROM settings WHERE user_id=?", (user_id,))
+        return self._settings_cache.put(user_id, generation, {k: v for k, v in cur.fetchall()})
+
+    def cached_settings(self, user_id: int) -> Optional[Tuple[Dict[str, str], Dict[str, Any]]]:
+        """Возвращает настройки из кэша без обращения к БД или None, если их там нет."""
+        return self._settings_cache.get(user_id)
 
     def get_setting(self, user_id: int, key: str) -> Optional[str]:
-        with sqlite3.connect(self.db_path) as conn:
-            cur = conn.execute("SELECT value FROM settings WHERE user_id=? AND key=?", (user_id, key))
-            row = cur.fetchone()
-            return row[0] if row else None
+        return self._user_settings(user_id)[0].get(key)
 
     def set_setting(self, user_id: int, key: str, value: str) -> None:
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute(
-                "INSERT INTO settings(user_id, key, value) VALUES(?, ?, ?) "
-                "ON CONFLICT(user_id, key) DO UPDATE SET value=excluded.value",
-                (user_id, key, value),
-            )
-            conn.commit()
+        self._settings_cache.invalidate(user_id)
+        self._write(lambda conn: conn.execute(
+            "INSERT INTO settings(user_id, key, value) VALUES(?, ?, ?) "
+            "ON CONFLICT(user_id, key) DO UPDATE SET value=excluded.value",
+            (user_id, key, value),
+        ), wait=True, on_commit=lambda: self._settings_cache.invalidate(user_id))
 
     def delete_setting(self, user_id: int, key: str) -> None:
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute("DELETE FROM settings WHERE user_id=? AND key=?", (user_id, key))
-            conn.commit()
+        self._settings_cache.invalidate(user_id)
+        self._write(
+            lambda conn: conn.execute("DELETE FROM settings WHERE user_id=? AND key=?", (user_id, key)),
+            wait=True,
+            on_commit=lambda: self._settings_cache.invalidate(user_id),
+        )
 
     def list_settings(self, user_id: int) -> Dict[str, str]:
-        with sqlite3.connect(self.db_path) as conn:
-            cur = conn.execute("SELECT key, value FROM settings WHERE user_id=?", (user_id,))
-            return {k: v for k, v in cur.fetchall()}
+        return dict(self._user_settings(user_id)[0])
 
-    def get_scan_ids(self, url: str) -> List[str]:
-        """Получить список ID объявлений для заданного URL из последнего сканирования"""
-        with sqlite3.connect(self.db_path) as conn:
-            cur = conn.execute("SELECT ad_ids FROM scan_history WHERE url=?", (url,))
-            result = cur.fetchone()
-            if result and result[0]:
-                return json.loads(result[0])
+    def list_typed_settings(self, user_id: int) -> Dict[str, Any]:
+        """Настройки пользователя с уже разобранными значениями (числа, флаги, списки слов)."""
+        return {
+            key: list(value) if isinstance(value, list) else value
+            for key, value in self._user_settings(user_id)[1].items()
+        }
+
+    def _get_scan_ids(self, table: str, url: str) -> List[str]:
+        cur = self._reader().execute(f"SELECT ad_id FROM {table} WHERE url=?", (url,))
+        return [row[0] for row in cur.fetchall()]
+
+    def _save_scan_ids(self, table: str, url: str, ids: Iterable[str]) -> None:
+        # Новые ID добавляются, у уже известных обновляется только last_seen
+        rows = [(url, str(ad_id)) for ad_id in ids]
+        self._write(lambda conn: conn.executemany(
+            f"INSERT INTO {table}(url, ad_id) VALUES (?, ?) "
+            f"ON CONFLICT(url, ad_id) DO UPDATE SET last_seen=excluded.last_seen",
+            rows,
+        ))
+
+    def _scan_id_exists(self, table: str, url: str, ad_id: str) -> bool:
+        cur = self._reader().execute(f"SELECT 1 FROM {table} WHERE url=? AND ad_id=?", (url, str(ad_id)))
+        return cur.fetchone() is not None
+
+    def iter_ad_ids(self, platform: str, since: int = 0) -> Iterator[str]:
+        """Перебирает ID всех известных объявлений площадки, встреченных не раньше since.
+
+        Источники - история сканирований и таблица отправленных объявлений.
+        Строки читаются курсором, без загрузки таблиц в память.
+        """
+        scan_table, viewed_table = PLATFORM_TABLES[platform]
+        scan_time, _ = DB_RETENTION_COLUMNS[scan_table]
+        viewed_time, _ = DB_RETENTION_COLUMNS[viewed_table]
+        cur = self._reader().execute(
+            f"SELECT ad_id FROM {scan_table} WHERE {scan_time} >= ? "
+            f"UNION ALL SELECT CAST(id AS TEXT) FROM {viewed_table} WHERE {viewed_time} >= ?",
+            (since, since),
+        )
+        for (ad_id,) in cur:
+            yield ad_id
+
+    def known_ad_ids(
+        self,
+        platform: str,
+        urls: Iterable[str],
+        ids: Iterable[str],
+        include_viewed: bool = False,
+    ) -> Set[str]:
+        """Возвращает ID из переданных, которые уже встречались по одному из URL.
+
+        При include_viewed известными считаются и объявления из таблицы
+        отправленных, независимо от URL.
+        """
+        scan_table, viewed_table = PLATFORM_TABLES[platform]
+        urls = list(urls)
+        ids = list(dict.fromkeys(str(ad_id) for ad_id in ids))
+        known: Set[str] = set()
+        if not ids:
+            return known
+
+        conn = self._reader()
+        url_marks = ", ".join("?" * len(urls))
+        for i in range(0, len(ids), DB_BATCH_SIZE):
+            chunk = ids[i:i + DB_BATCH_SIZE]
+            id_marks = ", ".join("?" * len(chunk))
+            if urls:
+                cur = conn.execute(
+                    f"SELECT DISTINCT ad_id FROM {scan_table} WHERE url IN ({url_marks}) AND ad_id IN ({id_marks})",
+                    (*urls, *chunk),
+                )
+                known.update(row[0] for row in cur)
+            if include_viewed:
+                cur = conn.execute(
+                    f"SELECT DISTINCT CAST(id AS TEXT) FROM {viewed_table} WHERE id IN ({id_marks})",
+                    chunk,
+                )
+                known.update(row[0] for row in cur)
+        return known
+
+    def record_prices(self, platform: str, url: str, prices: Iterable[Tuple[str, int]]) -> List[Tuple[str, int, int]]:
+        """Записывает цены объявлений страницы и возвращает снижения цен.
+
+        Снижением считается цена ниже той, что была у объявления при прошлом
+        сканировании этого URL (last_seen в истории сканирований). Проверка и
+        запись идут пачками по DB_BATCH_SIZE: на пачку один запрос по
+        первичным ключам и одна вставка только изменившихся цен. Повторное
+        изменение в ту же секунду заменяет запись этой секунды, чтобы
+        последней в истории всегда была актуальная цена.
+        Возвращает список (ad_id, старая цена, новая цена).
+        """
+        scan_table, _ = PLATFORM_TABLES[platform]
+        rows = list({str(ad_id): price for ad_id, price in prices if price > 0}.items())
+        if not rows:
+            return []
+
+        def record(conn: sqlite3.Connection) -> List[Tuple[str, int, int]]:
+            drops: List[Tuple[str, int, int]] = []
+            now = int(time.time())
+            for i in range(0, len(rows), DB_BATCH_SIZE):
+                chunk = rows[i:i + DB_BATCH_SIZE]
+                values = ", ".join(["(?, ?)"] * len(chunk))
+                params = [value for row in chunk for value in row]
+                cur = conn.execute(
+                    f"""
+                    WITH page(ad_id, price) AS (VALUES {values})
+                    SELECT ad_id, seen_price, price FROM (
+                        SELECT p.ad_id, p.price, (
+                            SELECT h.price FROM price_history h
+                            WHERE h.platform = ? AND h.ad_id = p.ad_id AND h.observed_at <= s.last_seen
+                            ORDER BY h.observed_at DESC LIMIT 1
+                        ) AS seen_price
+                        FROM page p JOIN {scan_table} s ON s.url = ? AND s.ad_id = p.ad_id
+                    )
+                    WHERE seen_price > price
+                    """,
+                    (*params, platform, url),
+                )
+                drops.extend(cur.fetchall())
+                conn.execute(
+                    f"""
+                    WITH page(ad_id, price) AS (VALUES {values})
+                    INSERT OR REPLACE INTO price_history(platform, ad_id, price, observed_at)
+                    SELECT ?, p.ad_id, p.price, ? FROM page p
+                    WHERE p.price IS NOT (
+                        SELECT h.price FROM price_history h
+                        WHERE h.platform = ? AND h.ad_id = p.ad_id
+                        ORDER BY h.observed_at DESC LIMIT 1
+                    )
+                    """,
+                    (*params, platform, now, platform),
+                )
+            return drops
+
+        return self._write(record, wait=True)
+
+    def price_history(self, platform: str, ad_id: str) -> List[Tuple[int, int]]:
+        """Возвращает изменения цены объявления: список (время, цена) по возрастанию времени."""
+        cur = self._reader().execute(
+            "SELECT observed_at, price FROM price_history WHERE platform=? AND ad_id=? ORDER BY observed_at",
+            (platform, str(ad_id)),
+        )
+        return cur.fetchall()
+
+    def index_ads(self, platform: str, rows: Iterable[Tuple[str, str, str, str, int]]) -> None:
+        """Добавляет в полнотекстовый индекс пачку объявлений (ad_id, title, description, url, price).
+
+        Запись не ждёт commit и уходит в общую пачку потока-писателя, поэтому
+        не задерживает цикл сканирования. Индекс FTS перестраивается
+        триггером только для новых объявлений и изменившихся текстов.
+        """
+        rows = [(platform, str(ad_id), title, description, url, price) for ad_id, title, description, url, price in rows]
+        if not rows:
+            return
+        self._write(lambda conn: conn.executemany(
+            """
+            INSERT INTO ads(platform, ad_id, title, description, url, price) VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(platform, ad_id) DO UPDATE SET
+                title = excluded.title,
+                description = COALESCE(NULLIF(excluded.description, ''), description),
+                url = excluded.url,
+                price = excluded.price,
+                last_seen = strftime('%s', 'now')
+            """,
+            rows,
+        ))
+
+    def iter_ads(
+        self,
+        platform: str | None = None,
+        since: int | None = None,
+        until: int | None = None,
+        batch_size: int = DB_EXPORT_BATCH_SIZE,
+    ) -> Iterator[Tuple]:
+        """Перебирает собранные объявления в порядке появления, строки - по AD_EXPORT_COLUMNS.
+
+        since/until ограничивают время первого появления (until не включительно).
+        Курсор читается пачками по batch_size, поэтому память не зависит
+        от размера таблицы.
+        """
+        sql = f"SELECT {', '.join(AD_EXPORT_COLUMNS)} FROM ads WHERE 1=1"
+        params: List[Any] = []
+        if platform:
+            sql += " AND platform = ?"
+            params.append(platform)
+        if since is not None:
+            sql += " AND first_seen >= ?"
+            params.append(since)
+        if until is not None:
+            sql += " AND first_seen < ?"
+            params.append(until)
+        sql += " ORDER BY id"
+
+        cur = self._reader().execute(sql, params)
+        try:
+            while rows := cur.fetchmany(batch_size):
+                yield from rows
+        finally:
+            cur.close()
+
+    def search_ads(self, query: str, platform: str | None = None, limit: int = FULLTEXT_SEARCH_LIMIT) -> List[Tuple]:
+        """Ищет объявления по словам из заголовка и описания.
+
+        Каждое слово ищется как префикс, объявление должно содержать все слова.
+        Возвращает (platform, ad_id, title, price, url), сначала самые релевантные.
+        """
+        if not self.fulltext_enabled:
+            return []
+        # В словах только буквы и цифры, поэтому кавычки, *, -, скобки и
+        # операторы FTS5 из ввода пользователя в MATCH не попадают, а NEAR,
+        # AND, OR и NOT в кавычках - обычные слова
+        match = " ".join(f'"{term}"*' for term in fulltext_terms(query))
+        if not match:
             return []
+
+        sql = (
+            "SELECT a.platform, a.ad_id, a.title, a.price, a.url FROM ads_fts "
+            "JOIN ads a ON a.id = ads_fts.rowid WHERE ads_fts MATCH ?"
+        )
+        params: List[Any] = [match]
+        if platform:
+            sql += " AND a.platform = ?"
+            params.append(platform)
+        sql += " ORDER BY rank LIMIT ?"
+        params.append(limit)
+        return self._reader().execute(sql, params).fetchall()
+
+    def get_scan_ids(self, url: str) -> List[str]:
+        """Получить список ID объявлений, когда-либо найденных по заданному URL"""
+        return self._get_scan_ids("scan_ads", url)
     
-    def save_scan_ids(self, url: str, ids: List[str]) -> None:
-        """Сохранить список ID объявлений для URL"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute(
-                "INSERT OR REPLACE INTO scan_history(url, ad_ids) VALUES(?, ?)",
-                (url, json.dumps(ids))
-            )
-            conn.commit()
+    def save_scan_ids(self, url: str, ids: Iterable[str]) -> None:
+        """Сохранить ID объявлений, найденных по URL в текущем сканировании"""
+        self._save_scan_ids("scan_ads", url, ids)
+
+    def scan_id_exists(self, url: str, ad_id: str) -> bool:
+        """Проверить, встречалось ли объявление по заданному URL"""
+        return self._scan_id_exists("scan_ads", url, ad_id)
     
     def clean_scan_history(self) -> None:
         """Очистить историю сканирований"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute("DELETE FROM scan_history")
-            conn.commit()
+        self._write(lambda conn: conn.execute("DELETE FROM scan_ads"))
 
     def add_cian_record(self, ad_id: str, price: int, url: str = "", title: str = "") -> None:
         """Добавляет запись об объявлении ЦИАН в базу"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute(
-                "INSERT OR IGNORE INTO cian_viewed(id, price, url, title) VALUES (?, ?, ?, ?)", 
-                (ad_id, price, url, title)
-            )
-            conn.commit()
+        self._write(lambda conn: conn.execute(
+            "INSERT OR IGNORE INTO cian_viewed(id, price, url, title) VALUES (?, ?, ?, ?)", 
+            (ad_id, price, url, title)
+        ))
 
     def cian_record_exists(self, ad_id: str, price: int) -> bool:
         """Проверяет существование объявления ЦИАН в базе"""
-        with sqlite3.connect(self.db_path) as conn:
-            cur = conn.execute("SELECT 1 FROM cian_viewed WHERE id=? AND price=?", (ad_id, price))
-            return cur.fetchone() is not None
+        cur = self._reader().execute("SELECT 1 FROM cian_viewed WHERE id=? AND price=?", (ad_id, price))
+        return cur.fetchone() is not None
+
+    def add_cian_records(self, rows: Iterable[Tuple[str, int, str, str]]) -> None:
+        """Добавляет пачку объявлений ЦИАН (id, price, url, title) одной операцией executemany"""
+        rows = list(rows)
+        self._write(lambda conn: conn.executemany(
+            "INSERT OR IGNORE INTO cian_viewed(id, price, url, title) VALUES (?, ?, ?, ?)",
+            rows,
+        ))
+
+    def existing_cian_records(self, pairs: Iterable[Tuple[str, int]]) -> Set[Tuple[str, int]]:
+        """Возвращает пары (id, price) из переданных, которые уже есть в cian_viewed"""
+        return self._existing_pairs("cian_viewed", pairs)
 
     def list_all_cian_records(self) -> List[Tuple]:
         """Возвращает список всех сохраненных объявлений ЦИАН"""
-        with sqlite3.connect(self.db_path) as conn:
-            cur = conn.execute("SELECT id, price, url, title FROM cian_viewed")
-            return cur.fetchall()
+        cur = self._reader().execute("SELECT id, price, url, title FROM cian_viewed")
+        return cur.fetchall()
 
     def clean_cian_viewed(self) -> None:
         """Очищает таблицу просмотренных объявлений ЦИАН"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute("DELETE FROM cian_viewed")
-            conn.commit()
+        self._write(lambda conn: conn.execute("DELETE FROM cian_viewed"))
 
     def get_cian_scan_ids(self, url: str) -> List[str]:
-        """Получить список ID объявлений ЦИАН для заданного URL из последнего сканирования"""
-        with sqlite3.connect(self.db_path) as conn:
-            cur = conn.execute("SELECT ad_ids FROM cian_scan_history WHERE url=?", (url,))
-            result = cur.fetchone()
-            if result and result[0]:
-                return json.loads(result[0])
-            return []
+        """Получить список ID объявлений ЦИАН, когда-либо найденных по заданному URL"""
+        return self._get_scan_ids("cian_scan_ads", url)
     
-    def save_cian_scan_ids(self, url: str, ids: List[str]) -> None:
-        """Сохранить список ID объявлений ЦИАН для URL"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute(
-                "INSERT OR REPLACE INTO cian_scan_history(url, ad_ids) VALUES(?, ?)",
-                (url, json.dumps(ids))
-            )
-            conn.commit()
+    def save_cian_scan_ids(self, url: str, ids: Iterable[str]) -> None:
+        """Сохранить ID объявлений ЦИАН, найденных по URL в текущем сканировании"""
+        self._save_scan_ids("cian_scan_ads", url, ids)
+
+    def cian_scan_id_exists(self, url: str, ad_id: str) -> bool:
+        """Проверить, встречалось ли объявление ЦИАН по заданному URL"""
+        return self._scan_id_exists("cian_scan_ads", url, ad_id)
     
     def clean_cian_scan_history(self) -> None:
         """Очистить историю сканирований ЦИАН"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute("DELETE FROM cian_scan_history")
-            conn.commit()
+        self._write(lambda conn: conn.execute("DELETE FROM cian_scan_ads"))
 
     def add_search(self, user_id: int, platform: str, urls: List[str], settings: Dict[str, Any], name: str = "") -> int:
         settings_copy = settings.copy()
         settings_copy["platform"] = platform
         
-        with sqlite3.connect(self.db_path) as conn:
+        def insert(conn: sqlite3.Connection) -> int:
             cursor = conn.cursor()
-            all_ids = cursor.execute("SELECT id FROM searches").fetchall()
-            all_ids = [row[0] for row in all_ids]
-            
-            new_id = 1
-            while new_id in all_ids:
-                new_id += 1
-                
+            # Наименьший освободившийся номер, иначе следующий за последним;
+            # оба запроса идут по первичному ключу и не зависят от размера таблицы
+            new_id = cursor.execute("SELECT MIN(id) FROM search_free_ids").fetchone()[0]
+            if new_id is not None:
+                cursor.execute("DELETE FROM search_free_ids WHERE id=?", (new_id,))
+            else:
+                new_id = cursor.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM searches").fetchone()[0]
+
+            # Строка остановленного поиска с тем же номером заменяется новой
             cursor.execute(
-                "INSERT INTO searches(id, user_id, platform, urls, settings_json, name, active) VALUES (?, ?, ?, ?, ?, ?, 1)",
+                "INSERT OR REPLACE INTO searches(id, user_id, platform, urls, settings_json, name, active) VALUES (?, ?, ?, ?, ?, ?, 1)",
                 (new_id, user_id, platform, " ".join(urls), json.dumps(settings_copy, ensure_ascii=False), name),
             )
             
-            conn.commit()
             return new_id
 
+        return self._write(insert, wait=True)
+
     def deactivate_search(self, search_id: int) -> None:
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute("UPDATE searches SET active=0 WHERE id=?", (search_id,))
-            conn.commit()
+        def deactivate(conn: sqlite3.Connection) -> None:
+            if conn.execute("UPDATE searches SET active=0 WHERE id=? AND active=1", (search_id,)).rowcount:
+                conn.execute("INSERT OR IGNORE INTO search_free_ids(id) VALUES (?)", (search_id,))
+
+        self._write(deactivate, wait=True)
 
     def list_active_searches(self, user_id: int | None = None, platform: str | None = None) -> List[Tuple]:
-        sql = "SELECT id, urls, settings_json"
-        
-        with sqlite3.connect(self.db_path) as conn:
-            c = conn.cursor()
-            c.execute("PRAGMA table_info(searches)")
-            columns = [column[1] for column in c.fetchall()]
-            
-            if "name" in columns:
-                sql += ", name"
-            else:
-                sql += ", ''"
-        
-        sql += " FROM searches WHERE active=1"
+        # Столбец name гарантирован миграциями, индекс (active, user_id, platform) покрывает фильтры.
+        # Владелец поиска идёт последним, чтобы не сдвигать прежние столбцы
+        sql = "SELECT id, urls, settings_json, name, user_id FROM searches WHERE active=1"
+        conn = self._reader()
         
         params: List[Any] = []
         if user_id is not None and user_id != 0:
@@ -290,67 +1116,139 @@ class SQLiteDBHandler:
         if platform:
             sql += " AND platform=?"
             params.append(platform)
-        with sqlite3.connect(self.db_path) as conn:
-            cur = conn.execute(sql, tuple(params))
-            return cur.fetchall()
+        # Порядок номеров, как в InMemoryDBHandler, а не порядок обхода индекса
+        sql += " ORDER BY id"
+        cur = conn.execute(sql, tuple(params))
+        return cur.fetchall()
     
     def reset_search_counter(self) -> bool:
-        """Сбрасывает автоинкрементный счетчик для таблицы searches.
-        
-        Использует более радикальный подход - пересоздание таблицы searches.
+        """Удаляет остановленные поиски и номера за последним активным.
+
+        Таблица не пересоздаётся: номера и так выдаются из списка свободных,
+        начиная с наименьшего, поэтому очистка нужна только для её размера.
         """
+        def reset(conn: sqlite3.Connection) -> None:
+            conn.execute("DELETE FROM searches WHERE active=0")
+            conn.execute(
+                "DELETE FROM search_free_ids WHERE id > (SELECT COALESCE(MAX(id), 0) FROM searches)"
+            )
+
         try:
-            # Шаг 1: Создаем новое соединение с базой данных для этой операции
-            # и устанавливаем режим внешних ключей OFF для безопасности
-            with sqlite3.connect(self.db_path) as conn:
-                conn.execute("PRAGMA foreign_keys = OFF")
-                
-                # Шаг 2: Сохраняем данные из таблицы searches в память
-                cursor = conn.cursor()
-                cursor.execute("SELECT user_id, platform, urls, settings_json, active, name FROM searches WHERE active=1")
-                active_searches = cursor.fetchall()
-                
-                # Шаг 3: Удаляем таблицу searches
-                conn.execute("DROP TABLE IF EXISTS searches")
-                
-                # Шаг 4: Создаем таблицу searches заново
-                conn.execute("""
-                    CREATE TABLE searches (
-                        id            INTEGER PRIMARY KEY AUTOINCREMENT,
-                        user_id       INTEGER,
-                        platform      TEXT,
-                        urls          TEXT,
-                        settings_json TEXT,
-                        active        INTEGER DEFAULT 1,
-                        name          TEXT
-                    )
-                """)
-                
-                # Шаг 5: Восстанавливаем активные поиски (если необходимо)
-                if active_searches:
-                    conn.executemany(
-                        "INSERT INTO searches(user_id, platform, urls, settings_json, active, name) VALUES (?, ?, ?, ?, ?, ?)",
-                        active_searches
-                    )
-                
-                # Шаг 6: Включаем обратно режим внешних ключей
-                conn.execute("PRAGMA foreign_keys = ON")
-                conn.commit()
-                
-                import logging
-                logging.info("Таблица searches пересоздана, счетчик поисков сброшен до 1")
-                return True
-        except Exception as e:
-            import logging
+            self._write(reset, wait=True)
+            return True
+        except sqlite3.Error as e:
             logging.error(f"Ошибка при сбросе счетчика поисков: {e}")
         return False
     
+    def _delete_expired_chunk(self, table: str, cutoff: int, chunk_size: int) -> int:
+        time_column, key_columns = DB_RETENTION_COLUMNS[table]
+        keys = ", ".join(key_columns)
+        # Отправленное объявление, которое ещё встречается в листингах, не удаляется
+        still_seen = ""
+        params: Tuple[Any, ...] = (cutoff, chunk_size)
+        if table in DB_RETENTION_SEEN_IN:
+            still_seen = (
+                f" AND NOT EXISTS (SELECT 1 FROM {DB_RETENTION_SEEN_IN[table]} s "
+                f"WHERE s.ad_id = CAST(t.id AS TEXT) AND s.last_seen >= ?)"
+            )
+            params = (cutoff, cutoff, chunk_size)
+
+        def delete(conn: sqlite3.Connection) -> int:
+            cur = conn.execute(
+                f"DELETE FROM {table} WHERE ({keys}) IN "
+                f"(SELECT {keys} FROM {table} t WHERE {time_column} < ?{still_seen} LIMIT ?)",
+                params,
+            )
+            return cur.rowcount
+
+        return self._write(delete, wait=True)
+
+    def _enable_incremental_vacuum(self) -> None:
+        """Разово переводит базу, созданную до incremental vacuum, в этот режим.
+
+        Режим применяется только полным VACUUM, который переписывает весь
+        файл, поэтому он выполняется в фоновой компактизации, а не при
+        открытии базы.
+        """
+        conn = self._connect()
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            return
+        self.flush()
+        size, _ = self._database_size()
+        logging.info(f"Включаю incremental vacuum: полный VACUUM базы {size // 1024} КБ")
+        start = time.perf_counter()
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("VACUUM")
+        logging.info(f"VACUUM завершён за {time.perf_counter() - start:.1f} с")
+
+    def _database_size(self) -> Tuple[int, int]:
+        """Возвращает размер файла БД и объём свободных страниц в байтах."""
+        conn = self._connect()
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+        freelist = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        return page_count * page_size, freelist * page_size
+
+    def compact(
+        self,
+        retention_days: Dict[str, int] | None = None,
+        chunk_size: int = DB_COMPACT_CHUNK_SIZE,
+    ) -> Dict[str, Any]:
+        """Удаляет записи старше срока хранения и возвращает место файлу.
+
+        Строки удаляются пачками по chunk_size через очередь записи, поэтому
+        парсеры не ждут блокировку дольше одной пачки. Свободные страницы
+        отдаются системе через incremental_vacuum.
+
+        Возвращает словарь с количеством удалённых строк по таблицам и
+        числом освобождённых байт.
+        """
+        retention = {**DB_RETENTION_DAYS, **(retention_days or {})}
+        self._enable_incremental_vacuum()
+        size_before, _ = self._database_size()
+        now = int(time.time())
+
+        deleted: Dict[str, int] = {}
+        for table, days in retention.items():
+            if table not in DB_RETENTION_COLUMNS or not days:
+                continue
+            cutoff = now - days * 86400
+            total = 0
+            while True:
+                removed = self._delete_expired_chunk(table, cutoff, chunk_size)
+                total += removed
+                if removed < chunk_size:
+                    break
+            deleted[table] = total
+
+        self.flush()
+        conn = self._connect()
+        while True:
+            _, free_bytes = self._database_size()
+            if not free_bytes:
+                break
+            # execute() делает один шаг прагмы и освобождает одну страницу;
+            # executescript выполняет её целиком. Каждый вызов - своя короткая
+            # транзакция, очередь записи ждёт не дольше одного шага
+            conn.executescript(f"PRAGMA incremental_vacuum({DB_VACUUM_PAGES});")
+            if self._database_size()[1] == free_bytes:
+                break
+
+        size_after, _ = self._database_size()
+        report = {
+            "deleted": deleted,
+            "size_before": size_before,
+            "size_after": size_after,
+            "reclaimed_bytes": size_before - size_after,
+        }
+        return report
+
     def clean_active_searches(self) -> None:
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute("UPDATE searches SET active=0")
-            conn.commit()
+        def clean(conn: sqlite3.Connection) -> None:
+            conn.execute("INSERT OR IGNORE INTO search_free_ids(id) SELECT id FROM searches WHERE active=1")
+            conn.execute("UPDATE searches SET active=0 WHERE active=1")
+
+        self._write(clean, wait=True)
             
     def clear_viewed_records(self) -> None:
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute("DELETE FROM viewed")
-            conn.commit()
\ No newline at end of file
+        self._write(lambda conn: conn.execute("DELETE FROM viewed"))
\ No newline at end of file
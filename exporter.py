@@ -0,0 +1,108 @@
+import argparse
+import csv
+import gzip
+import io
+import json
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, TextIO
+
+from db_service import AD_EXPORT_COLUMNS, SQLiteDBHandler
+from storage import StorageBackend
+
+EXPORT_FORMATS = ("jsonl", "csv")
+
+
+def _ad_dicts(
+    db: StorageBackend,
+    platform: str | None = None,
+    since: int | None = None,
+    until: int | None = None,
+) -> Iterator[Dict[str, Any]]:
+    """Строки iter_ads в виде словарей; время появления - в ISO 8601."""
+    for row in db.iter_ads(platform, since, until):
+        ad = dict(zip(AD_EXPORT_COLUMNS, row))
+        for column in ("first_seen", "last_seen"):
+            if ad[column] is not None:
+                ad[column] = datetime.fromtimestamp(ad[column]).isoformat(timespec="seconds")
+        yield ad
+
+
+def write_ads(ads: Iterator[Dict[str, Any]], out: TextIO, fmt: str = "jsonl") -> int:
+    """Пишет объявления в текстовый поток построчно, возвращает их количество."""
+    count = 0
+    if fmt == "csv":
+        writer = csv.DictWriter(out, fieldnames=AD_EXPORT_COLUMNS)
+        writer.writeheader()
+        for ad in ads:
+            writer.writerow(ad)
+            count += 1
+    elif fmt == "jsonl":
+        for ad in ads:
+            out.write(json.dumps(ad, ensure_ascii=False) + "\n")
+            count += 1
+    else:
+        raise ValueError(f"Неизвестный формат {fmt!r}, доступны: {', '.join(EXPORT_FORMATS)}")
+    return count
+
+
+def export_ads(
+    path: Path | str,
+    fmt: str = "jsonl",
+    platform: str | None = None,
+    since: int | None = None,
+    until: int | None = None,
+    compress: bool | None = None,
+    db: StorageBackend | None = None,
+) -> int:
+    """Выгружает собранные объявления в файл JSONL или CSV, возвращает число строк.
+
+    Строки идут из курсора через генераторы и сразу пишутся в файл, поэтому
+    память не зависит от объёма выгрузки. compress=None включает gzip для
+    путей, оканчивающихся на .gz.
+    """
+    path = Path(path)
+    db = db or SQLiteDBHandler()
+    if compress is None:
+        compress = path.suffix == ".gz"
+    ads = _ad_dicts(db, platform, since, until)
+
+    if compress:
+        with gzip.open(path, "wt", encoding="utf-8", newline="") as out:
+            return write_ads(ads, out, fmt)
+    with open(path, "w", encoding="utf-8", newline="") as out:
+        return write_ads(ads, out, fmt)
+
+
+def _timestamp(value: str) -> int:
+    """Дата или дата-время в ISO 8601 (2024-05-01, 2024-05-01T12:00) -> unix-время."""
+    try:
+        return int(datetime.fromisoformat(value).timestamp())
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Неверная дата {value!r}, ожидается ISO 8601") from None
+
+
+def main(argv: list | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Выгрузка собранных объявлений в JSONL или CSV")
+    parser.add_argument("output", help="файл выгрузки; '-' - стандартный вывод, .gz - сжатие gzip")
+    parser.add_argument("-f", "--format", choices=EXPORT_FORMATS, default="jsonl")
+    parser.add_argument("-p", "--platform", choices=("avito", "cian"), help="только объявления площадки")
+    parser.add_argument("--since", type=_timestamp, help="появившиеся не раньше даты (ISO 8601)")
+    parser.add_argument("--until", type=_timestamp, help="появившиеся раньше даты (ISO 8601)")
+    parser.add_argument("--gzip", action="store_true", default=None, help="сжать gzip независимо от расширения")
+    args = parser.parse_args(argv)
+
+    if args.output == "-":
+        db = SQLiteDBHandler()
+        out = io.TextIOWrapper(sys.stdout.buffer, encoding="utf-8", newline="", write_through=True)
+        count = write_ads(_ad_dicts(db, args.platform, args.since, args.until), out, args.format)
+        out.detach()
+    else:
+        count = export_ads(args.output, args.format, args.platform, args.since, args.until, args.gzip)
+    print(f"Выгружено объявлений: {count}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -18,4 +18,17 @@ class LocatorAvito:
     # Селекторы для изображений
     GALLERY_IMAGE = (By.CSS_SELECTOR, "img[data-marker='gallery-img']")
     IMAGE_CONTAINER = (By.CSS_SELECTOR, "div[data-marker='item-view/gallery']")
-    GALLERY_SLIDES = (By.CSS_SELECTOR, "div[data-marker='item-view/gallery'] div[data-marker='slider-image/image-wrapper']")
\ No newline at end of file
+    GALLERY_SLIDES = (By.CSS_SELECTOR, "div[data-marker='item-view/gallery'] div[data-marker='slider-image/image-wrapper']")
+    
+    # Страницы с квартирами: для каждого поля - селекторы по приоритету
+    APARTMENT_CARDS = (
+        "[data-marker='item']",
+        "[data-marker='catalog-serp']",
+        "div[data-marker='catalog-serp'] [data-marker='item']",
+        "div[data-marker='item-container']",
+        "div[data-marker='item-aligner']",
+    )
+    APARTMENT_NAME = ("[data-marker='item-title']", "[itemprop='name']", "h3")
+    APARTMENT_DESCRIPTION = ("[data-marker='item-descr']", "[data-marker='item-description']", "[itemprop='description']")
+    APARTMENT_URL = ("a[data-marker='item-title']", "a[itemprop='url']", "a[href*='/kvartiry/']")
+    APARTMENT_PRICE = ("[data-marker='item-price']", "[itemprop='price']", "span.price-text")
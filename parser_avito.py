@@ -1,24 +1,202 @@
+import json
 import os
 import random
 import threading
 import time
 import re
-from typing import Dict, Set, List, Tuple, Optional
-from urllib.parse import urlparse, parse_qs, urlencode, urlunparse
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import ExitStack
+from queue import Empty, SimpleQueue
+from html import unescape
+from typing import Any, Callable, Dict, Set, List, Tuple, Optional
+from urllib.parse import urlparse, parse_qs, urlencode, urlunparse, unquote
 
 import requests
 from notifiers import get_notifier
 from selenium.webdriver.common.by import By
-from seleniumbase import SB
 from loguru import logger
 
+from bloom_filter import get_seen_filter
+from browser_pool import RESOURCE_BLOCK_PROFILES, PooledBrowser, get_browser_pool
 from db_service import SQLiteDBHandler
-from custom_exception import StopEventException
+from storage import StorageBackend
+from custom_exception import IPBlockedException, StopEventException
 from locator import LocatorAvito
+from proxy_pool import get_proxy_pool, parse_proxy_list, requests_proxies
+from rate_limiter import TokenBucket, get_rate_limiter
+from selector_cache import selector_cache
 from dotenv import load_dotenv
 
 load_dotenv()
 
+AVITO_BASE_URL = "https://www.avito.ru"
+
+# Встроенное в листинг состояние каталога: старый формат - URL-кодированная строка,
+# новый - JSON с HTML-сущностями в скриптах микрофронтендов
+INITIAL_DATA_RE = re.compile(r'window\.__initialData__\s*=\s*"(.*?)"\s*;?\s*</script>', re.DOTALL)
+MFE_STATE_RE = re.compile(r'<script[^>]*data-mfe-state="true"[^>]*>(.*?)</script>', re.DOTALL)
+
+# Профиль блокировки ресурсов браузера (см. RESOURCE_BLOCK_PROFILES): lean или off
+AVITO_RESOURCE_PROFILE = os.getenv("AVITO_RESOURCE_PROFILE", "lean")
+
+# Тип страницы в кэше селекторов: только у страниц с квартирами есть запасные селекторы
+APARTMENTS_SCOPE = "avito/apartments"
+
+# Сколько секунд выжидать после блокировки IP, если сменить IP нельзя
+IP_BLOCK_BACKOFF = (300, 350)
+# Сколько раз подряд страница перезапрашивается после смены IP
+MAX_BLOCK_RETRIES = 2
+
+# До какого времени (unix) IP заблокирован Авито, по прокси ("" - без прокси).
+# Общее для всех задач процесса: задача с тем же прокси даже не начинает сканирование
+_blocked_until: Dict[str, float] = {}
+
+# Сортировка по дате: за страницей из уже известных объявлений новых быть не может
+DATE_SORT = "104"
+# Столько известных объявлений подряд на странице останавливают пагинацию
+EARLY_STOP_KNOWN_STREAK = 10
+
+# Сколько карточек новых объявлений одного сканирования открывается параллельно
+DETAIL_PAGE_WORKERS = 3
+# Общий для всех парсеров процесса предел одновременных загрузок карточек с одного хоста
+DETAIL_PAGE_HOST_LIMIT = 4
+
+# Сколько секунд загруженная карточка объявления считается свежей (просмотры растут)
+DETAIL_CACHE_TTL = 600
+# Сколько карточек хранится в общем для процесса кэше
+DETAIL_CACHE_SIZE = 5000
+# Поля, которые дают карточки объявлений сверх листинга
+DETAIL_FIELDS = ("geo", "views", "image_url")
+
+_host_slots: Dict[str, threading.BoundedSemaphore] = {}
+_host_slots_lock = threading.Lock()
+
+
+def _host_slot(url: str) -> threading.BoundedSemaphore:
+    host = urlparse(url).netloc
+    with _host_slots_lock:
+        return _host_slots.setdefault(host, threading.BoundedSemaphore(DETAIL_PAGE_HOST_LIMIT))
+
+# Извлечение всех карточек листинга за один execute_script. Селекторы передаются
+# из LocatorAvito в порядке кэша селекторов; правила те же, что в поэлементном
+# разборе __parse_page. Возвращает объявления и счётчики сработавших селекторов
+EXTRACT_CARDS_JS = """
+const cfg = arguments[0];
+const used = {};
+const first = (root, field) => {
+    for (const selector of cfg[field]) {
+        const el = root.querySelector(selector);
+        if (el) {
+            const counts = used[field] = used[field] || {};
+            counts[selector] = (counts[selector] || 0) + 1;
+            return el;
+        }
+    }
+    return null;
+};
+const text = (el) => el ? (el.innerText || el.textContent || "").trim() : "";
+
+const otherGeo = document.querySelector(cfg.otherGeo);
+if (otherGeo && otherGeo.parentElement) otherGeo.parentElement.remove();
+
+let cards = [];
+if (cfg.apartments) {
+    for (const selector of cfg.cards) {
+        const found = document.querySelectorAll(selector);
+        if (found.length) { cards = Array.from(found); used.cards = {[selector]: 1}; break; }
+    }
+} else {
+    cards = Array.from(document.querySelectorAll(cfg.titles))
+        .filter((card) => card.className && !String(card.className).includes("avitoSales"));
+}
+
+const ads = [];
+for (const card of cards) {
+    const nameEl = first(card, "name");
+    const urlEl = first(card, "url");
+    if (!nameEl || !urlEl || !urlEl.href) continue;
+
+    const priceEl = first(card, "price");
+    let price = "0";
+    if (priceEl) {
+        price = cfg.apartments ? text(priceEl).replace(/\\D/g, "") : (priceEl.getAttribute("content") || "0");
+    }
+
+    let id = card.getAttribute("data-item-id");
+    if (!id) {
+        const match = urlEl.href.match(/_(\\d+)$/);
+        id = match ? match[1] : null;
+    }
+    if (!id) continue;
+
+    let image = null;
+    for (const img of card.querySelectorAll("img")) {
+        const src = img.getAttribute("src") || "";
+        if (src.includes("https://") && /\\.(jpe?g|png)/.test(src)) { image = src; break; }
+    }
+
+    ads.push({
+        name: text(nameEl),
+        description: text(first(card, "description")),
+        url: urlEl.href,
+        price: price,
+        id: id,
+        listing_image_url: image,
+    });
+}
+return JSON.stringify({ads: ads, used: used});
+"""
+
+
+class DetailPageCache:
+    """LRU-кэш полей карточек объявлений (DETAIL_FIELDS) по ID с ограниченным сроком жизни.
+
+    Общий для всех парсеров процесса: объявление из нескольких поисков,
+    снова ставшее новым после смены цены или перезапрошенное после блокировки
+    берётся из кэша, пока запись не старше ttl секунд. clock - источник
+    времени в секундах (подменяется в тестах).
+    """
+
+    def __init__(
+        self,
+        max_size: int = DETAIL_CACHE_SIZE,
+        ttl: float = DETAIL_CACHE_TTL,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self._clock = clock
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, ad_id: str) -> Optional[Dict[str, str]]:
+        with self._lock:
+            entry = self._entries.get(ad_id)
+            if entry is None or self._clock() - entry[0] > self.ttl:
+                if entry is not None:
+                    del self._entries[ad_id]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(ad_id)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, ad_id: str, data: dict) -> None:
+        fields = {key: data[key] for key in DETAIL_FIELDS if key in data}
+        if not fields:
+            return
+        with self._lock:
+            self._entries[ad_id] = (self._clock(), fields)
+            self._entries.move_to_end(ad_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+_detail_cache = DetailPageCache()
+
 
 class UserAgentRotator:
     _instance = None
@@ -65,7 +243,13 @@ class AvitoParse:
         stop_event: threading.Event | None = None,
         max_views: int | None = None,
         fast_speed: int = 0,
-        first_run: bool = False  
+        first_run: bool = False,
+        db_handler: StorageBackend | None = None,
+        js_extraction: bool = True,
+        http_fast_path: bool = True,
+        detail_workers: int = DETAIL_PAGE_WORKERS,
+        early_stop: bool = True,
+        resource_profile: str = AVITO_RESOURCE_PROFILE
     ) -> None:
         self.url_list = url
         self.keys_word = keysword_list or None
@@ -84,51 +268,72 @@ class AvitoParse:
         self.proxy_change_url = proxy_change_url
         self.fast_speed = fast_speed
         self.first_run = first_run
+        # Разбор листинга одним execute_script; поэлементный разбор остаётся запасным
+        self.js_extraction = js_extraction
+        # Листинги сначала запрашиваются без браузера, Chrome - только при блокировке или без JSON
+        self.http_fast_path = http_fast_path
+        self._http_blocked = False
+        self.session = requests.Session()
+        # Карточки новых объявлений открываются в нескольких браузерах из пула
+        self.detail_workers = max(1, detail_workers)
+        self._ip_block_lock = threading.Lock()
+        self._ip_unblocked_at = 0.0
+        # Время снятия блокировки, если последнее сканирование прервано ею (иначе 0)
+        self.blocked_until: float = 0.0
+        # Пагинация прекращается на странице из уже известных объявлений
+        self.early_stop = early_stop
+        if resource_profile not in RESOURCE_BLOCK_PROFILES:
+            raise ValueError(
+                f"Неизвестный профиль блокировки ресурсов {resource_profile!r}, "
+                f"доступны: {', '.join(RESOURCE_BLOCK_PROFILES)}"
+            )
+        # Картинки, шрифты и счётчики не скачиваются, адреса картинок остаются в DOM
+        self.blocked_urls = RESOURCE_BLOCK_PROFILES[resource_profile]
 
         self.url: str | None = None
         self.stop_event = stop_event or threading.Event()
-        self.db_handler = SQLiteDBHandler()
+        # Браузер из общего пула, выданный на сканирование текущего URL.
+        # Берётся лениво: если все страницы разобраны по HTTP, Chrome не нужен
+        self._browser: PooledBrowser | None = None
+        self._browser_stack: ExitStack | None = None
+        self._browser_options: Dict[str, Any] = {}
+        # Прокси текущего URL: по нему и домену выбирается общий лимит запросов
+        self._current_proxy: str | None = None
+        self.db_handler = db_handler or SQLiteDBHandler()
+        self.seen_filter = get_seen_filter("avito", self.db_handler)
         
-        self.known_ads: Set[str] = set()  
         self.current_scan_ads: Set[str] = set()  
+        self.current_scan_by_url: Dict[str, Set[str]] = {}
+        # ID новых объявлений, уже обработанных в этом сканировании (из другого URL поиска)
+        self.current_scan_notified: Set[str] = set()
+        # ID объявлений, о снижении цены которых уже сообщено в этом сканировании:
+        # объявление из нескольких URL поиска даёт одно уведомление
+        self.current_scan_price_drops: Set[str] = set()
         
         self.total_new_ads: int = 0  
         self.total_notified_ads: int = 0  
+        self.total_pages_saved: int = 0
         
         self.tg_notifier = None
         if self.tg_token and self.chat_id:
             self._setup_telegram_notifications()
-            
-        self._load_known_ads()
 
-    def _normalize_proxy(self, proxy_str: str) -> str:
-        if not proxy_str:
-            return ""
-            
-        if '@' in proxy_str:
-            return proxy_str
-            
-        parts = proxy_str.split(':')
-        if len(parts) == 4:
-            host, port, username, password = parts
-            return f"{username}:{password}@{host}:{port}"
-            
-        return proxy_str
-            
-    def _load_known_ads(self):
-        for url in self.url_list:
-            ads_ids = self.db_handler.get_scan_ids(url)
-            if ads_ids:
-                self.known_ads.update(ads_ids)
-        
-        logger.info(f"Загружено {len(self.known_ads)} известных объявлений из БД")
+    def _select_new_ads(self, ads: List[Dict]) -> List[Dict]:
+        """Отбирает объявления, которых ещё не было в истории сканирования этих URL.
+
+        Bloom-фильтр сразу отсекает заведомо новые ID, в БД проверяются
+        только возможные совпадения.
+        """
+        maybe_known = [ad["id"] for ad in ads if self.seen_filter.might_contain(ad["id"])]
+        known = self.db_handler.known_ad_ids("avito", self.url_list, maybe_known)
+        return [ad for ad in ads if ad["id"] not in known]
     
     def _save_scan_results(self):
-        all_ads = self.known_ads.union(self.current_scan_ads)
-        for url in self.url_list:
-            self.db_handler.save_scan_ids(url, list(all_ads))
+        for url, ads_ids in self.current_scan_by_url.items():
+            self.db_handler.save_scan_ids(url, ads_ids)
+        self.seen_filter.add_many(self.current_scan_ads)
         
-        logger.info(f"Сохранено {len(all_ads)} объявлений в БД")
+        logger.info(f"Сохранено {len(self.current_scan_ads)} объявлений в БД")
     
     def _setup_telegram_notifications(self):
         self.tg_notifier = get_notifier("telegram")
@@ -144,7 +349,10 @@ class AvitoParse:
             
             message_text = f"*{search_title}*\n"
             message_text += f"💡 *{data.get('name', '-')}*\n\n"
-            message_text += f"💰 *{data.get('price', '-')}₽*\n"
+            message_text += f"💰 *{data.get('price', '-')}₽*"
+            if old_price := data.get('old_price'):
+                message_text += f" 📉 было {old_price}₽"
+            message_text += "\n"
             message_text += f"🔗 [Ссылка на объявление]({data.get('url')})\n\n"
             
             if description := data.get('description'):
@@ -157,6 +365,8 @@ class AvitoParse:
             
             if "image_url" in data and data["image_url"]:
                 photo_url = data["image_url"]
+            elif data.get("listing_image_url"):
+                photo_url = data["listing_image_url"]
             else:
                 photo_url = "https://upload.wikimedia.org/wikipedia/commons/thumb/a/ac/No_image_available.svg/1024px-No_image_available.svg.png"
             
@@ -201,28 +411,70 @@ class AvitoParse:
     def use_proxy(self) -> bool:
         return bool(self.proxy and self.proxy_change_url)
 
-    def ip_block(self) -> None:
-        if self.use_proxy and self.change_ip():
-            UserAgentRotator._instance._current_index = 0
-            return
+    def _check_blocked(self) -> None:
+        """Прерывает сканирование, если IP текущего прокси ещё заблокирован."""
+        until = _blocked_until.get(self._current_proxy or "", 0.0)
+        if until > time.time():
+            raise IPBlockedException(until)
+
+    def ip_block(self, browser: PooledBrowser | None = None, attempt: int = 0) -> None:
+        """Реагирует на страницу блокировки: меняет IP для повтора или прерывает сканирование.
+
+        Возврат означает, что страницу можно запросить снова. Если сменить IP
+        нельзя или повторов уже MAX_BLOCK_RETRIES, поднимает IPBlockedException:
+        поток не спит, а задача откладывается планировщиком до снятия блокировки.
+        """
+        # Сессия браузера уже помечена блокировкой, в пул она не вернётся
+        browser = browser or self._browser
+        if browser:
+            browser.retired = True
         
-        logger.info("Блок IP. Использую паузу 5‑6 минут…")
-        time.sleep(random.randint(300, 350))
-        UserAgentRotator._instance._current_index = 0
+        blocked_at = time.monotonic()
+        with self._ip_block_lock:
+            self._check_blocked()
+            # IP уже сменил другой поток загрузки карточек
+            if self._ip_unblocked_at > blocked_at:
+                return
+            
+            if attempt < MAX_BLOCK_RETRIES and self.use_proxy and self.change_ip():
+                UserAgentRotator._instance._current_index = 0
+                self._ip_unblocked_at = time.monotonic()
+                return
+            
+            until = time.time() + random.randint(*IP_BLOCK_BACKOFF)
+            _blocked_until[self._current_proxy or ""] = until
+            # Пока прокси в карантине, задачи с другими прокси из списка выберут их
+            get_proxy_pool().report_block(self._current_proxy, until - time.time())
+            UserAgentRotator._instance._current_index = 0
+            raise IPBlockedException(until)
 
-    def __get_url(self, url: str) -> bool:
+    def _rate_limiter(self) -> TokenBucket:
+        return get_rate_limiter(AVITO_BASE_URL, self._current_proxy)
+
+    def __get_url(self, url: str, attempt: int = 0) -> bool:
         if "&s=" not in url:
             url += "&s=104"
 
         logger.info(f"Открываю страницу: {url}")
         try:
+            self._check_blocked()
+            self._ensure_driver()
+            self._browser.count_page()
+            limiter = self._rate_limiter()
+            limiter.acquire(self.stop_event)
+            start = time.perf_counter()
             self.driver.open(url)
 
             if "Доступ ограничен" in self.driver.get_title():
-                self.ip_block()
-                return self.__get_url(url)
-                
+                limiter.penalize()
+                self.ip_block(attempt=attempt)
+                return self.__get_url(url, attempt + 1)
+            
+            limiter.reward()
+            get_proxy_pool().report_success(self._current_proxy, time.perf_counter() - start)
             return True
+        except IPBlockedException:
+            raise
         except Exception as e:
             logger.error(f"Ошибка при открытии страницы {url}: {e}")
             return False
@@ -242,23 +494,20 @@ class AvitoParse:
             
             logger.info(f"Тип страницы: {'аренда квартир' if is_rent_page else 'продажа квартир' if is_sell_page else 'обычный поиск'}")
             
+            if self.js_extraction:
+                js_ads = self.__extract_cards_js(is_apartments_page)
+                if js_ads:
+                    self.current_scan_ads.update(ad["id"] for ad in js_ads)
+                    logger.info(f"Найдено объявлений на странице: {len(js_ads)}")
+                    return js_ads
+            
             if is_apartments_page:
                 # Для страниц с квартирами
-                titles = []
-                selectors = [
-                    "[data-marker='item']", 
-                    "[data-marker='catalog-serp']", 
-                    "div[data-marker='catalog-serp'] [data-marker='item']",
-                    "div[data-marker='item-container']",
-                    "div[data-marker='item-aligner']"
-                ]
-                
-                for selector in selectors:
-                    elements = self.driver.find_elements(By.CSS_SELECTOR, selector)
-                    if elements:
-                        titles = elements
-                        logger.info(f"Найдено {len(elements)} объявлений по селектору {selector}")
-                        break
+                titles = selector_cache.find(
+                    APARTMENTS_SCOPE, "cards", LocatorAvito.APARTMENT_CARDS,
+                    lambda selector: self.driver.find_elements(By.CSS_SELECTOR, selector),
+                ) or []
+                logger.info(f"Найдено {len(titles)} объявлений на странице с квартирами")
             else:
                 # Стандартный селектор для обычных страниц
                 titles = [t for t in self.driver.find_elements(LocatorAvito.TITLES[1], by="css selector") 
@@ -274,25 +523,14 @@ class AvitoParse:
                 try:
                     if is_apartments_page:
                         # Парсинг для страниц с квартирами
+                        # Селекторы поля перебираются, начиная с сработавшего в прошлый раз
+                        find_in_card = lambda selector: title.find_elements(By.CSS_SELECTOR, selector)
                         try:
-                            # Пробуем разные селекторы для заголовка
-                            name_element = None
-                            name_selectors = [
-                                "[data-marker='item-title']",
-                                "[itemprop='name']",
-                                "h3"
-                            ]
-                            
-                            for selector in name_selectors:
-                                elements = title.find_elements(By.CSS_SELECTOR, selector)
-                                if elements:
-                                    name_element = elements[0]
-                                    break
-                                    
-                            if not name_element:
+                            elements = selector_cache.find(APARTMENTS_SCOPE, "name", LocatorAvito.APARTMENT_NAME, find_in_card)
+                            if not elements:
                                 continue
                                 
-                            name = name_element.text
+                            name = elements[0].text
                         except Exception as e:
                             logger.error(f"Ошибка при получении заголовка: {e}")
                             continue
@@ -300,34 +538,18 @@ class AvitoParse:
                         # Описание
                         description = ''
                         try:
-                            desc_selectors = [
-                                "[data-marker='item-descr']",
-                                "[data-marker='item-description']",
-                                "[itemprop='description']"
-                            ]
-                            
-                            for selector in desc_selectors:
-                                elements = title.find_elements(By.CSS_SELECTOR, selector)
-                                if elements:
-                                    description = elements[0].text
-                                    break
+                            elements = selector_cache.find(APARTMENTS_SCOPE, "description", LocatorAvito.APARTMENT_DESCRIPTION, find_in_card)
+                            if elements:
+                                description = elements[0].text
                         except Exception:
                             pass
                         
                         # URL
                         url_link = None
                         try:
-                            url_selectors = [
-                                "a[data-marker='item-title']",
-                                "a[itemprop='url']",
-                                "a[href*='/kvartiry/']"
-                            ]
-                            
-                            for selector in url_selectors:
-                                elements = title.find_elements(By.CSS_SELECTOR, selector)
-                                if elements:
-                                    url_link = elements[0].get_attribute("href")
-                                    break
+                            elements = selector_cache.find(APARTMENTS_SCOPE, "url", LocatorAvito.APARTMENT_URL, find_in_card)
+                            if elements:
+                                url_link = elements[0].get_attribute("href")
                                     
                             if not url_link:
                                 continue
@@ -338,18 +560,9 @@ class AvitoParse:
                         # Цена
                         price = "0"
                         try:
-                            price_selectors = [
-                                "[data-marker='item-price']",
-                                "[itemprop='price']",
-                                "span.price-text"
-                            ]
-                            
-                            for selector in price_selectors:
-                                elements = title.find_elements(By.CSS_SELECTOR, selector)
-                                if elements:
-                                    price_text = elements[0].text
-                                    price = ''.join(filter(str.isdigit, price_text))
-                                    break
+                            elements = selector_cache.find(APARTMENTS_SCOPE, "price", LocatorAvito.APARTMENT_PRICE, find_in_card)
+                            if elements:
+                                price = ''.join(filter(str.isdigit, elements[0].text))
                         except Exception:
                             pass
                         
@@ -409,12 +622,187 @@ class AvitoParse:
                 except Exception as e:
                     logger.error(f"Ошибка при парсинге объявления: {e}")
             
+        except IPBlockedException:
+            raise
         except Exception as e:
             logger.error(f"Ошибка при парсинге страницы {url}: {e}")
         
         logger.info(f"Найдено объявлений на странице: {len(ads_data)}")
         return ads_data
 
+    def _ensure_driver(self) -> None:
+        """Берёт браузер из пула при первом обращении к Chrome на текущем URL."""
+        if self._browser is None:
+            self._browser = self._browser_stack.enter_context(
+                get_browser_pool().browser(UserAgentRotator().get_next, **self._browser_options)
+            )
+            self.driver = self._browser.sb
+
+    def _setup_http_session(self, proxy: str | None) -> None:
+        self.session.headers.update({
+            "User-Agent": UserAgentRotator().get_next(),
+            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+            "Accept-Language": "ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7",
+        })
+        self.session.proxies = requests_proxies(proxy)
+
+    @staticmethod
+    def _find_catalog_items(state: Any) -> Optional[List[Dict]]:
+        """Ищет в состоянии страницы список объявлений каталога (catalog.items)."""
+        stack = [state]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, dict):
+                catalog = node.get("catalog")
+                if isinstance(catalog, dict) and isinstance(catalog.get("items"), list):
+                    return catalog["items"]
+                stack.extend(node.values())
+            elif isinstance(node, list):
+                stack.extend(node)
+        return None
+
+    def _extract_state_items(self, html: str) -> Optional[List[Dict]]:
+        """Достаёт объявления из встроенного JSON-состояния листинга, None - если его нет."""
+        candidates = [unquote(m.group(1)) for m in INITIAL_DATA_RE.finditer(html)]
+        candidates += [unescape(m.group(1)) for m in MFE_STATE_RE.finditer(html)]
+        for raw in candidates:
+            try:
+                items = self._find_catalog_items(json.loads(raw))
+            except (json.JSONDecodeError, ValueError):
+                continue
+            if items is not None:
+                return items
+        return None
+
+    @staticmethod
+    def _state_item_to_ad(item: Dict) -> Optional[Dict]:
+        """Приводит объявление из JSON-состояния к словарю, как у __parse_page."""
+        ad_id, title, url_path = item.get("id"), item.get("title"), item.get("urlPath")
+        if not ad_id or not title or not url_path:
+            return None
+        
+        price = (item.get("priceDetailed") or {}).get("value")
+        ad = {
+            "name": title,
+            "description": item.get("description") or "",
+            "url": AVITO_BASE_URL + url_path if url_path.startswith("/") else url_path,
+            "price": str(price) if price else "0",
+            "id": str(ad_id),
+        }
+        images = item.get("images") or []
+        if images and isinstance(images[0], dict) and images[0]:
+            # Размеры идут по возрастанию, берётся самый крупный
+            ad["listing_image_url"] = list(images[0].values())[-1]
+        return ad
+
+    def _parse_page_http(self, url: str) -> Optional[List[Dict]]:
+        """Разбирает страницу листинга без браузера.
+
+        Возвращает None, если нужно перейти на Selenium: запрос не удался,
+        Авито ограничил доступ или на странице нет JSON-состояния каталога.
+        После блокировки HTTP-путь до конца сканирования не используется.
+        """
+        if not self.http_fast_path or self._http_blocked:
+            return None
+        if "&s=" not in url:
+            url += "&s=104"
+        
+        limiter = self._rate_limiter()
+        limiter.acquire(self.stop_event)
+        try:
+            response = self.session.get(url, timeout=15)
+        except requests.RequestException as e:
+            logger.warning(f"HTTP-запрос листинга не удался, перехожу на браузер: {e}")
+            get_proxy_pool().report_failure(self._current_proxy)
+            return None
+        
+        if response.status_code in (403, 429) or "Доступ ограничен" in response.text:
+            logger.warning(f"Авито ограничил доступ по HTTP (код {response.status_code}), перехожу на браузер")
+            limiter.penalize()
+            get_proxy_pool().report_block(self._current_proxy)
+            self._http_blocked = True
+            return None
+        limiter.reward()
+        if response.status_code != 200:
+            logger.warning(f"Код ответа листинга {response.status_code}, перехожу на браузер")
+            return None
+        get_proxy_pool().report_success(self._current_proxy, response.elapsed.total_seconds())
+        
+        items = self._extract_state_items(response.text)
+        if items is None:
+            logger.info(f"В листинге нет JSON-состояния каталога, перехожу на браузер: {url}")
+            return None
+        
+        ads = [ad for ad in map(self._state_item_to_ad, items) if ad]
+        self.current_scan_ads.update(ad["id"] for ad in ads)
+        logger.info(f"Найдено объявлений на странице (HTTP): {len(ads)}")
+        return ads
+
+    def __extract_cards_js(self, is_apartments_page: bool) -> List[Dict]:
+        """Разбирает все карточки страницы за один вызов execute_script.
+
+        При ошибке или пустом результате возвращает пустой список, и
+        __parse_page переходит к поэлементному разбору.
+        """
+        apartment_selectors = self._apartment_selectors()
+        if is_apartments_page:
+            fields = {
+                field: selector_cache.ordered(APARTMENTS_SCOPE, field, selectors)
+                for field, selectors in apartment_selectors.items()
+            }
+        else:
+            fields = {
+                "name": (LocatorAvito.NAME[1],),
+                "description": (LocatorAvito.DESCRIPTIONS[1],),
+                "url": (LocatorAvito.URL[1],),
+                "price": (LocatorAvito.PRICE[1],),
+            }
+        config = {
+            "apartments": is_apartments_page,
+            "titles": LocatorAvito.TITLES[1],
+            "otherGeo": LocatorAvito.OTHER_GEO[1],
+            **fields,
+        }
+        try:
+            result = json.loads(self.driver.execute_script(EXTRACT_CARDS_JS, config) or "{}")
+        except Exception as e:
+            logger.warning(f"JS-разбор страницы не удался, перехожу к поэлементному: {e}")
+            return []
+        if is_apartments_page:
+            for field, used in (result.get("used") or {}).items():
+                if field in apartment_selectors:
+                    selector_cache.record(APARTMENTS_SCOPE, field, apartment_selectors[field], used)
+        return result.get("ads") or []
+
+    @staticmethod
+    def _apartment_selectors() -> Dict[str, Tuple[str, ...]]:
+        return {
+            "cards": LocatorAvito.APARTMENT_CARDS,
+            "name": LocatorAvito.APARTMENT_NAME,
+            "description": LocatorAvito.APARTMENT_DESCRIPTION,
+            "url": LocatorAvito.APARTMENT_URL,
+            "price": LocatorAvito.APARTMENT_PRICE,
+        }
+
+    @staticmethod
+    def _all_known(ads: List[Dict], new_ads: List[Dict]) -> bool:
+        """Страница целиком из известных объявлений или в ней EARLY_STOP_KNOWN_STREAK известных подряд."""
+        if not ads:
+            return False
+        new_ids = {ad["id"] for ad in new_ads}
+        streak = 0
+        for ad in ads:
+            streak = 0 if ad["id"] in new_ids else streak + 1
+            if streak >= EARLY_STOP_KNOWN_STREAK:
+                return True
+        return streak == len(ads)
+
+    @staticmethod
+    def _date_sorted(url: str) -> bool:
+        """Листинг будет открыт с сортировкой по дате (см. __get_url)."""
+        sort = parse_qs(urlparse(url).query).get("s")
+        return sort is None or sort == [DATE_SORT]
+
     def __navigate_pages(self, base_url: str, num_pages: int) -> List[str]:
         urls = [base_url]
         
@@ -456,36 +844,179 @@ class AvitoParse:
             
         return price_ok and kw_ok
     
-    def _process_new_ad(self, data: dict) -> None:
-        if self.max_views == 0:
-            try:
-                full_data = self.__parse_full_page(data)
-                
-                if "views" in full_data:
-                    views_text = full_data.get("views", "0")
-                    views = int(''.join(filter(str.isdigit, views_text)))
-                    
-                    logger.info(f"Объявление {data['id']} - просмотры: {views}")
-                    
-                    if views == 0:
-                        self.send_notification_with_photo(full_data)
-                    else:
-                        logger.info(f"Пропускаем объявление {data['id']} - есть просмотры ({views})")
-                else:
-                    logger.warning(f"Не удалось получить информацию о просмотрах для {data['id']}")
-                    self.send_notification_with_photo(full_data)
-            except Exception as e:
-                logger.error(f"Ошибка при обработке объявления {data['id']}: {e}")
+    def _notify_new_ad(self, full_data: dict) -> None:
+        """Отправляет уведомление по объявлению с уже загруженной карточкой."""
+        if self.max_views != 0:
+            self.send_notification_with_photo(full_data)
+            return
+        
+        if "views" in full_data:
+            views_text = full_data.get("views", "0")
+            views = int(''.join(filter(str.isdigit, views_text)))
+            
+            logger.info(f"Объявление {full_data['id']} - просмотры: {views}")
+            
+            if views == 0:
+                self.send_notification_with_photo(full_data)
+            else:
+                logger.info(f"Пропускаем объявление {full_data['id']} - есть просмотры ({views})")
         else:
-            if self.need_more_info:
+            logger.warning(f"Не удалось получить информацию о просмотрах для {full_data['id']}")
+            self.send_notification_with_photo(full_data)
+
+    def _enrich_ad(self, data: dict, free_browsers: "SimpleQueue[PooledBrowser]") -> dict:
+        """Загружает карточку объявления в свободном браузере стадии обогащения."""
+        if self._apply_cached_detail(data):
+            return data
+        with _host_slot(data["url"]):
+            try:
+                browser = free_browsers.get_nowait()
+            except Empty:
+                browser = get_browser_pool().checkout(UserAgentRotator().get_next, **self._browser_options)
+            try:
+                return self.__parse_full_page(data, browser)
+            finally:
+                free_browsers.put(browser)
+
+    def _notify_new_ads(self, ads: List[Dict], done: Set[str]) -> None:
+        """Уведомляет о новых объявлениях, при необходимости загружая их карточки.
+
+        Карточки открываются параллельно в detail_workers браузерах из пула
+        (не больше DETAIL_PAGE_HOST_LIMIT на хост для всего процесса),
+        уведомление уходит сразу после загрузки своей карточки. В done
+        попадают ID обработанных объявлений; карточки, не загруженные
+        из-за блокировки IP, остаются вне done до следующего сканирования.
+        """
+        if not ads:
+            return
+        if self.max_views != 0 and not self.need_more_info:
+            for ad_data in ads:
+                self.send_notification_with_photo(ad_data)
+                done.add(ad_data["id"])
+            return
+        
+        free_browsers: "SimpleQueue[PooledBrowser]" = SimpleQueue()
+        # Браузер листинга простаивает, пока грузятся карточки, - он тоже в работе
+        if self._browser is not None:
+            free_browsers.put(self._browser)
+        
+        blocked: IPBlockedException | None = None
+        try:
+            with ThreadPoolExecutor(
+                max_workers=min(self.detail_workers, len(ads)),
+                thread_name_prefix="avito-detail",
+            ) as executor:
+                futures = {executor.submit(self._enrich_ad, ad_data, free_browsers): ad_data for ad_data in ads}
+                for future in as_completed(futures):
+                    ad_data = futures[future]
+                    try:
+                        full_data = future.result()
+                    except IPBlockedException as e:
+                        # Остальные карточки после блокировки отказывают сразу, без загрузки
+                        blocked = e
+                        continue
+                    except Exception as e:
+                        logger.error(f"Ошибка при загрузке карточки объявления {ad_data['id']}: {e}")
+                        if self.max_views != 0:
+                            self.send_notification_with_photo(ad_data)
+                        done.add(ad_data["id"])
+                        continue
+                    self._notify_new_ad(full_data)
+                    done.add(ad_data["id"])
+        finally:
+            while True:
                 try:
-                    full_data = self.__parse_full_page(data)
-                    self.send_notification_with_photo(full_data)
-                except Exception as e:
-                    logger.error(f"Ошибка при получении изображения для {data['id']}: {e}")
-                    self.send_notification_with_photo(data)
-            else:
-                self.send_notification_with_photo(data)
+                    browser = free_browsers.get_nowait()
+                except Empty:
+                    break
+                if browser is not self._browser:
+                    get_browser_pool().checkin(browser)
+        if blocked:
+            raise blocked
+
+    @staticmethod
+    def _record_key(data: dict) -> Optional[Tuple[int, int]]:
+        try:
+            price_digits = ''.join(filter(str.isdigit, str(data.get("price") or "")))
+            return int(data["id"]), int(price_digits) if price_digits else 0
+        except (ValueError, TypeError):
+            return None
+
+    def _process_new_ads(self, new_ads: List[Dict]) -> None:
+        """Обрабатывает новые объявления пачкой URL.
+
+        Новизна определяется историей сканирования URL этого поиска, а не
+        общей таблицей viewed: её ключ (id, price) не знает о поиске и
+        чате, и объявление, отправленное одному поиску, пропадало бы у
+        остальных. Объявление из нескольких URL поиска уведомляется один раз
+        за сканирование.
+        """
+        if not new_ads:
+            return
+        
+        to_notify = []
+        for ad_data in new_ads:
+            ad_id = ad_data["id"]
+            self.total_new_ads += 1
+            logger.info(f"Найдено новое объявление: {ad_data['name']} (ID: {ad_id})")
+            
+            if ad_id in self.current_scan_notified:
+                continue
+            if self._filter_ad(ad_data):
+                to_notify.append(ad_data)
+        
+        done: Set[str] = set()
+        try:
+            self._notify_new_ads(to_notify, done)
+        finally:
+            self.current_scan_notified |= done
+            # В историю сканирования попадают только обработанные объявления:
+            # остальные (блокировка IP посреди пачки) придут новыми в следующий раз
+            pending = {ad["id"] for ad in to_notify} - done
+            if pending:
+                logger.warning(f"Не обработано из-за блокировки: {len(pending)} новых объявлений, повтор при следующем сканировании")
+                self.current_scan_ads -= pending
+                for ads_ids in self.current_scan_by_url.values():
+                    ads_ids -= pending
+
+    def _record_prices(self, url: str, ads: List[Dict]) -> Dict[str, Tuple[int, int]]:
+        """Записывает цены объявлений в историю, возвращает снижения {ad_id: (было, стало)}."""
+        prices = [(key[0], key[1]) for key in map(self._record_key, ads) if key]
+        try:
+            drops = self.db_handler.record_prices("avito", url, prices)
+        except Exception as e:
+            logger.error(f"Ошибка при записи истории цен: {e}")
+            return {}
+        return {ad_id: (old, new) for ad_id, old, new in drops}
+
+    def _index_ads(self, ads: List[Dict]) -> None:
+        """Передаёт тексты объявлений в полнотекстовый индекс одной пачкой."""
+        rows = [
+            (ad["id"], ad.get("name", ""), ad.get("description", ""), ad.get("url", ""), key[1])
+            for ad in ads if (key := self._record_key(ad))
+        ]
+        try:
+            self.db_handler.index_ads("avito", rows)
+        except Exception as e:
+            logger.error(f"Ошибка при индексации объявлений: {e}")
+
+    def _process_price_drops(self, ads: List[Dict], drops: Dict[str, Tuple[int, int]], new_ads: List[Dict]) -> None:
+        """Уведомляет о снижении цены уже известных объявлений, прошедших фильтры."""
+        # При поиске только новых объявлений (без просмотров) старые не присылаются
+        if not drops or self.max_views == 0:
+            return
+        
+        new_ids = {str(ad["id"]) for ad in new_ads}
+        for ad_data in ads:
+            ad_id = str(ad_data["id"])
+            if ad_id not in drops or ad_id in new_ids or ad_id in self.current_scan_price_drops:
+                continue
+            if not self._filter_ad(ad_data):
+                continue
+            self.current_scan_price_drops.add(ad_id)
+            old_price, new_price = drops[ad_id]
+            logger.info(f"Снижение цены: {ad_data['name']} (ID: {ad_id}) {old_price} -> {new_price}")
+            self.send_notification_with_photo({**ad_data, "old_price": old_price})
 
     def _extract_image_from_listing(self, data: dict) -> Optional[str]:
         try:
@@ -509,28 +1040,50 @@ class AvitoParse:
         
         return None
 
-    def __parse_full_page(self, data: dict) -> dict:
+    @staticmethod
+    def _apply_cached_detail(data: dict) -> bool:
+        """Дополняет объявление полями карточки из кэша, если они там есть."""
+        cached = _detail_cache.get(str(data["id"]))
+        if cached is None:
+            return False
+        data.update(cached)
+        logger.debug(f"Карточка объявления {data['id']} взята из кэша")
+        return True
+
+    def __parse_full_page(self, data: dict, browser: PooledBrowser, attempt: int = 0) -> dict:
+        # Карточку могла загрузить другая задача, пока эта меняла IP
+        if self._apply_cached_detail(data):
+            return data
+        
+        driver = browser.sb
         try:
-            self.driver.open(data["url"])
+            self._check_blocked()
+            browser.count_page()
+            limiter = self._rate_limiter()
+            limiter.acquire(self.stop_event)
+            driver.open(data["url"])
             
-            if "Доступ ограничен" in self.driver.get_title():
-                self.ip_block()
-                return self.__parse_full_page(data)
+            if "Доступ ограничен" in driver.get_title():
+                limiter.penalize()
+                self.ip_block(browser, attempt)
+                return self.__parse_full_page(data, browser, attempt + 1)
 
             try:
-                self.driver.wait_for_element_visible(LocatorAvito.TOTAL_VIEWS[1], by="css selector", timeout=10)
+                driver.wait_for_element_visible(LocatorAvito.TOTAL_VIEWS[1], by="css selector", timeout=10)
             except Exception:
-                if "Доступ ограничен" in self.driver.get_title():
-                    self.ip_block()
-                    return self.__parse_full_page(data)
+                if "Доступ ограничен" in driver.get_title():
+                    limiter.penalize()
+                    self.ip_block(browser, attempt)
+                    return self.__parse_full_page(data, browser, attempt + 1)
                 return data
+            limiter.reward()
 
             try:
-                if self.driver.find_elements(LocatorAvito.GEO[1], by="css selector"):
-                    data["geo"] = self.driver.find_element(LocatorAvito.GEO[1], by="css selector").text.lower()
+                if driver.find_elements(LocatorAvito.GEO[1], by="css selector"):
+                    data["geo"] = driver.find_element(LocatorAvito.GEO[1], by="css selector").text.lower()
                     
-                if self.driver.find_elements(LocatorAvito.TOTAL_VIEWS[1], by="css selector"):
-                    views_text = self.driver.find_element(LocatorAvito.TOTAL_VIEWS[1], by="css selector").text
+                if driver.find_elements(LocatorAvito.TOTAL_VIEWS[1], by="css selector"):
+                    views_text = driver.find_element(LocatorAvito.TOTAL_VIEWS[1], by="css selector").text
                     data["views"] = views_text.split()[0] if views_text else "0"
                     
                 try:
@@ -542,7 +1095,7 @@ class AvitoParse:
                     ]
                     
                     for selector in img_selectors:
-                        img_elements = self.driver.find_elements(By.CSS_SELECTOR, selector)
+                        img_elements = driver.find_elements(By.CSS_SELECTOR, selector)
                         if img_elements:
                             for img in img_elements:
                                 src = img.get_attribute("src")
@@ -554,7 +1107,7 @@ class AvitoParse:
                                 break
                     
                     if "image_url" not in data:
-                        slides = self.driver.find_elements(*LocatorAvito.GALLERY_SLIDES)
+                        slides = driver.find_elements(*LocatorAvito.GALLERY_SLIDES)
                         for slide in slides:
                             style = slide.get_attribute("style")
                             if style and "url(" in style:
@@ -565,9 +1118,13 @@ class AvitoParse:
                                     break
                 except Exception as e:
                     logger.debug(f"Не удалось получить URL изображения: {e}")
+                
+                _detail_cache.put(str(data["id"]), data)
                     
             except Exception as e:
                 logger.error(f"Ошибка при парсинге страницы объявления: {e}")
+        except IPBlockedException:
+            raise
         except Exception as e:
             logger.error(f"Ошибка при открытии страницы объявления {data['url']}: {e}")
             
@@ -581,28 +1138,14 @@ class AvitoParse:
         if not self.proxy or not self.proxy_change_url:
             return False
         
+        proxy = self._current_proxy or next(iter(parse_proxy_list(self.proxy)), None)
+        if not proxy:
+            logger.error(f"Неверный формат прокси: {self.proxy}")
+            return False
+        
         try:
             session = requests.Session()
-            
-            if ":" in self.proxy and "@" in self.proxy:
-                proxies = {
-                    "http": f"http://{self.proxy}",
-                    "https": f"http://{self.proxy}"
-                }
-            elif self.proxy.count(":") == 3:
-                parts = self.proxy.split(":")
-                if len(parts) == 4:
-                    host, port, username, password = parts
-                    formatted_proxy = f"{username}:{password}@{host}:{port}"
-                    proxies = {
-                        "http": f"http://{formatted_proxy}",
-                        "https": f"http://{formatted_proxy}"
-                    }
-            else:
-                logger.error(f"Неверный формат прокси: {self.proxy}")
-                return False
-                
-            session.proxies.update(proxies)
+            session.proxies.update(requests_proxies(proxy))
             
             try:
                 original_response = session.get("https://api.ipify.org", timeout=15)
@@ -662,12 +1205,18 @@ class AvitoParse:
     def get_statistics(self) -> Dict[str, int]:
         return {
             "total_new_ads": self.total_new_ads,
-            "total_notified_ads": self.total_notified_ads
+            "total_notified_ads": self.total_notified_ads,
+            "pages_saved": self.total_pages_saved
         }
 
     def parse(self) -> None:
         try:
             self.current_scan_ads = set()
+            self.current_scan_by_url = {}
+            self.current_scan_notified = set()
+            self.current_scan_price_drops = set()
+            self._http_blocked = False
+            self.blocked_until = 0.0
             
             for base_url in self.url_list:
                 if self.stop_event.is_set():
@@ -676,62 +1225,89 @@ class AvitoParse:
                 try:
                     page_urls = self.__navigate_pages(base_url, self.count)
                     
-                    current_proxy = None
-                    if self.proxy:
-                        proxy_list = [p.strip() for p in self.proxy.split(';') if p.strip()]
-                        if proxy_list:
-                            selected_proxy = random.choice(proxy_list)
-                            current_proxy = self._normalize_proxy(selected_proxy)
-                            logger.info(f"Используется прокси: {current_proxy}")
+                    # Лучший по статистике прокси из списка, не находящийся в карантине
+                    current_proxy = get_proxy_pool().choose(parse_proxy_list(self.proxy))
+                    if current_proxy:
+                        logger.info(f"Используется прокси: {current_proxy}")
                     
-                    ua_rotator = UserAgentRotator()
-                    with SB(
+                    self._current_proxy = current_proxy
+                    self._check_blocked()
+                    self._setup_http_session(current_proxy)
+                    # Тёплый браузер из пула вместо запуска Chrome на каждый URL;
+                    # выдаётся при первом обращении к Chrome и возвращается в конце URL
+                    self._browser_options = dict(
                         uc=False,
                         headed=bool(self.debug_mode),
                         headless2=not bool(self.debug_mode),
                         page_load_strategy="eager",
                         block_images=False,
-                        agent=ua_rotator.get_next(),
                         proxy=current_proxy,
                         sjw=bool(self.fast_speed),
-                    ) as self.driver:
+                        blocked_urls=self.blocked_urls,
+                    )
+                    early_stop = self.early_stop and not self.first_run and self._date_sorted(base_url)
+                    with ExitStack() as self._browser_stack:
                         all_ads = []
-                        for page_url in page_urls:
+                        new_ads = []
+                        for page_num, page_url in enumerate(page_urls, 1):
                             try:
                                 if self.stop_event.is_set():
                                     return
-                                page_ads = self.__parse_page(page_url)
+                                page_ads = self._parse_page_http(page_url)
+                                if page_ads is None:
+                                    page_ads = self.__parse_page(page_url)
                                 all_ads.extend(page_ads)
-                                time.sleep(random.randint(2, 4))
+                                
+                                if not self.first_run:
+                                    page_new_ads = self._select_new_ads(page_ads)
+                                    new_ads.extend(page_new_ads)
+                                    if early_stop and page_num < len(page_urls) and self._all_known(page_ads, page_new_ads):
+                                        saved = len(page_urls) - page_num
+                                        self.total_pages_saved += saved
+                                        logger.info(f"Страница {page_num} из известных объявлений, дальше новых нет. Пропущено страниц: {saved}")
+                                        break
                             except StopEventException:
                                 logger.info("Парсинг остановлен по запросу")
                                 return
+                            except IPBlockedException:
+                                raise
                             except Exception as e:
                                 logger.error(f"Ошибка при обработке страницы {page_url}: {e}")
                         
+                        self.current_scan_by_url[base_url] = {ad["id"] for ad in all_ads}
+                        price_drops = self._record_prices(base_url, all_ads)
+                        self._index_ads(all_ads)
+                        
                         if not self.first_run:
-                            for ad_data in all_ads:
-                                ad_id = ad_data["id"]
-                                if ad_id not in self.known_ads:
-                                    self.total_new_ads += 1
-                                    logger.info(f"Найдено новое объявление: {ad_data['name']} (ID: {ad_id})")
-                                    
-                                    if self._filter_ad(ad_data):
-                                        self._process_new_ad(ad_data)
+                            self._process_new_ads(new_ads)
+                            self._process_price_drops(all_ads, price_drops, new_ads)
                                         
+                except IPBlockedException:
+                    raise
                 except Exception as e:
                     logger.error(f"Ошибка при обработке URL {base_url}: {e}")
+                finally:
+                    # Браузер вернулся в пул вместе с ExitStack
+                    self._browser = None
+                    self.driver = None
             
-            self.known_ads.update(self.current_scan_ads)
             self._save_scan_results()
+            logger.debug(f"Доля попаданий кэша селекторов: {selector_cache.hit_rates()}")
             
             if self.first_run:
                 logger.info(f"Первичное сканирование завершено. Найдено объявлений: {len(self.current_scan_ads)}. При следующем запуске будут отображаться только новые объявления.")
             else:
-                logger.info(f"Сканирование завершено. Найдено {self.total_new_ads} новых объявлений, отправлено {self.total_notified_ads} уведомлений.")
+                logger.info(f"Сканирование завершено. Найдено {self.total_new_ads} новых объявлений, отправлено {self.total_notified_ads} уведомлений, пропущено страниц: {self.total_pages_saved}.")
             
+        except IPBlockedException as e:
+            # Поток не ждёт снятия блокировки: задачу откладывает планировщик по blocked_until
+            self.blocked_until = e.blocked_until
+            logger.warning(f"Сканирование прервано: {e}")
+            self._save_scan_results()
         except Exception as e:
             logger.error(f"Общая ошибка при парсинге: {e}")
         finally:
+            self._browser = None
+            self._browser_stack = None
             self.stop_event.clear()
             logger.info("Парсинг завершен")
\ No newline at end of file
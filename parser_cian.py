@@ -8,14 +8,26 @@ import traceback
 import os
 from datetime import datetime
 from typing import Dict, List, Optional, Set, Tuple, Any, Union
+from urllib.parse import parse_qs, urlparse
 
 import requests
 from bs4 import BeautifulSoup
 from loguru import logger
 from custom_exception import StopEventException
+from bloom_filter import get_seen_filter
 from db_service import SQLiteDBHandler
+from proxy_pool import get_proxy_pool, parse_proxy_list, requests_proxies
+from rate_limiter import get_rate_limiter
+from selector_cache import selector_cache
+from storage import StorageBackend
 
 MAX_PHOTOS = 3
+# Сортировка по дате: за страницей из уже известных объявлений новых быть не может
+DATE_SORT = "creation_date_desc"
+# Столько известных объявлений подряд на странице останавливают пагинацию
+EARLY_STOP_KNOWN_STREAK = 10
+# Тип страницы в кэше селекторов для разбора HTML-карточек
+HTML_SCOPE = "cian/html"
 
 class CianParse:
     def __init__(
@@ -34,7 +46,9 @@ class CianParse:
         proxy: str | None = None,
         proxy_change_url: str | None = None,
         stop_event: threading.Event | None = None,
-        first_run: bool = False
+        first_run: bool = False,
+        db_handler: StorageBackend | None = None,
+        early_stop: bool = True
     ) -> None:
         self.url_list = url
         self.keys_word = keysword_list or None
@@ -50,22 +64,30 @@ class CianParse:
         self.proxy = proxy
         self.proxy_change_url = proxy_change_url
         self.first_run = first_run
+        # Пагинация прекращается на странице из уже известных объявлений
+        self.early_stop = early_stop
 
         self.url: str | None = None
         self.stop_event = stop_event or threading.Event()
         
-        self.db_handler = SQLiteDBHandler()
+        self.db_handler = db_handler or SQLiteDBHandler()
+        self.seen_filter = get_seen_filter("cian", self.db_handler)
         
-        self.known_ads: Set[str] = set()
         self.current_scan_ads: Set[str] = set()
+        self.current_scan_by_url: Dict[str, Set[str]] = {}
+        # ID объявлений, о снижении цены которых уже сообщено в этом сканировании:
+        # объявление из нескольких URL поиска даёт одно уведомление
+        self.current_scan_price_drops: Set[str] = set()
         
         self.total_new_ads: int = 0
         self.total_notified_ads: int = 0
+        self.total_pages_saved: int = 0
         
         self.session = requests.Session()
+        # Прокси текущего URL из списка в настройках (через ;), выбранный по статистике
+        self._current_proxy: str | None = None
+        self._select_proxy()
         self.update_headers()
-        
-        self._load_known_ads()
 
     def update_headers(self):
         try:
@@ -96,38 +118,48 @@ class CianParse:
         }
         logger.info(f"Используется User-Agent: {user_agent}")
         
-        if self.proxy:
-            logger.info(f"Используется прокси: {self.proxy}")
-            self.session.proxies = {"http": self.proxy, "https": self.proxy}
+        if self._current_proxy:
+            logger.info(f"Используется прокси: {self._current_proxy}")
+        self.session.proxies = requests_proxies(self._current_proxy)
 
-    def _load_known_ads(self):
-        for url in self.url_list:
-            scan_ids = self.db_handler.get_cian_scan_ids(url)
-            if scan_ids:
-                self.known_ads.update(scan_ids)
-        
-        cian_viewed = self.db_handler.list_all_cian_records()
-        for record in cian_viewed:
-            if record and record[0]:
-                self.known_ads.add(record[0])
-        
-        logger.info(f"ЦИАН: Загружено {len(self.known_ads)} известных объявлений из БД")
+    def _select_proxy(self) -> None:
+        """Берёт лучший по статистике прокси, не находящийся в карантине."""
+        self._current_proxy = get_proxy_pool().choose(parse_proxy_list(self.proxy))
+        self.session.proxies = requests_proxies(self._current_proxy)
+
+    def _select_new_ads(self, ads: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Отбирает объявления, которых нет ни в истории этих URL, ни среди отправленных.
+
+        Bloom-фильтр сразу отсекает заведомо новые ID, в БД проверяются
+        только возможные совпадения.
+        """
+        maybe_known = [ad['id'] for ad in ads if self.seen_filter.might_contain(ad['id'])]
+        known = self.db_handler.known_ad_ids("cian", self.url_list, maybe_known, include_viewed=True)
+        return [ad for ad in ads if ad['id'] not in known]
     
     def _save_scan_results(self):
-        all_ads = self.known_ads.union(self.current_scan_ads)
-        for url in self.url_list:
-            self.db_handler.save_cian_scan_ids(url, list(all_ads))
+        for url, ads_ids in self.current_scan_by_url.items():
+            self.db_handler.save_cian_scan_ids(url, ads_ids)
+        self.seen_filter.add_many(self.current_scan_ads)
         
-        logger.info(f"ЦИАН: Сохранено {len(all_ads)} объявлений в БД")
+        logger.info(f"ЦИАН: Сохранено {len(self.current_scan_ads)} объявлений в БД")
     
     def get_page(self, url: str) -> Optional[str]:
         self.update_headers()
         
+        # Общий для всех задач темп запросов к ЦИАН через этот прокси
+        limiter = get_rate_limiter(url, self._current_proxy)
+        proxy_pool = get_proxy_pool()
         try:
-            time.sleep(random.uniform(2, 4))
+            limiter.acquire(self.stop_event)
             
             response = self.session.get(url, headers=self.headers, timeout=15)
+            if response.status_code in (403, 429):
+                limiter.penalize()
+                proxy_pool.report_block(self._current_proxy)
             response.raise_for_status()
+            limiter.reward()
+            proxy_pool.report_success(self._current_proxy, response.elapsed.total_seconds())
             
             if self.debug_mode:
                 with open('last_response.html', 'w', encoding='utf-8') as f:
@@ -137,6 +169,8 @@ class CianParse:
             return response.text
         except requests.RequestException as e:
             logger.error(f"Ошибка при запросе: {e}")
+            if not isinstance(e, requests.HTTPError):
+                proxy_pool.report_failure(self._current_proxy)
             
             if self.proxy and ("timeout" in str(e).lower() or "connection" in str(e).lower()):
                 logger.warning("Таймаут или проблема с соединением. Попытка смены IP...")
@@ -495,15 +529,8 @@ class CianParse:
                 'div[class*="--item--"]'
             ]
             
-            cards = []
-            used_selector = None
-            
-            for selector in card_selectors:
-                cards = soup.select(selector)
-                if cards:
-                    used_selector = selector
-                    logger.info(f"Найдены объявления по селектору: {selector}, количество: {len(cards)}")
-                    break
+            # Селекторы каждого поля перебираются, начиная с сработавшего в прошлый раз
+            cards = selector_cache.find(HTML_SCOPE, "cards", card_selectors, soup.select) or []
             
             if not cards:
                 logger.warning("Не удалось найти карточки объявлений по известным селекторам")
@@ -545,11 +572,9 @@ class CianParse:
                         'div.c6e8ba5398--title--V_HFz'
                     ]
                     
-                    for selector in title_selectors:
-                        title_element = card.select_one(selector)
-                        if title_element:
-                            title = title_element.text.strip()
-                            break
+                    title_element = selector_cache.find(HTML_SCOPE, "title", title_selectors, card.select_one)
+                    if title_element:
+                        title = title_element.text.strip()
                     
                     if not title:
                         title_parts = []
@@ -581,11 +606,9 @@ class CianParse:
                         'span[data-testid="price-term"]'
                     ]
                     
-                    for selector in price_selectors:
-                        price_element = card.select_one(selector)
-                        if price_element:
-                            price = price_element.text.strip()
-                            break
+                    price_element = selector_cache.find(HTML_SCOPE, "price", price_selectors, card.select_one)
+                    if price_element:
+                        price = price_element.text.strip()
                     
                     if not price:
                         price = "Цена не указана"
@@ -599,17 +622,13 @@ class CianParse:
                         'p.c6e8ba5398--description-text--YNhai'
                     ]
                     
-                    for selector in description_selectors:
-                        description_element = card.select_one(selector)
-                        if description_element:
-                            description = description_element.text.strip()
-                            break
+                    description_element = selector_cache.find(HTML_SCOPE, "description", description_selectors, card.select_one)
+                    if description_element:
+                        description = description_element.text.strip()
                     
                     if not description:
                         description = "Для получения полного описания откройте объявление."
                     
-                    photos = []
-                    
                     photo_selectors = [
                         'img[data-testid="offer-card-photo"]',
                         'img.c6e8ba5398--img--pLTgk',
@@ -619,16 +638,17 @@ class CianParse:
                         'img[src*="cian.ru"]'
                     ]
                     
-                    for selector in photo_selectors:
-                        photo_elements = card.select(selector)
-                        for photo in photo_elements:
+                    def card_photos(selector: str) -> List[str]:
+                        urls = []
+                        for photo in card.select(selector):
                             if photo.has_attr('src'):
                                 img_url = photo['src']
                                 img_url = re.sub(r'w=\d+&h=\d+', '', img_url)
                                 img_url = re.sub(r'resize=\d+x\d+', '', img_url)
-                                photos.append(img_url)
-                        if photos:
-                            break
+                                urls.append(img_url)
+                        return urls
+                    
+                    photos = selector_cache.find(HTML_SCOPE, "photos", photo_selectors, card_photos) or []
                     
                     if not photos:
                         for element in card.select('[style*="background-image"]'):
@@ -690,10 +710,10 @@ class CianParse:
             
         return price_ok and kw_ok
 
-    def send_notification(self, data: dict):
+    def send_notification(self, data: dict) -> bool:
         if not self.tg_token or not self.chat_id:
             logger.info("Не удалось отправить уведомление: не настроены параметры")
-            return
+            return False
 
         try:
             search_title = f"🏙️ ЦИАН - {self.job_name}" if self.job_name else "🏙️ ЦИАН"
@@ -702,7 +722,10 @@ class CianParse:
             
             caption.append(f"*{search_title}*")
             caption.append(f"💡 *{data.get('title', '-')}*")
-            caption.append(f"💰 {data.get('price', 'Цена не указана')}")
+            price_line = f"💰 {data.get('price', 'Цена не указана')}"
+            if old_price := data.get('old_price'):
+                price_line += f" 📉 было {old_price:,} ₽".replace(",", " ")
+            caption.append(price_line)
             caption.append(f"🔗 [Ссылка на объявление]({data.get('link', '')})")
             
             if description := data.get('description'):
@@ -758,25 +781,90 @@ class CianParse:
             if response.status_code == 200:
                 logger.info(f"Отправлено уведомление об объявлении: {data.get('title')} - {data.get('price')}")
                 self.total_notified_ads += 1
-                
-                try:
-                    price_str = data.get('price', '0')
-                    price_digits = ''.join(filter(str.isdigit, price_str))
-                    price = int(price_digits) if price_digits else 0
-                    
-                    self.db_handler.add_cian_record(
-                        ad_id=data.get('id', '0'),
-                        price=price,
-                        url=data.get('link', ''),
-                        title=data.get('title', '')
-                    )
-                except Exception as e:
-                    logger.error(f"Ошибка при сохранении объявления в БД: {e}")
+                return True
             else:
                 logger.error(f"Ошибка при отправке уведомления: {response.text}")
         except Exception as e:
             logger.error(f"Ошибка при отправке уведомления: {e}")
             logger.error(traceback.format_exc())
+        return False
+
+    @staticmethod
+    def _price_value(price_text: str) -> int:
+        price_digits = ''.join(filter(str.isdigit, price_text or ''))
+        return int(price_digits) if price_digits else 0
+
+    def _process_new_ads(self, new_ads: List[Dict[str, Any]]) -> None:
+        """Обрабатывает новые объявления страницы: одна проверка и одна запись в БД на страницу."""
+        if not new_ads:
+            return
+        
+        prices = {ad['id']: self._price_value(ad.get('price', '0')) for ad in new_ads}
+        try:
+            already_sent = self.db_handler.existing_cian_records(prices.items())
+        except Exception as e:
+            logger.error(f"Ошибка при проверке цены объявлений: {e}")
+            already_sent = set()
+        
+        notified_rows = []
+        for ad in new_ads:
+            ad_id = ad['id']
+            self.total_new_ads += 1
+            logger.info(f"Найдено новое объявление: {ad['title']} (ID: {ad_id})")
+            
+            if (ad_id, prices[ad_id]) in already_sent:
+                continue
+            if self._filter_ad(ad) and self.send_notification(ad):
+                notified_rows.append((ad_id, prices[ad_id], ad.get('link', ''), ad.get('title', '')))
+        
+        if notified_rows:
+            try:
+                self.db_handler.add_cian_records(notified_rows)
+            except Exception as e:
+                logger.error(f"Ошибка при сохранении объявлений в БД: {e}")
+
+    def _record_prices(self, url: str, ads: List[Dict[str, Any]]) -> Dict[str, Tuple[int, int]]:
+        """Записывает цены объявлений страницы в историю, возвращает снижения {ad_id: (было, стало)}."""
+        prices = [(ad['id'], self._price_value(ad.get('price', '0'))) for ad in ads]
+        try:
+            drops = self.db_handler.record_prices("cian", url, prices)
+        except Exception as e:
+            logger.error(f"Ошибка при записи истории цен: {e}")
+            return {}
+        return {ad_id: (old, new) for ad_id, old, new in drops}
+
+    def _index_ads(self, ads: List[Dict[str, Any]]) -> None:
+        """Передаёт тексты объявлений страницы в полнотекстовый индекс одной пачкой."""
+        rows = [
+            (ad['id'], ad.get('title', ''), ad.get('description', ''), ad.get('link', ''), self._price_value(ad.get('price', '0')))
+            for ad in ads
+        ]
+        try:
+            self.db_handler.index_ads("cian", rows)
+        except Exception as e:
+            logger.error(f"Ошибка при индексации объявлений: {e}")
+
+    def _process_price_drops(
+        self,
+        ads: List[Dict[str, Any]],
+        drops: Dict[str, Tuple[int, int]],
+        new_ads: List[Dict[str, Any]],
+    ) -> None:
+        """Уведомляет о снижении цены уже известных объявлений, прошедших фильтры."""
+        if not drops:
+            return
+        
+        new_ids = {ad['id'] for ad in new_ads}
+        for ad in ads:
+            ad_id = ad['id']
+            if ad_id not in drops or ad_id in new_ids or ad_id in self.current_scan_price_drops:
+                continue
+            if not self._filter_ad(ad):
+                continue
+            self.current_scan_price_drops.add(ad_id)
+            old_price, new_price = drops[ad_id]
+            logger.info(f"Снижение цены: {ad['title']} (ID: {ad_id}) {old_price} -> {new_price}")
+            self.send_notification({**ad, 'old_price': old_price})
 
     def check_stop_event(self) -> None:
         if self.stop_event.is_set():
@@ -792,9 +880,7 @@ class CianParse:
                 proxy_change_url = self.proxy_change_url
                 
             elif self.chat_id:
-                from db_service import SQLiteDBHandler
-                db = SQLiteDBHandler()
-                proxy_change_url = db.get_setting(self.chat_id, "proxy_change_url")
+                proxy_change_url = self.db_handler.get_setting(self.chat_id, "proxy_change_url")
         except Exception as e:
             logger.error(f"Ошибка при получении URL смены IP: {e}")
             return False
@@ -815,23 +901,7 @@ class CianParse:
             time.sleep(5)
             
             try:
-                test_session = requests.Session()
-                if ":" in self.proxy and "@" in self.proxy:
-                    test_session.proxies = {
-                        "http": f"http://{self.proxy}",
-                        "https": f"http://{self.proxy}"
-                    }
-                elif self.proxy.count(":") == 3:
-                    parts = self.proxy.split(":")
-                    if len(parts) == 4:
-                        host, port, username, password = parts
-                        formatted_proxy = f"{username}:{password}@{host}:{port}"
-                        test_session.proxies = {
-                            "http": f"http://{formatted_proxy}",
-                            "https": f"http://{formatted_proxy}"
-                        }
-                
-                self.session.proxies = test_session.proxies.copy()
+                self.session.proxies = requests_proxies(self._current_proxy)
                 
                 logger.info("Смена IP выполнена успешно")
                 return True
@@ -843,35 +913,68 @@ class CianParse:
             logger.error(f"Не удалось сменить IP: {err}")
             return False
 
+    @staticmethod
+    def _with_date_sort(url: str) -> str:
+        """Добавляет сортировку по дате, если в URL не задана своя."""
+        if "sort" in parse_qs(urlparse(url).query):
+            return url
+        separator = "&" if "?" in url else "?"
+        return f"{url}{separator}sort={DATE_SORT}"
+
+    @staticmethod
+    def _date_sorted(url: str) -> bool:
+        """Листинг отсортирован по дате: только тогда после известных объявлений новых нет."""
+        return parse_qs(urlparse(url).query).get("sort") == [DATE_SORT]
+
+    @staticmethod
+    def _all_known(ads: List[Dict[str, Any]], new_ads: List[Dict[str, Any]]) -> bool:
+        """Страница целиком из известных объявлений или в ней EARLY_STOP_KNOWN_STREAK известных подряд."""
+        if not ads:
+            return False
+        new_ids = {ad['id'] for ad in new_ads}
+        streak = 0
+        for ad in ads:
+            streak = 0 if ad['id'] in new_ids else streak + 1
+            if streak >= EARLY_STOP_KNOWN_STREAK:
+                return True
+        return streak == len(ads)
+
     def get_statistics(self) -> Dict[str, int]:
         return {
             "total_new_ads": self.total_new_ads,
-            "total_notified_ads": self.total_notified_ads
+            "total_notified_ads": self.total_notified_ads,
+            "pages_saved": self.total_pages_saved
         }
 
     def parse(self) -> None:
         try:
             self.current_scan_ads = set()
+            self.current_scan_by_url = {}
+            self.current_scan_price_drops = set()
             
             for base_url in self.url_list:
                 if self.stop_event.is_set():
                     return
                 
+                self._select_proxy()
                 try:
                     pages_to_scan = max(1, self.count)
                     logger.info(f"ЦИАН: Сканирование {pages_to_scan} страниц для {base_url}")
                     
+                    sorted_url = self._with_date_sort(base_url)
+                    early_stop = self.early_stop and not self.first_run and self._date_sorted(sorted_url)
+                    
                     for page_num in range(1, pages_to_scan + 1):
                         if self.stop_event.is_set():
                             return
                         
-                        page_url = base_url
+                        page_url = sorted_url
                         if page_num > 1:
-                            if "p=" in base_url:
-                                page_url = re.sub(r'p=\d+', f'p={page_num}', base_url)
+                            if "p=" in sorted_url:
+                                page_url = re.sub(r'p=\d+', f'p={page_num}', sorted_url)
                             else:
-                                separator = "&" if "?" in base_url else "?"
-                                page_url = f"{base_url}{separator}p={page_num}"
+                                separator = "&" if "?" in sorted_url else "?"
+                                page_url = f"{sorted_url}{separator}p={page_num}"
                             
                         logger.info(f"ЦИАН: Обработка страницы {page_num}/{pages_to_scan}: {page_url}")
                         
@@ -883,29 +986,25 @@ class CianParse:
                         ads = self.parse_offers(html)
                         logger.info(f"Найдено {len(ads)} объявлений на странице {page_num}")
                         
+                        url_scan_ads = self.current_scan_by_url.setdefault(base_url, set())
                         for ad in ads:
                             ad_id = ad['id']
                             self.current_scan_ads.add(ad_id)
+                            url_scan_ads.add(ad_id)
                         
-                        if not self.first_run:
-                            for ad in ads:
-                                ad_id = ad['id']
-                                if ad_id not in self.known_ads:
-                                    self.total_new_ads += 1
-                                    logger.info(f"Найдено новое объявление: {ad['title']} (ID: {ad_id})")
-                                    
-                                    try:
-                                        price_str = ad.get('price', '0')
-                                        price_digits = ''.join(filter(str.isdigit, price_str))
-                                        price = int(price_digits) if price_digits else 0
-                                        
-                                        if not self.db_handler.cian_record_exists(ad_id, price):
-                                            if self._filter_ad(ad):
-                                                self.send_notification(ad)
-                                    except Exception as e:
-                                        logger.error(f"Ошибка при проверке цены объявления: {e}")
+                        price_drops = self._record_prices(base_url, ads)
+                        self._index_ads(ads)
                         
-                        time.sleep(random.uniform(2, 4))
+                        if not self.first_run:
+                            new_ads = self._select_new_ads(ads)
+                            self._process_new_ads(new_ads)
+                            self._process_price_drops(ads, price_drops, new_ads)
+                            
+                            if early_stop and page_num < pages_to_scan and self._all_known(ads, new_ads):
+                                saved = pages_to_scan - page_num
+                                self.total_pages_saved += saved
+                                logger.info(f"ЦИАН: Страница {page_num} из известных объявлений, дальше новых нет. Пропущено страниц: {saved}")
+                                break
                         
                 except StopEventException:
                     logger.info("ЦИАН: Парсинг остановлен по запросу")
@@ -914,14 +1013,13 @@ class CianParse:
                     logger.error(f"Ошибка при обработке URL {base_url}: {e}")
                     logger.error(traceback.format_exc())
             
-            self.known_ads.update(self.current_scan_ads)
-            
             self._save_scan_results()
+            logger.debug(f"Доля попаданий кэша селекторов: {selector_cache.hit_rates()}")
             
             if self.first_run:
                 logger.info(f"ЦИАН: Первичное сканирование завершено. Найдено объявлений: {len(self.current_scan_ads)}. При следующем запуске будут отображаться только новые объявления.")
             else:
-                logger.info(f"ЦИАН: Сканирование завершено. Найдено {self.total_new_ads} новых объявлений, отправлено {self.total_notified_ads} уведомлений.")
+                logger.info(f"ЦИАН: Сканирование завершено. Найдено {self.total_new_ads} новых объявлений, отправлено {self.total_notified_ads} уведомлений, пропущено страниц: {self.total_pages_saved}.")
         except Exception as e:
             logger.error(f"Общая ошибка при парсинге ЦИАН: {e}")
             logger.error(traceback.format_exc())
@@ -0,0 +1,205 @@
+import random
+import time
+from dataclasses import dataclass
+from threading import Lock
+from typing import Dict, List, Sequence
+
+from loguru import logger
+
+# Столько ошибок соединения подряд отправляют прокси в карантин
+PROXY_FAILURE_LIMIT = 3
+# Карантин после первой череды ошибок, секунд; каждый следующий подряд - вдвое дольше
+PROXY_QUARANTINE = 120
+PROXY_MAX_QUARANTINE = 3600
+# Вес нового замера в скользящей средней задержки
+PROXY_LATENCY_ALPHA = 0.3
+# Задержка, которая считается для прокси без замеров, секунд
+PROXY_DEFAULT_LATENCY = 1.0
+
+
+def parse_proxy(value: str) -> str | None:
+    """Приводит прокси к виду user:password@host:port (или host:port).
+
+    Понимает user:password@host:port, host:port:user:password и host:port,
+    в том числе со схемой http:// впереди. None - формат не распознан.
+    """
+    proxy = value.strip()
+    scheme = ""
+    if "://" in proxy:
+        scheme, proxy = proxy.split("://", 1)
+        scheme += "://"
+    if not proxy:
+        return None
+
+    if "@" in proxy:
+        credentials, address = proxy.rsplit("@", 1)
+        if ":" not in credentials or address.count(":") != 1:
+            return None
+    else:
+        parts = proxy.split(":")
+        if len(parts) == 4:
+            host, port, username, password = parts
+            credentials, address = f"{username}:{password}", f"{host}:{port}"
+        elif len(parts) == 2:
+            credentials, address = "", proxy
+        else:
+            return None
+
+    host, port = address.split(":")
+    if not host or not port.isdigit():
+        return None
+    # Схема http по умолчанию не сохраняется: так прокси выглядят в настройках SB
+    if scheme in ("http://", "https://"):
+        scheme = ""
+    return f"{scheme}{credentials}@{address}" if credentials else f"{scheme}{address}"
+
+
+def parse_proxy_list(value: str | None) -> List[str]:
+    """Разбирает список прокси из настроек (через ; или с новой строки), пропуская нераспознанные."""
+    proxies = []
+    for item in (value or "").replace("\n", ";").split(";"):
+        if not item.strip():
+            continue
+        proxy = parse_proxy(item)
+        if proxy is None:
+            logger.warning(f"Неверный формат прокси, пропускаю: {item.strip()}")
+        elif proxy not in proxies:
+            proxies.append(proxy)
+    return proxies
+
+
+def proxy_url(proxy: str) -> str:
+    return proxy if "://" in proxy else f"http://{proxy}"
+
+
+def requests_proxies(proxy: str | None) -> Dict[str, str]:
+    """Словарь proxies для requests; пустой - без прокси."""
+    if not proxy:
+        return {}
+    url = proxy_url(proxy)
+    return {"http": url, "https": url}
+
+
+def _display(proxy: str) -> str:
+    # Логин и пароль прокси в лог не попадают
+    return proxy.rsplit("@", 1)[-1]
+
+
+@dataclass(slots=True)
+class ProxyStats:
+    """Накопленная статистика одного прокси."""
+    successes: int = 0
+    failures: int = 0
+    blocks: int = 0
+    latency: float | None = None
+    consecutive_failures: int = 0
+    # Сколько карантинов подряд без успешного запроса между ними
+    strikes: int = 0
+    quarantined_until: float = 0.0
+
+    @property
+    def success_rate(self) -> float:
+        # Сглаживание Лапласа: у нового прокси - 0.5, а не 0 или 1
+        return (self.successes + 1) / (self.successes + self.failures + self.blocks + 2)
+
+    @property
+    def block_rate(self) -> float:
+        total = self.successes + self.failures + self.blocks
+        return self.blocks / total if total else 0.0
+
+    @property
+    def weight(self) -> float:
+        latency = self.latency if self.latency is not None else PROXY_DEFAULT_LATENCY
+        return self.success_rate ** 2 / max(latency, 0.05)
+
+
+class ProxyPool:
+    """Общий для процесса учёт состояния прокси и выбор лучшего из списка.
+
+    Парсеры сообщают об успешных запросах (с задержкой), ошибках
+    соединения и блокировках. Выбор идёт случайно с весом по доле успешных
+    запросов и задержке среди прокси не в карантине; прокси уходит
+    в карантин после PROXY_FAILURE_LIMIT ошибок подряд или блокировки.
+    """
+
+    def __init__(self) -> None:
+        self._stats: Dict[str, ProxyStats] = {}
+        self._lock = Lock()
+
+    def _get(self, proxy: str) -> ProxyStats:
+        return self._stats.setdefault(proxy, ProxyStats())
+
+    def stats(self, proxy: str) -> ProxyStats:
+        with self._lock:
+            return self._get(proxy)
+
+    def choose(self, proxies: Sequence[str]) -> str | None:
+        """Выбирает прокси из списка; None - список пуст (работа без прокси).
+
+        Если все прокси в карантине, возвращает тот, что выйдет из него первым.
+        """
+        if not proxies:
+            return None
+        now = time.time()
+        with self._lock:
+            stats = [(proxy, self._get(proxy)) for proxy in proxies]
+            healthy = [(proxy, s) for proxy, s in stats if s.quarantined_until <= now]
+            if not healthy:
+                proxy, s = min(stats, key=lambda item: item[1].quarantined_until)
+                logger.warning(f"Все прокси в карантине, беру {_display(proxy)} (освобождается первым)")
+                return proxy
+            return random.choices([p for p, _ in healthy], weights=[s.weight for _, s in healthy])[0]
+
+    def _quarantine(self, proxy: str, s: ProxyStats, cooldown: float | None) -> None:
+        if cooldown is None:
+            cooldown = min(PROXY_MAX_QUARANTINE, PROXY_QUARANTINE * 2 ** s.strikes)
+        s.strikes += 1
+        s.consecutive_failures = 0
+        s.quarantined_until = max(s.quarantined_until, time.time() + cooldown)
+        logger.warning(f"Прокси {_display(proxy)} в карантине на {cooldown:.0f} с")
+
+    def report_success(self, proxy: str | None, latency: float | None = None) -> None:
+        if not proxy:
+            return
+        with self._lock:
+            s = self._get(proxy)
+            s.successes += 1
+            s.consecutive_failures = 0
+            s.strikes = 0
+            if latency is not None:
+                s.latency = latency if s.latency is None else (
+                    PROXY_LATENCY_ALPHA * latency + (1 - PROXY_LATENCY_ALPHA) * s.latency
+                )
+
+    def report_failure(self, proxy: str | None) -> None:
+        """Ошибка соединения или таймаут через прокси."""
+        if not proxy:
+            return
+        with self._lock:
+            s = self._get(proxy)
+            s.failures += 1
+            s.consecutive_failures += 1
+            if s.consecutive_failures >= PROXY_FAILURE_LIMIT:
+                self._quarantine(proxy, s, None)
+
+    def report_block(self, proxy: str | None, cooldown: float | None = None) -> None:
+        """Площадка заблокировала IP прокси: карантин сразу, на cooldown секунд или по умолчанию."""
+        if not proxy:
+            return
+        with self._lock:
+            s = self._get(proxy)
+            s.blocks += 1
+            self._quarantine(proxy, s, cooldown)
+
+
+_pool: ProxyPool | None = None
+_pool_lock = Lock()
+
+
+def get_proxy_pool() -> ProxyPool:
+    """Возвращает общий для процесса учёт прокси."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProxyPool()
+        return _pool
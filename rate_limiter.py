@@ -0,0 +1,114 @@
+import asyncio
+import random
+import threading
+import time
+from typing import Dict, Tuple
+from urllib.parse import urlparse
+
+from loguru import logger
+
+# Начальный темп запросов к одному домену через один прокси, запросов в секунду
+RATE_LIMIT_RPS = 0.5
+# Верхний и нижний пределы темпа при подстройке
+RATE_LIMIT_MAX_RPS = 1.0
+RATE_LIMIT_MIN_RPS = 0.02
+# Сколько запросов можно сделать подряд без ожидания после простоя
+RATE_LIMIT_BURST = 2
+# Случайная добавка к ожиданию, доля от интервала между запросами
+RATE_LIMIT_JITTER = 0.5
+# Во сколько раз снижается темп после страницы блокировки
+RATE_BLOCK_FACTOR = 0.5
+# На сколько растёт темп после каждого успешного запроса
+RATE_RECOVERY_STEP = 0.01
+# Шаг ожидания очереди: так часто проверяется флаг остановки задачи, секунд
+RATE_STOP_POLL = 0.2
+
+
+class TokenBucket:
+    """Ведро токенов с подстройкой темпа: общий лимит запросов к одному домену.
+
+    acquire() резервирует токен и ждёт своей очереди, поэтому одновременные
+    задачи расходятся по времени, а не срываются пачкой. Блокировка
+    (penalize) уменьшает темп в RATE_BLOCK_FACTOR раз, каждый успешный
+    запрос (reward) понемногу возвращает его к max_rate.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        rate: float = RATE_LIMIT_RPS,
+        burst: int = RATE_LIMIT_BURST,
+        max_rate: float = RATE_LIMIT_MAX_RPS,
+        min_rate: float = RATE_LIMIT_MIN_RPS,
+        jitter: float = RATE_LIMIT_JITTER,
+    ) -> None:
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.jitter = jitter
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, stop_event: threading.Event | asyncio.Event | None = None) -> float:
+        """Ждёт очереди на запрос, возвращает время ожидания в секундах.
+
+        При установленном stop_event ожидание прерывается досрочно. Флаг
+        проверяется через is_set() короткими шагами: бот передаёт
+        asyncio.Event задачи, а его wait() из рабочего потока не вызвать.
+        """
+        with self._lock:
+            self._refill()
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            interval = 1 / self.rate
+        if wait:
+            wait += random.uniform(0, self.jitter * interval)
+            deadline = time.monotonic() + wait
+            while stop_event is None or not stop_event.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                time.sleep(min(remaining, RATE_STOP_POLL))
+        return wait
+
+    def penalize(self) -> None:
+        """Снижает темп после страницы блокировки и сбрасывает накопленный запас."""
+        with self._lock:
+            self._refill()
+            self.rate = max(self.min_rate, self.rate * RATE_BLOCK_FACTOR)
+            self._tokens = min(self._tokens, 0.0)
+        logger.warning(f"Лимит запросов {self.name}: блокировка, темп снижен до {self.rate:.2f} запр/с")
+
+    def reward(self) -> None:
+        """Понемногу повышает темп после успешного запроса."""
+        with self._lock:
+            self._refill()
+            self.rate = min(self.max_rate, self.rate + RATE_RECOVERY_STEP)
+
+
+_limiters: Dict[Tuple[str, str], TokenBucket] = {}
+_limiters_lock = threading.Lock()
+
+
+def _domain(url: str) -> str:
+    host = urlparse(url).hostname or url
+    return ".".join(host.split(".")[-2:])
+
+
+def get_rate_limiter(url: str, proxy: str | None = None) -> TokenBucket:
+    """Возвращает общий для процесса лимитер домена url при выходе через proxy."""
+    key = (_domain(url), proxy or "")
+    with _limiters_lock:
+        if key not in _limiters:
+            # Логин и пароль прокси в лог не попадают
+            name = f"{key[0]} через {key[1].rsplit('@', 1)[-1]}" if key[1] else key[0]
+            _limiters[key] = TokenBucket(name)
+        return _limiters[key]
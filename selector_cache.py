@@ -0,0 +1,119 @@
+from dataclasses import dataclass
+from threading import Lock
+from typing import Callable, Dict, Mapping, Sequence, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# Столько раз подряд запасной селектор должен сработать при промахе более
+# точных, чтобы стать первым: одна карточка без поля не меняет порядок
+SELECTOR_PROMOTE_STREAK = 3
+# Каждый N-й поиск поля идёт в исходном порядке приоритета: если точный
+# селектор снова срабатывает, запасной теряет первое место
+SELECTOR_RECHECK_EVERY = 50
+
+
+@dataclass(slots=True)
+class _FieldState:
+    winner: str | None = None
+    candidate: str | None = None
+    streak: int = 0
+    lookups: int = 0
+    hits: int = 0
+    misses: int = 0
+
+
+class SelectorCache:
+    """Запоминает, какой из запасных селекторов сработал для поля карточки.
+
+    Селекторы поля перечислены по приоритету, от точного к общему. Запасной
+    селектор становится первым, только если SELECTOR_PROMOTE_STREAK раз
+    подряд сработал при промахе всех более точных. Каждый
+    SELECTOR_RECHECK_EVERY-й поиск идёт в исходном порядке, и если более
+    точный селектор снова находит элемент, порядок возвращается к нему.
+    Счётчики попаданий и промахов показывают, насколько стабильна вёрстка.
+    """
+
+    def __init__(self) -> None:
+        self._fields: Dict[Tuple[str, str], _FieldState] = {}
+        self._lock = Lock()
+
+    def _state(self, key: Tuple[str, str]) -> _FieldState:
+        return self._fields.setdefault(key, _FieldState())
+
+    def ordered(self, scope: str, field: str, selectors: Sequence[str]) -> Tuple[str, ...]:
+        """Селекторы поля в порядке перебора: сначала закреплённый победитель.
+
+        Каждый SELECTOR_RECHECK_EVERY-й вызов возвращает исходный порядок.
+        """
+        with self._lock:
+            state = self._state((scope, field))
+            state.lookups += 1
+            winner = state.winner
+            if winner not in selectors or state.lookups % SELECTOR_RECHECK_EVERY == 0:
+                return tuple(selectors)
+        return (winner, *(s for s in selectors if s != winner))
+
+    def _found(self, state: _FieldState, selectors: Sequence[str], selector: str) -> None:
+        """Учитывает селектор, сработавший после промаха всех более точных."""
+        rank = selectors.index(selector)
+        winner_rank = selectors.index(state.winner) if state.winner in selectors else 0
+        if selector == state.winner:
+            state.candidate, state.streak = None, 0
+        elif rank < winner_rank or rank == 0:
+            # Более точный селектор снова работает - он и первый
+            state.winner = selector if rank else None
+            state.candidate, state.streak = None, 0
+        else:
+            state.streak = state.streak + 1 if selector == state.candidate else 1
+            state.candidate = selector
+            if state.streak >= SELECTOR_PROMOTE_STREAK:
+                state.winner = selector
+                state.candidate, state.streak = None, 0
+
+    def find(self, scope: str, field: str, selectors: Sequence[str], query: Callable[[str], T]) -> T | None:
+        """Возвращает первый непустой результат query(селектор) или None."""
+        key = (scope, field)
+        for i, selector in enumerate(self.ordered(scope, field, selectors)):
+            result = query(selector)
+            if result:
+                with self._lock:
+                    state = self._state(key)
+                    self._found(state, selectors, selector)
+                    state.hits += int(i == 0)
+                    state.misses += int(i > 0)
+                return result
+        with self._lock:
+            self._state(key).misses += 1
+        return None
+
+    def record(self, scope: str, field: str, selectors: Sequence[str], used: Mapping[str, int]) -> None:
+        """Учитывает сработавшие селекторы пачкой: {селектор: сколько раз}.
+
+        Так результаты разбора в браузере (execute_script, перебор в порядке
+        ordered()) попадают в кэш. Страница засчитывается как одно
+        срабатывание самого точного из сработавших селекторов: запасной
+        продвигается, только если более точные не нашлись ни в одной карточке.
+        """
+        used = {selector: count for selector, count in used.items() if selector in selectors and count}
+        if not used:
+            return
+        with self._lock:
+            state = self._state((scope, field))
+            total = sum(used.values())
+            hits = used.get(state.winner if state.winner in selectors else selectors[0], 0)
+            state.hits += hits
+            state.misses += total - hits
+            self._found(state, selectors, min(used, key=selectors.index))
+
+    def hit_rates(self) -> Dict[str, float]:
+        """Доля попаданий с первой попытки по каждой паре "тип страницы/поле"."""
+        with self._lock:
+            return {
+                f"{scope}/{field}": state.hits / (state.hits + state.misses)
+                for (scope, field), state in self._fields.items()
+                if state.hits + state.misses
+            }
+
+
+# Общий для всех парсеров процесса: вёрстка площадки одна для всех задач
+selector_cache = SelectorCache()
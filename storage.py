@@ -0,0 +1,437 @@
+import bisect
+import heapq
+import json
+import time
+from threading import RLock
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Protocol, Set, Tuple
+
+from db_service import (
+    DB_EXPORT_BATCH_SIZE,
+    DB_RETENTION_DAYS,
+    FULLTEXT_SEARCH_LIMIT,
+    PLATFORM_TABLES,
+    SQLiteDBHandler,
+    fulltext_terms,
+    parse_setting,
+)
+
+
+class StorageBackend(Protocol):
+    """Хранилище, с которым работают парсеры, фильтры известных объявлений и бот.
+
+    Реализации: SQLiteDBHandler (по умолчанию) и InMemoryDBHandler. Записи
+    могут применяться отложенно; flush() дожидается, пока все поставленные
+    записи станут видны чтениям.
+    """
+
+    # Отправленные объявления
+    def add_records(self, rows: Iterable[Tuple[int, int]]) -> None: ...
+    def existing_records(self, pairs: Iterable[Tuple[int, int]]) -> Set[Tuple[int, int]]: ...
+    def add_cian_records(self, rows: Iterable[Tuple[str, int, str, str]]) -> None: ...
+    def existing_cian_records(self, pairs: Iterable[Tuple[str, int]]) -> Set[Tuple[str, int]]: ...
+    def clean_cian_viewed(self) -> None: ...
+
+    # История сканирований
+    def save_scan_ids(self, url: str, ids: Iterable[str]) -> None: ...
+    def save_cian_scan_ids(self, url: str, ids: Iterable[str]) -> None: ...
+    def known_ad_ids(
+        self, platform: str, urls: Iterable[str], ids: Iterable[str], include_viewed: bool = False
+    ) -> Set[str]: ...
+    def iter_ad_ids(self, platform: str, since: int = 0) -> Iterator[str]: ...
+    def clean_scan_history(self) -> None: ...
+    def clean_cian_scan_history(self) -> None: ...
+
+    # Цены и полнотекстовый поиск
+    def record_prices(self, platform: str, url: str, prices: Iterable[Tuple[str, int]]) -> List[Tuple[str, int, int]]: ...
+    def index_ads(self, platform: str, rows: Iterable[Tuple[str, str, str, str, int]]) -> None: ...
+    def search_ads(self, query: str, platform: str | None = None, limit: int = FULLTEXT_SEARCH_LIMIT) -> List[Tuple]: ...
+    def iter_ads(
+        self,
+        platform: str | None = None,
+        since: int | None = None,
+        until: int | None = None,
+        batch_size: int = DB_EXPORT_BATCH_SIZE,
+    ) -> Iterator[Tuple]: ...
+
+    # Настройки
+    def cached_settings(self, user_id: int) -> Optional[Tuple[Dict[str, str], Dict[str, Any]]]: ...
+    def get_setting(self, user_id: int, key: str) -> Optional[str]: ...
+    def set_setting(self, user_id: int, key: str, value: str) -> None: ...
+    def delete_setting(self, user_id: int, key: str) -> None: ...
+    def list_settings(self, user_id: int) -> Dict[str, str]: ...
+    def list_typed_settings(self, user_id: int) -> Dict[str, Any]: ...
+
+    # Поиски
+    def add_search(self, user_id: int, platform: str, urls: List[str], settings: Dict[str, Any], name: str = "") -> int: ...
+    def deactivate_search(self, search_id: int) -> None: ...
+    def list_active_searches(self, user_id: int | None = None, platform: str | None = None) -> List[Tuple]: ...
+    def clean_active_searches(self) -> None: ...
+    def reset_search_counter(self) -> bool: ...
+
+    # Обслуживание
+    def compact(self, retention_days: Dict[str, int] | None = None) -> Dict[str, Any]: ...
+    def flush(self, timeout: float | None = None) -> None: ...
+    def shutdown(self) -> None: ...
+
+
+class InMemoryDBHandler:
+    """Хранилище в памяти процесса на словарях и множествах.
+
+    Повторяет семантику SQLiteDBHandler, но ничего не пишет на диск:
+    для нагрузочных тестов парсеров и короткоживущих воркеров. Все
+    операции синхронные и защищены одной блокировкой, flush() ничего
+    не ждёт. Данные живут, пока жив объект.
+    """
+
+    persistent = False
+
+    def __init__(self) -> None:
+        self._lock = RLock()
+        # (id, price) -> время добавления
+        self._viewed: Dict[Tuple[Any, int], int] = {}
+        # (id, price) -> (url, title, время добавления)
+        self._cian_viewed: Dict[Tuple[str, int], Tuple[str, str, int]] = {}
+        # площадка -> url -> ad_id -> [first_seen, last_seen]
+        self._scan: Dict[str, Dict[str, Dict[str, List[int]]]] = {platform: {} for platform in PLATFORM_TABLES}
+        # (площадка, ad_id) -> изменения цены [(время, цена)] по возрастанию времени
+        self._prices: Dict[Tuple[str, str], List[Tuple[int, int]]] = {}
+        # (площадка, ad_id) -> [title, description, url, price, first_seen, last_seen] в порядке появления
+        self._ads: Dict[Tuple[str, str], List[Any]] = {}
+        self._settings: Dict[int, Dict[str, str]] = {}
+        # id -> [user_id, platform, urls, settings_json, active, name]
+        self._searches: Dict[int, List[Any]] = {}
+        self._free_search_ids: List[int] = []
+
+    # Отправленные объявления
+    def add_record(self, record_id: int, price: int) -> None:
+        self.add_records([(record_id, price)])
+
+    def record_exists(self, record_id: int, price: int) -> bool:
+        return (record_id, price) in self._viewed
+
+    def add_records(self, rows: Iterable[Tuple[int, int]]) -> None:
+        now = int(time.time())
+        with self._lock:
+            for key in rows:
+                self._viewed.setdefault(tuple(key), now)
+
+    def existing_records(self, pairs: Iterable[Tuple[int, int]]) -> Set[Tuple[int, int]]:
+        with self._lock:
+            return {tuple(pair) for pair in pairs if tuple(pair) in self._viewed}
+
+    def list_all_viewed_records(self) -> List[Tuple]:
+        with self._lock:
+            return list(self._viewed)
+
+    def clear_viewed_records(self) -> None:
+        with self._lock:
+            self._viewed.clear()
+
+    def add_cian_record(self, ad_id: str, price: int, url: str = "", title: str = "") -> None:
+        self.add_cian_records([(ad_id, price, url, title)])
+
+    def cian_record_exists(self, ad_id: str, price: int) -> bool:
+        return (ad_id, price) in self._cian_viewed
+
+    def add_cian_records(self, rows: Iterable[Tuple[str, int, str, str]]) -> None:
+        now = int(time.time())
+        with self._lock:
+            for ad_id, price, url, title in rows:
+                self._cian_viewed.setdefault((ad_id, price), (url, title, now))
+
+    def existing_cian_records(self, pairs: Iterable[Tuple[str, int]]) -> Set[Tuple[str, int]]:
+        with self._lock:
+            return {tuple(pair) for pair in pairs if tuple(pair) in self._cian_viewed}
+
+    def list_all_cian_records(self) -> List[Tuple]:
+        with self._lock:
+            return [(ad_id, price, url, title) for (ad_id, price), (url, title, _) in self._cian_viewed.items()]
+
+    def clean_cian_viewed(self) -> None:
+        with self._lock:
+            self._cian_viewed.clear()
+
+    # История сканирований
+    def _save_scan(self, platform: str, url: str, ids: Iterable[str]) -> None:
+        now = int(time.time())
+        with self._lock:
+            seen = self._scan[platform].setdefault(url, {})
+            for ad_id in ids:
+                times = seen.setdefault(str(ad_id), [now, now])
+                times[1] = now
+
+    def get_scan_ids(self, url: str) -> List[str]:
+        with self._lock:
+            return list(self._scan["avito"].get(url, {}))
+
+    def save_scan_ids(self, url: str, ids: Iterable[str]) -> None:
+        self._save_scan("avito", url, ids)
+
+    def scan_id_exists(self, url: str, ad_id: str) -> bool:
+        return str(ad_id) in self._scan["avito"].get(url, {})
+
+    def clean_scan_history(self) -> None:
+        with self._lock:
+            self._scan["avito"].clear()
+
+    def get_cian_scan_ids(self, url: str) -> List[str]:
+        with self._lock:
+            return list(self._scan["cian"].get(url, {}))
+
+    def save_cian_scan_ids(self, url: str, ids: Iterable[str]) -> None:
+        self._save_scan("cian", url, ids)
+
+    def cian_scan_id_exists(self, url: str, ad_id: str) -> bool:
+        return str(ad_id) in self._scan["cian"].get(url, {})
+
+    def clean_cian_scan_history(self) -> None:
+        with self._lock:
+            self._scan["cian"].clear()
+
+    def _viewed_table(self, platform: str) -> Dict[Tuple[Any, int], Any]:
+        return self._cian_viewed if platform == "cian" else self._viewed
+
+    def known_ad_ids(
+        self,
+        platform: str,
+        urls: Iterable[str],
+        ids: Iterable[str],
+        include_viewed: bool = False,
+    ) -> Set[str]:
+        ids = {str(ad_id) for ad_id in ids}
+        with self._lock:
+            known: Set[str] = set()
+            for url in urls:
+                known.update(ids.intersection(self._scan[platform].get(url, {})))
+            if include_viewed:
+                known.update(ids.intersection(str(ad_id) for ad_id, _ in self._viewed_table(platform)))
+            return known
+
+    def iter_ad_ids(self, platform: str, since: int = 0) -> Iterator[str]:
+        with self._lock:
+            ids = [
+                ad_id
+                for seen in self._scan[platform].values()
+                for ad_id, (_, last_seen) in seen.items()
+                if last_seen >= since
+            ]
+            for (ad_id, _), value in self._viewed_table(platform).items():
+                added_at = value[2] if platform == "cian" else value
+                if added_at >= since:
+                    ids.append(str(ad_id))
+        yield from ids
+
+    # Цены и полнотекстовый поиск
+    def record_prices(self, platform: str, url: str, prices: Iterable[Tuple[str, int]]) -> List[Tuple[str, int, int]]:
+        rows = {str(ad_id): price for ad_id, price in prices if price > 0}
+        now = int(time.time())
+        drops: List[Tuple[str, int, int]] = []
+        with self._lock:
+            seen = self._scan[platform].get(url, {})
+            for ad_id, price in rows.items():
+                history = self._prices.setdefault((platform, ad_id), [])
+                if ad_id in seen:
+                    # Цена, которую этот URL видел при прошлом сканировании
+                    last_seen = seen[ad_id][1]
+                    pos = bisect.bisect_right(history, (last_seen, float("inf")))
+                    if pos and history[pos - 1][1] > price:
+                        drops.append((ad_id, history[pos - 1][1], price))
+                if not history or history[-1][1] != price:
+                    # Как INSERT OR REPLACE в SQLite: изменение в ту же секунду заменяет запись
+                    if history and history[-1][0] == now:
+                        history.pop()
+                    history.append((now, price))
+        return drops
+
+    def price_history(self, platform: str, ad_id: str) -> List[Tuple[int, int]]:
+        with self._lock:
+            return list(self._prices.get((platform, str(ad_id)), []))
+
+    def index_ads(self, platform: str, rows: Iterable[Tuple[str, str, str, str, int]]) -> None:
+        now = int(time.time())
+        with self._lock:
+            for ad_id, title, description, url, price in rows:
+                ad = self._ads.get((platform, str(ad_id)))
+                if ad is None:
+                    self._ads[(platform, str(ad_id))] = [title, description, url, price, now, now]
+                else:
+                    ad[:] = [title, description or ad[1], url, price, ad[4], now]
+
+    def search_ads(self, query: str, platform: str | None = None, limit: int = FULLTEXT_SEARCH_LIMIT) -> List[Tuple]:
+        """Линейный поиск: каждое слово запроса - префикс слова заголовка или описания."""
+        words = fulltext_terms(query.lower())
+        if not words:
+            return []
+        with self._lock:
+            found = []
+            for (ad_platform, ad_id), (title, description, url, price, _, last_seen) in self._ads.items():
+                if platform and ad_platform != platform:
+                    continue
+                tokens = fulltext_terms(f"{title or ''} {description or ''}".lower())
+                if all(any(token.startswith(word) for token in tokens) for word in words):
+                    found.append((last_seen, (ad_platform, ad_id, title, price, url)))
+        found.sort(key=lambda item: item[0], reverse=True)
+        return [row for _, row in found[:limit]]
+
+    def iter_ads(
+        self,
+        platform: str | None = None,
+        since: int | None = None,
+        until: int | None = None,
+        batch_size: int = DB_EXPORT_BATCH_SIZE,
+    ) -> Iterator[Tuple]:
+        # Ключи копируются пачками, чтобы не держать блокировку на всё время выгрузки
+        with self._lock:
+            keys = list(self._ads)
+        for i in range(0, len(keys), batch_size):
+            with self._lock:
+                rows = [(key, self._ads.get(key)) for key in keys[i:i + batch_size]]
+            for (ad_platform, ad_id), ad in rows:
+                if ad is None or (platform and ad_platform != platform):
+                    continue
+                title, description, url, price, first_seen, last_seen = ad
+                if (since is not None and first_seen < since) or (until is not None and first_seen >= until):
+                    continue
+                yield ad_platform, ad_id, title, description, url, price, first_seen, last_seen
+
+    # Настройки
+    def cached_settings(self, user_id: int) -> Optional[Tuple[Dict[str, str], Dict[str, Any]]]:
+        # Всё хранится в памяти, поэтому настройки всегда "в кэше"
+        raw = self.list_settings(user_id)
+        return raw, {key: parse_setting(key, value) for key, value in raw.items()}
+
+    def get_setting(self, user_id: int, key: str) -> Optional[str]:
+        with self._lock:
+            return self._settings.get(user_id, {}).get(key)
+
+    def set_setting(self, user_id: int, key: str, value: str) -> None:
+        with self._lock:
+            self._settings.setdefault(user_id, {})[key] = value
+
+    def delete_setting(self, user_id: int, key: str) -> None:
+        with self._lock:
+            self._settings.get(user_id, {}).pop(key, None)
+
+    def list_settings(self, user_id: int) -> Dict[str, str]:
+        with self._lock:
+            return dict(self._settings.get(user_id, {}))
+
+    def list_typed_settings(self, user_id: int) -> Dict[str, Any]:
+        return self.cached_settings(user_id)[1]
+
+    # Поиски
+    def add_search(self, user_id: int, platform: str, urls: List[str], settings: Dict[str, Any], name: str = "") -> int:
+        settings_copy = settings.copy()
+        settings_copy["platform"] = platform
+        with self._lock:
+            if self._free_search_ids:
+                new_id = heapq.heappop(self._free_search_ids)
+            else:
+                new_id = max(self._searches, default=0) + 1
+            self._searches[new_id] = [
+                user_id, platform, " ".join(urls), json.dumps(settings_copy, ensure_ascii=False), 1, name,
+            ]
+            return new_id
+
+    def deactivate_search(self, search_id: int) -> None:
+        with self._lock:
+            search = self._searches.get(search_id)
+            if search and search[4]:
+                search[4] = 0
+                heapq.heappush(self._free_search_ids, search_id)
+
+    def list_active_searches(self, user_id: int | None = None, platform: str | None = None) -> List[Tuple]:
+        with self._lock:
+            return [
+                (search_id, urls, settings_json, name, owner)
+                for search_id, (owner, search_platform, urls, settings_json, active, name) in sorted(self._searches.items())
+                if active
+                and (not user_id or owner == user_id)
+                and (not platform or search_platform == platform)
+            ]
+
+    def clean_active_searches(self) -> None:
+        with self._lock:
+            for search_id in [sid for sid, search in self._searches.items() if search[4]]:
+                self.deactivate_search(search_id)
+
+    def reset_search_counter(self) -> bool:
+        with self._lock:
+            self._searches = {sid: search for sid, search in self._searches.items() if search[4]}
+            top = max(self._searches, default=0)
+            self._free_search_ids = [sid for sid in self._free_search_ids if sid <= top]
+            heapq.heapify(self._free_search_ids)
+        return True
+
+    # Обслуживание
+    def compact(self, retention_days: Dict[str, int] | None = None) -> Dict[str, Any]:
+        """Удаляет записи старше срока хранения; таблицы те же, что у SQLiteDBHandler."""
+        retention = {**DB_RETENTION_DAYS, **(retention_days or {})}
+        now = int(time.time())
+
+        def cutoff(table: str) -> int | None:
+            days = retention.get(table)
+            return now - days * 86400 if days else None
+
+        deleted: Dict[str, int] = {}
+        with self._lock:
+            for platform, (scan_table, viewed_table) in PLATFORM_TABLES.items():
+                if (limit := cutoff(scan_table)) is not None:
+                    deleted[scan_table] = 0
+                    for seen in self._scan[platform].values():
+                        expired = [ad_id for ad_id, (_, last_seen) in seen.items() if last_seen < limit]
+                        for ad_id in expired:
+                            del seen[ad_id]
+                        deleted[scan_table] += len(expired)
+                if (limit := cutoff(viewed_table)) is not None:
+                    table = self._viewed_table(platform)
+                    # Отправленное объявление, которое ещё встречается в листингах, остаётся
+                    still_seen = {
+                        ad_id
+                        for seen in self._scan[platform].values()
+                        for ad_id, (_, last_seen) in seen.items()
+                        if last_seen >= limit
+                    }
+                    expired = [
+                        key for key, value in table.items()
+                        if (value[2] if platform == "cian" else value) < limit and str(key[0]) not in still_seen
+                    ]
+                    for key in expired:
+                        del table[key]
+                    deleted[viewed_table] = len(expired)
+            if (limit := cutoff("price_history")) is not None:
+                deleted["price_history"] = 0
+                for history in self._prices.values():
+                    pos = bisect.bisect_left(history, (limit,))
+                    del history[:pos]
+                    deleted["price_history"] += pos
+            if (limit := cutoff("ads")) is not None:
+                expired = [key for key, ad in self._ads.items() if ad[5] < limit]
+                for key in expired:
+                    del self._ads[key]
+                deleted["ads"] = len(expired)
+        return {"deleted": deleted, "size_before": 0, "size_after": 0, "reclaimed_bytes": 0}
+
+    def flush(self, timeout: float | None = None) -> None:
+        pass
+
+    def shutdown(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+# Движки хранилища, доступные по имени (переменная окружения STORAGE_BACKEND у бота)
+STORAGE_BACKENDS = {
+    "sqlite": SQLiteDBHandler,
+    "memory": InMemoryDBHandler,
+}
+
+
+def create_storage(name: str = "sqlite") -> StorageBackend:
+    """Создаёт хранилище по имени движка."""
+    try:
+        return STORAGE_BACKENDS[name]()
+    except KeyError:
+        raise ValueError(f"Неизвестное хранилище {name!r}, доступны: {', '.join(STORAGE_BACKENDS)}") from None
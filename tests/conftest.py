@@ -0,0 +1,37 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# Модули проекта лежат в корне репозитория, без пакета
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from db_service import SQLiteDBHandler  # noqa: E402
+
+
+@pytest.fixture
+def open_sqlite_db():
+    """Открывает SQLiteDBHandler на заданном файле.
+
+    SQLiteDBHandler - синглтон, поэтому каждый вызов сбрасывает прежний
+    экземпляр; после теста все открытые обработчики останавливаются.
+    """
+    opened = []
+
+    def open_db(path):
+        SQLiteDBHandler._instance = None
+        db = SQLiteDBHandler(path)
+        opened.append(db)
+        return db
+
+    yield open_db
+    for db in opened:
+        db.shutdown()
+        db.close()
+    SQLiteDBHandler._instance = None
+
+
+@pytest.fixture
+def sqlite_db(open_sqlite_db, tmp_path):
+    """Отдельная пустая БД на тест."""
+    return open_sqlite_db(tmp_path / "database.db")
@@ -0,0 +1,86 @@
+import time
+
+import bloom_filter
+from bloom_filter import BloomFilter, SeenAdsFilter, get_seen_filter, warm_seen_filters
+
+
+def test_bloom_filter_has_no_false_negatives(tmp_path):
+    bloom = BloomFilter(1000, 0.01)
+    for i in range(1000):
+        bloom.add(f"id{i}")
+    assert all(f"id{i}" in bloom for i in range(1000))
+    false_positives = sum(f"other{i}" in bloom for i in range(10000))
+    assert false_positives < 300
+
+    path = tmp_path / "seen.bloom"
+    bloom.save(path, saved_at=123.0, identity="db")
+    loaded, saved_at, identity = BloomFilter.load(path)
+    assert (saved_at, identity) == (123.0, "db")
+    assert loaded.count == bloom.count
+    assert all(f"id{i}" in loaded for i in range(1000))
+
+
+def test_filter_is_built_from_scan_history_and_viewed(sqlite_db, tmp_path):
+    sqlite_db.save_scan_ids("https://www.avito.ru/a", ["1", "2"])
+    sqlite_db.add_records([(3, 100)])
+    seen = SeenAdsFilter("avito", sqlite_db, snapshot_path=tmp_path / "seen.bloom")
+    assert all(seen.might_contain(ad_id) for ad_id in ("1", "2", "3"))
+    assert not seen.might_contain("404")
+
+
+def test_snapshot_catches_up_on_later_writes(sqlite_db, tmp_path):
+    path = tmp_path / "seen.bloom"
+    old = int(time.time()) - 3600
+    with sqlite_db.transaction() as conn:
+        conn.execute(
+            "INSERT INTO scan_ads(url, ad_id, first_seen, last_seen) VALUES (?, ?, ?, ?)",
+            ("https://www.avito.ru/a", "old", old, old),
+        )
+    # Снимок сохранён раньше записи "new" и не знает про "old"
+    BloomFilter(1000).save(path, saved_at=time.time() - 600, identity=sqlite_db.database_identity())
+    sqlite_db.save_scan_ids("https://www.avito.ru/a", ["new"])
+
+    seen = SeenAdsFilter("avito", sqlite_db, snapshot_path=path)
+    assert seen.might_contain("new")
+    assert not seen.might_contain("old")
+
+    seen.rebuild()
+    assert seen.might_contain("old")
+
+
+def test_snapshot_round_trip(sqlite_db, tmp_path):
+    path = tmp_path / "seen.bloom"
+    seen = SeenAdsFilter("cian", sqlite_db, snapshot_path=path)
+    seen.add_many(["77"])
+    seen.save_snapshot()
+    assert SeenAdsFilter("cian", sqlite_db, snapshot_path=path).might_contain("77")
+
+
+def test_snapshot_of_another_database_is_rebuilt(open_sqlite_db, tmp_path):
+    other = open_sqlite_db(tmp_path / "other.db")
+    other_identity = other.database_identity()
+    other.shutdown()
+    other.close()
+
+    db = open_sqlite_db(tmp_path / "database.db")
+    db.save_scan_ids("https://www.avito.ru/a", ["1"])
+    db.flush()
+    assert db.database_identity() != other_identity
+
+    # Свежий снимок другой базы без ID "1": досчитывание его бы не вернуло
+    path = tmp_path / "database.seen_avito.bloom"
+    BloomFilter(1000).save(path, saved_at=time.time() + 600, identity=other_identity)
+    seen = SeenAdsFilter("avito", db)
+    assert seen.snapshot_path == path
+    assert seen.might_contain("1")
+
+    seen.save_snapshot()
+    assert BloomFilter.load(path)[2] == db.database_identity()
+
+
+def test_warm_creates_shared_filters_for_every_platform(sqlite_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(bloom_filter, "_filters", {})
+    warm_seen_filters(sqlite_db)
+    assert set(platform for platform, _ in bloom_filter._filters) == {"avito", "cian"}
+    assert get_seen_filter("avito", sqlite_db) is bloom_filter._filters[("avito", id(sqlite_db))]
+    assert get_seen_filter("cian", sqlite_db).snapshot_path.parent == tmp_path
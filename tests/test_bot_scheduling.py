@@ -0,0 +1,160 @@
+import asyncio
+import importlib
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+
+class StubScheduler:
+    """Запоминает задачи и переносы вместо запуска APScheduler."""
+
+    def __init__(self):
+        self.jobs = {}
+        self.modified = []
+
+    def add_job(self, func, trigger, seconds, args, id, next_run_time=None):
+        self.jobs[id] = SimpleNamespace(func=func, seconds=seconds, args=args, next_run_time=next_run_time)
+
+    def get_job(self, job_id):
+        return self.jobs.get(job_id)
+
+    def modify_job(self, job_id, next_run_time):
+        self.modified.append((job_id, next_run_time))
+        self.jobs[job_id].next_run_time = next_run_time
+
+
+class StubParser:
+    """AvitoParse без браузера: parse() ничего не делает, блокировка задаётся в blocked_until."""
+    blocked_until = 0.0
+    created = []
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        StubParser.created.append(kwargs)
+
+    def parse(self):
+        pass
+
+    def get_statistics(self):
+        return {"total_new_ads": 2, "total_notified_ads": 1}
+
+
+class StubMessage:
+    def __init__(self, text, user_id=42):
+        self.text = text
+        self.from_user = SimpleNamespace(id=user_id, first_name="Тест")
+        self.chat = SimpleNamespace(id=user_id)
+        self.replies = []
+
+    async def reply(self, text, **kwargs):
+        self.replies.append(text)
+
+
+class StubState:
+    def __init__(self, data):
+        self.data = data
+
+    async def get_data(self):
+        return self.data
+
+    async def clear(self):
+        self.data = {}
+
+
+@pytest.fixture
+def bot(monkeypatch):
+    # bot.py требует токен при импорте; хранилище - в памяти, чтобы не трогать database.db
+    monkeypatch.setenv("BOT_TOKEN", "123456:TEST-token")
+    monkeypatch.setenv("STORAGE_BACKEND", "memory")
+    module = importlib.import_module("bot")
+
+    async def send_message(chat_id, text, **kwargs):
+        pass
+
+    monkeypatch.setattr(module, "scheduler", StubScheduler())
+    monkeypatch.setattr(module, "bot", SimpleNamespace(send_message=send_message))
+    monkeypatch.setattr(module, "AvitoParse", StubParser)
+    monkeypatch.setattr(module, "ACTIVE", {})
+    monkeypatch.setattr(StubParser, "blocked_until", 0.0)
+    monkeypatch.setattr(StubParser, "created", [])
+    return module
+
+
+def make_job(bot, sid=7, first_run=False):
+    settings = asyncio.run(bot.user_settings(42))
+    return bot.SearchJob(sid, 42, "avito", ["https://www.avito.ru/moskva/doma"], settings, asyncio.Event(), first_run=first_run)
+
+
+def test_blocked_scan_defers_scheduled_job(bot):
+    job = make_job(bot)
+    bot.scheduler.add_job(bot.run_avito, "interval", seconds=300, args=[job], id="7")
+    StubParser.blocked_until = time.time() + 900
+
+    asyncio.run(bot.run_avito(job))
+
+    assert job.blocked_until == StubParser.blocked_until
+    assert bot.scheduler.modified == [("7", datetime.fromtimestamp(job.blocked_until))]
+    assert (job.total_new_ads, job.total_notified_ads) == (2, 1)
+
+    # Следующее сканирование без блокировки сбрасывает отметку
+    StubParser.blocked_until = 0.0
+    asyncio.run(bot.run_avito(job))
+    assert job.blocked_until == 0.0
+    assert len(bot.scheduler.modified) == 1
+
+
+def test_defer_without_scheduled_job_only_logs(bot):
+    job = make_job(bot)
+    job.blocked_until = time.time() + 60
+    bot._defer_job(job)
+    assert bot.scheduler.modified == []
+
+
+def test_deferred_first_run_finishes_on_schedule(bot):
+    job = make_job(bot, first_run=True)
+    # До постановки в расписание первичный проход не сбрасывается: это делает handle_search_name
+    asyncio.run(bot.run_avito(job))
+    assert job.first_run
+    assert StubParser.created[-1]["first_run"] is True
+
+    bot.scheduler.add_job(bot.run_avito, "interval", seconds=300, args=[job], id="7")
+    asyncio.run(bot.run_avito(job))
+    assert not job.first_run
+    # Статистика первичного прохода не учитывается
+    assert (job.total_new_ads, job.total_notified_ads) == (0, 0)
+
+
+def run_search_name(bot):
+    message = StubMessage("дома")
+    state = StubState({"urls": ["https://www.avito.ru/moskva/doma"], "platform": "avito"})
+    asyncio.run(bot.handle_search_name(message, state))
+    (job,) = bot.ACTIVE.values()
+    return job, message, state
+
+
+def test_new_search_is_scheduled_after_first_run(bot):
+    job, message, state = run_search_name(bot)
+    scheduled = bot.scheduler.get_job(str(job.sid))
+    assert scheduled.func is bot.run_avito and scheduled.args == [job]
+    assert scheduled.next_run_time is None
+    assert scheduled.seconds == job.settings["pause"]
+    assert not job.first_run
+    assert "Первичное сканирование завершено" in message.replies[-1]
+    assert state.data == {}
+
+
+def test_blocked_first_run_is_retried_when_block_lifts(bot):
+    StubParser.blocked_until = time.time() + 900
+    job, message, _ = run_search_name(bot)
+    scheduled = bot.scheduler.get_job(str(job.sid))
+    assert scheduled.next_run_time == datetime.fromtimestamp(StubParser.blocked_until)
+    assert job.first_run
+    assert "продолжится в" in message.replies[-1]
+
+    # Запуск по расписанию после снятия блокировки завершает первичный проход
+    StubParser.blocked_until = 0.0
+    asyncio.run(scheduled.func(*scheduled.args))
+    assert StubParser.created[-1]["first_run"] is True
+    assert not job.first_run
@@ -0,0 +1,80 @@
+import sqlite3
+import time
+
+from test_db_migrations import make_legacy_db
+
+URL = "https://www.avito.ru/moskva/doma"
+DAY = 86400
+
+
+def age_rows(db, sql, *params):
+    with db.transaction() as conn:
+        conn.execute(sql, params)
+
+
+def test_expired_rows_are_deleted_in_chunks(sqlite_db):
+    old = int(time.time()) - 40 * DAY
+    sqlite_db.save_scan_ids(URL, [str(i) for i in range(25)])
+    sqlite_db.save_scan_ids(URL + "/fresh", ["fresh"])
+    age_rows(sqlite_db, "UPDATE scan_ads SET first_seen=?, last_seen=? WHERE ad_id != 'fresh'", old, old)
+
+    report = sqlite_db.compact(retention_days={"scan_ads": 30}, chunk_size=10)
+
+    assert report["deleted"]["scan_ads"] == 25
+    assert sqlite_db.get_scan_ids(URL) == []
+    assert sqlite_db.get_scan_ids(URL + "/fresh") == ["fresh"]
+
+
+def test_retention_cutoffs_are_per_table_and_zero_keeps_forever(sqlite_db):
+    now = int(time.time())
+    sqlite_db.record_prices("avito", URL, [("1", 100)])
+    sqlite_db.index_ads("avito", [("1", "Дом", "", URL, 100)])
+    age_rows(sqlite_db, "UPDATE price_history SET observed_at=?", now - 60 * DAY)
+    age_rows(sqlite_db, "UPDATE ads SET first_seen=?, last_seen=?", now - 60 * DAY, now - 60 * DAY)
+
+    report = sqlite_db.compact(retention_days={"price_history": 90, "ads": 0})
+    assert report["deleted"]["price_history"] == 0
+    assert "ads" not in report["deleted"]
+
+    report = sqlite_db.compact(retention_days={"price_history": 30, "ads": 0})
+    assert report["deleted"]["price_history"] == 1
+    assert sqlite_db.price_history("avito", "1") == []
+    assert [row[1] for row in sqlite_db.iter_ads()] == ["1"]
+
+
+def test_viewed_kept_while_ad_is_still_listed(sqlite_db):
+    old = int(time.time()) - 40 * DAY
+    sqlite_db.add_cian_records([("listed", 100, URL, ""), ("gone", 200, URL, "")])
+    sqlite_db.save_cian_scan_ids(URL, ["listed"])
+    age_rows(sqlite_db, "UPDATE cian_viewed SET timestamp=?", old)
+
+    report = sqlite_db.compact(retention_days={"cian_viewed": 30})
+
+    assert report["deleted"]["cian_viewed"] == 1
+    assert sqlite_db.existing_cian_records([("listed", 100), ("gone", 200)]) == {("listed", 100)}
+
+
+def test_report_counts_reclaimed_space(sqlite_db):
+    sqlite_db.index_ads("avito", [(str(i), "Дом " * 50, "Описание " * 200, URL, i) for i in range(2000)])
+    old = int(time.time()) - 200 * DAY
+    age_rows(sqlite_db, "UPDATE ads SET first_seen=?, last_seen=?", old, old)
+
+    report = sqlite_db.compact(retention_days={"ads": 90})
+
+    assert report["deleted"]["ads"] == 2000
+    assert report["size_after"] < report["size_before"]
+    assert report["reclaimed_bytes"] == report["size_before"] - report["size_after"]
+
+
+def test_incremental_vacuum_enabled_by_compaction_not_on_open(open_sqlite_db, tmp_path):
+    path = tmp_path / "database.db"
+    make_legacy_db(path)
+    db = open_sqlite_db(path)
+
+    def auto_vacuum():
+        with sqlite3.connect(path) as conn:
+            return conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+
+    assert auto_vacuum() == 0
+    db.compact()
+    assert auto_vacuum() == 2
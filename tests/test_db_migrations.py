@@ -0,0 +1,104 @@
+import json
+import sqlite3
+
+# Схема до версионирования миграций (user_version = 0)
+LEGACY_SCHEMA = """
+CREATE TABLE viewed (id INTEGER, price INTEGER, PRIMARY KEY (id, price));
+CREATE TABLE settings (user_id INTEGER, key TEXT, value TEXT, PRIMARY KEY (user_id, key));
+CREATE TABLE searches (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, platform TEXT,
+    urls TEXT, settings_json TEXT, active INTEGER DEFAULT 1
+);
+CREATE TABLE scan_history (
+    url TEXT, ad_ids TEXT, timestamp INTEGER DEFAULT (strftime('%s', 'now')), PRIMARY KEY (url)
+);
+CREATE TABLE cian_viewed (
+    id TEXT, price INTEGER, url TEXT, title TEXT,
+    timestamp INTEGER DEFAULT (strftime('%s', 'now')), PRIMARY KEY (id, price)
+);
+CREATE TABLE cian_scan_history (
+    url TEXT, ad_ids TEXT, timestamp INTEGER DEFAULT (strftime('%s', 'now')), PRIMARY KEY (url)
+);
+"""
+
+
+def user_version(path):
+    with sqlite3.connect(path) as conn:
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def make_legacy_db(path):
+    conn = sqlite3.connect(path)
+    conn.executescript(LEGACY_SCHEMA)
+    conn.execute("INSERT INTO viewed(id, price) VALUES (10, 500)")
+    conn.execute(
+        "INSERT INTO scan_history(url, ad_ids, timestamp) VALUES (?, ?, ?)",
+        ("https://www.avito.ru/a", json.dumps(["1", "2"]), 1000),
+    )
+    conn.execute(
+        "INSERT INTO cian_scan_history(url, ad_ids, timestamp) VALUES (?, ?, ?)",
+        ("https://cian.ru/a", "not json", 1000),
+    )
+    conn.execute("INSERT INTO cian_viewed(id, price, url, title) VALUES ('c1', 900, 'https://cian.ru/c1', 'Квартира')")
+    # Номер 1 пропущен, 2 остановлен, 3 активен и ещё без площадки в настройках
+    conn.execute("INSERT INTO searches(id, user_id, urls, settings_json, active) VALUES (2, 1, 'u', '{}', 0)")
+    conn.execute("INSERT INTO searches(id, user_id, urls, settings_json, active) VALUES (3, 1, 'u', '{}', 1)")
+    conn.commit()
+    conn.close()
+
+
+def test_new_database_gets_latest_version(open_sqlite_db, tmp_path):
+    path = tmp_path / "database.db"
+    open_sqlite_db(path)
+    version = user_version(path)
+    assert version > 0
+
+    # Повторное открытие не применяет миграции заново
+    open_sqlite_db(path)
+    assert user_version(path) == version
+
+
+def test_legacy_database_is_migrated(open_sqlite_db, tmp_path):
+    path = tmp_path / "database.db"
+    make_legacy_db(path)
+    db = open_sqlite_db(path)
+
+    with sqlite3.connect(path) as conn:
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+        viewed_columns = [row[1] for row in conn.execute("PRAGMA table_info(viewed)")]
+        search_columns = [row[1] for row in conn.execute("PRAGMA table_info(searches)")]
+        settings_json = conn.execute("SELECT settings_json FROM searches WHERE id=3").fetchone()[0]
+    assert "scan_history" not in tables and "cian_scan_history" not in tables
+    assert "timestamp" in viewed_columns
+    assert "name" in search_columns
+    assert json.loads(settings_json)["platform"] == "avito"
+
+    assert sorted(db.get_scan_ids("https://www.avito.ru/a")) == ["1", "2"]
+    assert db.get_cian_scan_ids("https://cian.ru/a") == []
+    assert db.existing_records([(10, 500)]) == {(10, 500)}
+    if db.fulltext_enabled:
+        assert [row[1] for row in db.search_ads("Квартира", platform="cian")] == ["c1"]
+
+
+def test_search_ids_reuse_gaps_and_stopped_searches(open_sqlite_db, tmp_path):
+    path = tmp_path / "database.db"
+    make_legacy_db(path)
+    db = open_sqlite_db(path)
+
+    assert db.add_search(1, "avito", ["u"], {}) == 1
+    assert db.add_search(1, "avito", ["u"], {}) == 2
+    assert db.add_search(1, "cian", ["u"], {}) == 4
+
+    db.deactivate_search(2)
+    db.deactivate_search(2)
+    assert db.add_search(1, "avito", ["u"], {}, name="снова") == 2
+    assert db.add_search(1, "avito", ["u"], {}) == 5
+    assert {row[0] for row in db.list_active_searches(1)} == {1, 2, 3, 4, 5}
+
+
+def test_clean_active_searches_frees_all_ids(sqlite_db):
+    for _ in range(3):
+        sqlite_db.add_search(1, "avito", ["u"], {})
+    sqlite_db.clean_active_searches()
+    assert sqlite_db.list_active_searches() == []
+    assert sqlite_db.add_search(1, "avito", ["u"], {}) == 1
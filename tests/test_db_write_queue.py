@@ -0,0 +1,94 @@
+import sqlite3
+import threading
+
+import pytest
+
+from db_service import WriteBehindQueue
+
+
+@pytest.fixture
+def queue_db(tmp_path):
+    """Очередь записи над отдельным файлом БД с таблицей t(v)."""
+    path = tmp_path / "queue.db"
+    local = threading.local()
+
+    def connect() -> sqlite3.Connection:
+        if getattr(local, "conn", None) is None:
+            local.conn = sqlite3.connect(path, isolation_level=None)
+        return local.conn
+
+    connect().execute("CREATE TABLE t(v INTEGER PRIMARY KEY)")
+    writer = WriteBehindQueue(connect, batch_ms=200)
+    yield writer, lambda: sorted(v for (v,) in connect().execute("SELECT v FROM t"))
+    writer.close()
+
+
+def test_flush_waits_for_queued_writes(queue_db):
+    writer, values = queue_db
+    for v in range(3):
+        writer.submit(lambda conn, v=v: conn.execute("INSERT INTO t VALUES (?)", (v,)))
+    writer.flush(timeout=5)
+    assert values() == [0, 1, 2]
+
+
+def test_failed_op_does_not_roll_back_its_batch(queue_db):
+    writer, values = queue_db
+    ok = writer.submit(lambda conn: conn.execute("INSERT INTO t VALUES (1)"))
+    # Повтор первичного ключа - ошибка только этой операции (откат до SAVEPOINT)
+    bad = writer.submit(lambda conn: conn.execute("INSERT INTO t VALUES (1)"))
+    also_ok = writer.submit(lambda conn: conn.execute("INSERT INTO t VALUES (2)").lastrowid)
+    writer.flush(timeout=5)
+
+    assert ok.exception() is None
+    assert isinstance(bad.exception(), sqlite3.IntegrityError)
+    assert also_ok.result() == 2
+    assert values() == [1, 2]
+
+
+def test_close_commits_remaining_writes(queue_db):
+    writer, values = queue_db
+    writer.submit(lambda conn: conn.execute("INSERT INTO t VALUES (7)"))
+    writer.close()
+    assert values() == [7]
+    with pytest.raises(RuntimeError):
+        writer.submit(lambda conn: None)
+
+
+def test_settings_are_read_back_immediately(sqlite_db):
+    sqlite_db.set_setting(1, "min_price", "100")
+    assert sqlite_db.get_setting(1, "min_price") == "100"
+    assert sqlite_db.list_typed_settings(1) == {"min_price": 100}
+
+    sqlite_db.delete_setting(1, "min_price")
+    assert sqlite_db.get_setting(1, "min_price") is None
+
+
+def test_settings_visible_to_other_threads_without_flush(sqlite_db):
+    sqlite_db.set_setting(1, "pages", "3")
+    seen = []
+    thread = threading.Thread(target=lambda: seen.append(sqlite_db.get_setting(1, "pages")))
+    thread.start()
+    thread.join()
+    assert seen == ["3"]
+
+
+def test_queued_writes_are_read_back_by_same_thread(sqlite_db):
+    sqlite_db.add_records([(5, 100), (6, 200)])
+    assert sqlite_db.existing_records([(5, 100), (6, 300)]) == {(5, 100)}
+
+    sqlite_db.save_scan_ids("https://www.avito.ru/a", ["5", "6"])
+    assert sqlite_db.known_ad_ids("avito", ["https://www.avito.ru/a"], ["5", "7"]) == {"5"}
+
+
+def test_transaction_applies_after_queued_writes(sqlite_db):
+    sqlite_db.add_records([(1, 10)])
+    with sqlite_db.transaction():
+        sqlite_db.add_records([(2, 20)])
+    assert sqlite_db.existing_records([(1, 10), (2, 20)]) == {(1, 10), (2, 20)}
+
+
+def test_search_deactivation_is_visible_immediately(sqlite_db):
+    search_id = sqlite_db.add_search(1, "avito", ["https://www.avito.ru/a"], {})
+    assert [row[0] for row in sqlite_db.list_active_searches(1)] == [search_id]
+    sqlite_db.deactivate_search(search_id)
+    assert sqlite_db.list_active_searches(1) == []
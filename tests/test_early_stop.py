@@ -0,0 +1,84 @@
+import pytest
+
+import bloom_filter
+from parser_avito import EARLY_STOP_KNOWN_STREAK, AvitoParse
+from parser_cian import CianParse
+from storage import InMemoryDBHandler
+
+CIAN_URL = "https://www.cian.ru/cat.php?deal_type=sale&offer_type=flat&region=1"
+
+
+def ads(*ids):
+    return [{"id": str(ad_id), "price": "1 000 000 ₽"} for ad_id in ids]
+
+
+@pytest.mark.parametrize("parser", [AvitoParse, CianParse])
+def test_all_known_page(parser):
+    page = ads(1, 2, 3)
+    assert parser._all_known(page, [])
+    assert not parser._all_known(page, ads(3))
+    assert not parser._all_known([], [])
+
+
+@pytest.mark.parametrize("parser", [AvitoParse, CianParse])
+def test_known_streak_stops_pagination(parser):
+    new = ads("n1", "n2")
+    known = ads(*range(EARLY_STOP_KNOWN_STREAK))
+    # Новые объявления в начале страницы, дальше EARLY_STOP_KNOWN_STREAK известных подряд
+    assert parser._all_known(new + known + ads("n3"), new + ads("n3"))
+
+    # Серия короче порога, прерванная новым объявлением, не останавливает
+    page = known[:-1] + ads("n3") + known[:-1]
+    assert not parser._all_known(page, ads("n3"))
+
+
+def test_avito_date_sorted():
+    assert AvitoParse._date_sorted("https://www.avito.ru/moskva/kvartiry")
+    assert AvitoParse._date_sorted("https://www.avito.ru/moskva/kvartiry?s=104&p=2")
+    assert not AvitoParse._date_sorted("https://www.avito.ru/moskva/kvartiry?s=1")
+
+
+@pytest.mark.parametrize("url, expected", [
+    (CIAN_URL, CIAN_URL + "&sort=creation_date_desc"),
+    ("https://www.cian.ru/snyat/", "https://www.cian.ru/snyat/?sort=creation_date_desc"),
+    (CIAN_URL + "&sort=price_object_order", CIAN_URL + "&sort=price_object_order"),
+    (CIAN_URL + "&sort=creation_date_desc", CIAN_URL + "&sort=creation_date_desc"),
+    # Параметр, лишь оканчивающийся на sort, не считается сортировкой
+    (CIAN_URL + "&presort=1", CIAN_URL + "&presort=1&sort=creation_date_desc"),
+])
+def test_cian_with_date_sort(url, expected):
+    assert CianParse._with_date_sort(url) == expected
+
+
+@pytest.fixture
+def make_cian(monkeypatch):
+    """CianParse без сети: каждая страница листинга - одни и те же известные объявления."""
+    monkeypatch.setattr(bloom_filter, "_filters", {})
+
+    def make(url, **kwargs):
+        db = InMemoryDBHandler()
+        page = ads(*range(5))
+        db.save_cian_scan_ids(url, [ad["id"] for ad in page])
+        parser = CianParse(url=[url], db_handler=db, count=5, **kwargs)
+        parser.fetched = []
+        parser.get_page = lambda page_url: parser.fetched.append(page_url) or "<html></html>"
+        parser.parse_offers = lambda html: page
+        return parser
+
+    return make
+
+
+@pytest.mark.parametrize("url, kwargs, pages", [
+    (CIAN_URL, {}, 1),
+    (CIAN_URL + "&sort=creation_date_desc", {}, 1),
+    # Своя сортировка: известные объявления могут стоять перед новыми
+    (CIAN_URL + "&sort=price_object_order", {}, 5),
+    (CIAN_URL, {"early_stop": False}, 5),
+    (CIAN_URL, {"first_run": True}, 5),
+])
+def test_cian_stops_early_only_when_sorted_by_date(make_cian, url, kwargs, pages):
+    parser = make_cian(url, **kwargs)
+    parser.parse()
+    assert len(parser.fetched) == pages
+    assert parser.total_pages_saved == 5 - pages
+    assert all("sort=" in page_url for page_url in parser.fetched)
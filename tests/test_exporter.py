@@ -0,0 +1,124 @@
+import csv
+import gzip
+import io
+import json
+from datetime import datetime
+
+import pytest
+
+from db_service import AD_EXPORT_COLUMNS
+from exporter import export_ads, main, write_ads
+from storage import InMemoryDBHandler
+
+ADS = [
+    ("avito", "1", "Дом у леса", "Баня, газ", "https://www.avito.ru/dom_1", 5_000_000),
+    ("cian", "c2", "Студия, 25 м²", 'Кухня "евро"\nсанузел', "https://cian.ru/sale/flat/2/", 7_100_000),
+    ("avito", "3", "Дача", "", "https://www.avito.ru/dacha_3", 900_000),
+]
+# Время первого появления объявлений ADS по порядку
+FIRST_SEEN = [datetime(2024, 5, 1, 12), datetime(2024, 5, 2, 12), datetime(2024, 5, 3, 12)]
+
+
+def fill(db):
+    for platform, ad_id, title, description, url, price in ADS:
+        db.index_ads(platform, [(ad_id, title, description, url, price)])
+    db.flush()
+
+
+@pytest.fixture
+def memory_db():
+    db = InMemoryDBHandler()
+    fill(db)
+    for (platform, ad_id, *_), seen in zip(ADS, FIRST_SEEN):
+        db._ads[(platform, ad_id)][4:6] = [int(seen.timestamp())] * 2
+    return db
+
+
+@pytest.fixture
+def filled_sqlite_db(sqlite_db):
+    fill(sqlite_db)
+    with sqlite_db.transaction() as conn:
+        for (platform, ad_id, *_), seen in zip(ADS, FIRST_SEEN):
+            conn.execute(
+                "UPDATE ads SET first_seen=?, last_seen=? WHERE platform=? AND ad_id=?",
+                (int(seen.timestamp()), int(seen.timestamp()), platform, ad_id),
+            )
+    return sqlite_db
+
+
+def expected(indexes=range(len(ADS))):
+    return [
+        dict(zip(AD_EXPORT_COLUMNS, (*ADS[i], FIRST_SEEN[i].isoformat(), FIRST_SEEN[i].isoformat())))
+        for i in indexes
+    ]
+
+
+def read_jsonl(text):
+    return [json.loads(line) for line in text.splitlines()]
+
+
+def read_csv(text):
+    rows = list(csv.DictReader(io.StringIO(text)))
+    for row in rows:
+        row["price"] = int(row["price"])
+    return rows
+
+
+def test_jsonl_round_trip(memory_db, tmp_path):
+    path = tmp_path / "ads.jsonl"
+    assert export_ads(path, db=memory_db) == 3
+    assert read_jsonl(path.read_text(encoding="utf-8")) == expected()
+
+
+def test_csv_round_trip_keeps_quotes_and_newlines(memory_db, tmp_path):
+    path = tmp_path / "ads.csv"
+    assert export_ads(path, fmt="csv", db=memory_db) == 3
+    assert read_csv(path.read_text(encoding="utf-8")) == expected()
+
+
+def test_gzip_by_extension_or_flag(memory_db, tmp_path):
+    path = tmp_path / "ads.jsonl.gz"
+    assert export_ads(path, platform="avito", db=memory_db) == 2
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        assert read_jsonl(f.read()) == expected([0, 2])
+
+    path = tmp_path / "ads.csv"
+    export_ads(path, fmt="csv", compress=True, db=memory_db)
+    with gzip.open(path, "rt", encoding="utf-8", newline="") as f:
+        assert read_csv(f.read()) == expected()
+
+
+def test_write_ads_streams_a_generator():
+    consumed = []
+
+    def ads():
+        for ad in expected():
+            consumed.append(ad["ad_id"])
+            yield ad
+
+    out = io.StringIO()
+    assert write_ads(ads(), out, "jsonl") == 3
+    assert consumed == ["1", "c2", "3"]
+    assert read_jsonl(out.getvalue()) == expected()
+
+    with pytest.raises(ValueError):
+        write_ads(iter([]), io.StringIO(), "xml")
+
+
+def test_cli_exports_sqlite_to_file(filled_sqlite_db, tmp_path, capsys):
+    path = tmp_path / "ads.csv.gz"
+    assert main([str(path), "-f", "csv", "--since", "2024-05-02", "--until", "2024-05-03T12:00"]) == 0
+    with gzip.open(path, "rt", encoding="utf-8", newline="") as f:
+        assert read_csv(f.read()) == expected([1])
+    assert "Выгружено объявлений: 1" in capsys.readouterr().err
+
+
+def test_cli_exports_to_stdout(filled_sqlite_db, capsys):
+    assert main(["-", "--platform", "avito"]) == 0
+    assert read_jsonl(capsys.readouterr().out) == expected([0, 2])
+
+
+def test_cli_rejects_bad_date(filled_sqlite_db, capsys):
+    with pytest.raises(SystemExit):
+        main(["-", "--since", "вчера"])
+    assert "ISO 8601" in capsys.readouterr().err
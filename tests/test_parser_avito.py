@@ -0,0 +1,254 @@
+import json
+import time
+from datetime import timedelta
+from html import escape
+from types import SimpleNamespace
+from urllib.parse import quote
+
+import pytest
+
+import parser_avito
+from parser_avito import DETAIL_CACHE_SIZE, DETAIL_CACHE_TTL, AvitoParse, DetailPageCache
+from proxy_pool import ProxyPool
+from storage import InMemoryDBHandler
+
+URL = "https://www.avito.ru/moskva/doma_dachi_kottedzhi"
+
+
+def make_ad(ad_id, price="1 000 000 ₽"):
+    return {
+        "id": str(ad_id),
+        "name": f"Дом {ad_id}",
+        "description": "",
+        "url": f"https://www.avito.ru/moskva/doma/dom_{ad_id}",
+        "price": price,
+    }
+
+
+@pytest.fixture
+def make_parser():
+    """AvitoParse без браузера и Telegram: уведомления складываются в parser.sent."""
+    db = InMemoryDBHandler()
+
+    def make(chat_id=1, **kwargs):
+        parser = AvitoParse(url=[URL], chat_id=chat_id, db_handler=db, need_more_info=0, **kwargs)
+        parser.sent = []
+        parser.send_notification_with_photo = lambda data: parser.sent.append(data["id"])
+        return parser
+
+    return make
+
+
+def test_searches_of_different_chats_are_notified_independently(make_parser):
+    first, second = make_parser(chat_id=1), make_parser(chat_id=2)
+    ads = [make_ad(1), make_ad(2)]
+
+    first._process_new_ads(ads)
+    second._process_new_ads(ads)
+
+    assert first.sent == ["1", "2"]
+    assert second.sent == ["1", "2"]
+
+
+def test_ad_from_several_urls_is_notified_once_per_scan(make_parser):
+    parser = make_parser()
+    parser._process_new_ads([make_ad(1)])
+    parser._process_new_ads([make_ad(1), make_ad(3)])
+    assert parser.sent == ["1", "3"]
+
+
+# Урезанное состояние листинга Авито: window.__initialData__ - URL-кодированный JSON
+STATE = {
+    "@avito/bx-single-page": {
+        "data": {
+            "searchCore": {"count": 2},
+            "catalog": {
+                "items": [
+                    {
+                        "id": 4321987650,
+                        "type": "item",
+                        "categoryId": 25,
+                        "title": "Дом 120 м² на участке 6 сот.",
+                        "description": "Газ, свет, вода",
+                        "urlPath": "/moskva/doma_dachi_kottedzhi/dom_120m_na_uchastke_6sot._4321987650",
+                        "priceDetailed": {"value": 12500000, "string": "12 500 000 ₽"},
+                        "images": [{
+                            "208x156": "https://00.img.avito.st/image/1/208x156",
+                            "864x648": "https://00.img.avito.st/image/1/864x648",
+                        }],
+                    },
+                    {"id": 77, "type": "banner", "banner": {"id": "ads_top"}},
+                    {
+                        "id": 4321987651,
+                        "title": "Дача 40 м²",
+                        "urlPath": "https://www.avito.ru/moskva/doma_dachi_kottedzhi/dacha_4321987651",
+                        "priceDetailed": {"value": None},
+                        "images": [],
+                    },
+                ],
+            },
+        },
+    },
+}
+
+
+def initial_data_html(state):
+    return f'<script>window.__initialData__ = "{quote(json.dumps(state))}";</script>'
+
+
+def test_catalog_items_are_found_at_any_depth():
+    assert AvitoParse._find_catalog_items(STATE) == STATE["@avito/bx-single-page"]["data"]["catalog"]["items"]
+    assert AvitoParse._find_catalog_items([{"catalog": {"items": []}}]) == []
+    assert AvitoParse._find_catalog_items({"catalog": {"items": None}}) is None
+
+
+def test_state_items_are_read_from_initial_data_and_mfe_state(make_parser):
+    parser = make_parser()
+    items = STATE["@avito/bx-single-page"]["data"]["catalog"]["items"]
+    assert parser._extract_state_items(initial_data_html(STATE)) == items
+
+    mfe = f'<script type="mime/invalid" data-mfe-state="true">{escape(json.dumps(STATE))}</script>'
+    assert parser._extract_state_items(mfe) == items
+
+    broken = '<script>window.__initialData__ = "%7B%22catalog";</script>'
+    assert parser._extract_state_items(broken + mfe) == items
+    assert parser._extract_state_items(broken) is None
+    assert parser._extract_state_items("<html></html>") is None
+
+
+def test_state_item_is_converted_like_a_card():
+    house, banner, dacha = STATE["@avito/bx-single-page"]["data"]["catalog"]["items"]
+    assert AvitoParse._state_item_to_ad(house) == {
+        "name": "Дом 120 м² на участке 6 сот.",
+        "description": "Газ, свет, вода",
+        "url": "https://www.avito.ru/moskva/doma_dachi_kottedzhi/dom_120m_na_uchastke_6sot._4321987650",
+        "price": "12500000",
+        "id": "4321987650",
+        "listing_image_url": "https://00.img.avito.st/image/1/864x648",
+    }
+    assert AvitoParse._state_item_to_ad(banner) is None
+    assert AvitoParse._state_item_to_ad(dacha) == {
+        "name": "Дача 40 м²",
+        "description": "",
+        "url": "https://www.avito.ru/moskva/doma_dachi_kottedzhi/dacha_4321987651",
+        "price": "0",
+        "id": "4321987651",
+    }
+
+
+class StubLimiter:
+    def __init__(self):
+        self.calls = []
+
+    def acquire(self, stop_event=None):
+        self.calls.append("acquire")
+
+    def penalize(self):
+        self.calls.append("penalize")
+
+    def reward(self):
+        self.calls.append("reward")
+
+
+class StubSession:
+    def __init__(self, status_code, text):
+        self.response = SimpleNamespace(status_code=status_code, text=text, elapsed=timedelta(seconds=0.5))
+
+    def get(self, url, timeout=None):
+        return self.response
+
+
+@pytest.fixture
+def http_parser(make_parser, monkeypatch):
+    """Парсер с подменёнными HTTP-сессией, ограничителем темпа и учётом прокси."""
+    pool = ProxyPool()
+    limiter = StubLimiter()
+    monkeypatch.setattr(parser_avito, "get_proxy_pool", lambda: pool)
+
+    def make(status_code, text):
+        parser = make_parser()
+        parser._current_proxy = "10.0.0.1:8080"
+        parser._rate_limiter = lambda: limiter
+        parser.session = StubSession(status_code, text)
+        return parser
+
+    make.pool, make.limiter = pool, limiter
+    return make
+
+
+def test_http_listing_is_parsed_from_state(http_parser):
+    parser = http_parser(200, initial_data_html(STATE))
+    ads = parser._parse_page_http(URL + "?p=1")
+    assert [ad["id"] for ad in ads] == ["4321987650", "4321987651"]
+    assert {"4321987650", "4321987651"} <= parser.current_scan_ads
+    stats = http_parser.pool.stats("10.0.0.1:8080")
+    assert (stats.successes, stats.blocks) == (1, 0)
+
+
+def test_http_listing_without_state_falls_back_to_browser(http_parser):
+    parser = http_parser(200, "<html><div data-marker='item'></div></html>")
+    assert parser._parse_page_http(URL + "?p=1") is None
+    assert not parser._http_blocked
+
+
+def test_http_error_code_falls_back_without_reporting_success(http_parser):
+    parser = http_parser(500, initial_data_html(STATE))
+    assert parser._parse_page_http(URL + "?p=1") is None
+    assert http_parser.pool.stats("10.0.0.1:8080").successes == 0
+
+
+@pytest.mark.parametrize("status_code, text", [(403, ""), (429, ""), (200, "Доступ ограничен")])
+def test_http_block_quarantines_proxy_and_disables_fast_path(http_parser, status_code, text):
+    parser = http_parser(status_code, text)
+    assert parser._parse_page_http(URL + "?p=1") is None
+    assert parser._http_blocked
+    assert http_parser.limiter.calls == ["acquire", "penalize"]
+    stats = http_parser.pool.stats("10.0.0.1:8080")
+    assert (stats.successes, stats.blocks) == (0, 1)
+    assert stats.quarantined_until > time.time()
+
+    # До конца сканирования HTTP-путь не используется
+    assert parser._parse_page_http(URL + "?p=2") is None
+    assert http_parser.limiter.calls == ["acquire", "penalize"]
+
+
+def test_detail_cache_defaults():
+    cache = DetailPageCache()
+    assert (cache.ttl, cache.max_size) == (DETAIL_CACHE_TTL, DETAIL_CACHE_SIZE) == (600, 5000)
+
+
+def test_detail_cache_entries_expire_after_ttl():
+    now = SimpleNamespace(value=100.0)
+    cache = DetailPageCache(ttl=600, clock=lambda: now.value)
+    cache.put("1", {"geo": "Москва", "views": "15", "name": "не кэшируется"})
+    cache.put("2", {"name": "без полей карточки"})
+
+    now.value += 600
+    assert cache.get("1") == {"geo": "Москва", "views": "15"}
+    assert cache.get("2") is None
+
+    now.value += 0.5
+    assert cache.get("1") is None
+    assert "1" not in cache._entries
+    assert (cache.hits, cache.misses) == (1, 2)
+
+    # Повторное сохранение начинает срок заново
+    cache.put("1", {"geo": "Химки"})
+    now.value += 300
+    assert cache.get("1") == {"geo": "Химки"}
+
+
+def test_detail_cache_evicts_least_recently_used():
+    cache = DetailPageCache(max_size=3, clock=lambda: 0.0)
+    for ad_id in "123":
+        cache.put(ad_id, {"views": ad_id})
+    assert cache.get("1") == {"views": "1"}
+    cache.put("4", {"views": "4"})
+    assert list(cache._entries) == ["3", "1", "4"]
+    assert cache.get("2") is None
+
+    full = DetailPageCache(clock=lambda: 0.0)
+    for i in range(DETAIL_CACHE_SIZE + 10):
+        full.put(str(i), {"views": str(i)})
+    assert len(full._entries) == DETAIL_CACHE_SIZE
+    assert full.get("9") is None and full.get("10") == {"views": "10"}
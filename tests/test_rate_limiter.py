@@ -0,0 +1,62 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from rate_limiter import RATE_BLOCK_FACTOR, TokenBucket, get_rate_limiter
+
+
+def test_burst_does_not_wait():
+    bucket = TokenBucket("test", rate=1, burst=2, jitter=0)
+    assert bucket.acquire() == 0
+    assert bucket.acquire() == 0
+
+
+def test_paces_after_burst():
+    bucket = TokenBucket("test", rate=20, burst=2, jitter=0)
+    started = time.monotonic()
+    for _ in range(5):
+        bucket.acquire()
+    # Два запроса из запаса, ещё три - с интервалом 1/20 с
+    assert time.monotonic() - started >= 0.14
+
+
+@pytest.mark.parametrize("event_type", [asyncio.Event, threading.Event])
+def test_acquire_accepts_job_stop_event(event_type):
+    # Бот передаёт в парсеры asyncio.Event задачи (SearchJob.stop_event)
+    stop_event = event_type()
+    bucket = TokenBucket("test", rate=20, burst=2, jitter=0)
+    for _ in range(3):
+        bucket.acquire(stop_event)
+
+
+@pytest.mark.parametrize("event_type", [asyncio.Event, threading.Event])
+def test_stop_event_interrupts_wait(event_type):
+    stop_event = event_type()
+    bucket = TokenBucket("test", rate=0.1, burst=1, jitter=0)
+    bucket.acquire(stop_event)
+    threading.Timer(0.1, stop_event.set).start()
+    started = time.monotonic()
+    assert bucket.acquire(stop_event) > 5
+    assert time.monotonic() - started < 2
+
+
+def test_penalize_and_reward_stay_within_bounds():
+    bucket = TokenBucket("test", rate=0.5, burst=2, max_rate=0.52, min_rate=0.1, jitter=0)
+    bucket.penalize()
+    assert bucket.rate == pytest.approx(0.5 * RATE_BLOCK_FACTOR)
+    for _ in range(10):
+        bucket.penalize()
+    assert bucket.rate == 0.1
+    for _ in range(100):
+        bucket.reward()
+    assert bucket.rate == 0.52
+
+
+def test_limiter_shared_per_domain_and_proxy():
+    first = get_rate_limiter("https://www.avito.ru/moskva", "user:pass@1.2.3.4:8000")
+    assert get_rate_limiter("https://m.avito.ru/spb", "user:pass@1.2.3.4:8000") is first
+    assert get_rate_limiter("https://www.avito.ru/moskva") is not first
+    assert get_rate_limiter("https://cian.ru/", "user:pass@1.2.3.4:8000") is not first
+    assert "pass" not in first.name
@@ -0,0 +1,102 @@
+import pytest
+
+import selector_cache as module
+from selector_cache import SELECTOR_PROMOTE_STREAK, SelectorCache
+
+SELECTORS = ("precise", "fallback", "broad")
+
+
+def finder(matching):
+    """query для find(): элемент находят только селекторы из matching."""
+    calls = []
+
+    def query(selector):
+        calls.append(selector)
+        return [selector] if selector in matching else []
+
+    return query, calls
+
+
+def test_single_fallback_hit_does_not_change_order():
+    cache = SelectorCache()
+    query, _ = finder({"broad"})
+    assert cache.find("page", "name", SELECTORS, query) == ["broad"]
+    assert cache.ordered("page", "name", SELECTORS) == SELECTORS
+
+
+def test_fallback_promoted_after_streak_of_precise_misses():
+    cache = SelectorCache()
+    query, calls = finder({"fallback", "broad"})
+    for _ in range(SELECTOR_PROMOTE_STREAK):
+        cache.find("page", "name", SELECTORS, query)
+    calls.clear()
+    assert cache.find("page", "name", SELECTORS, query) == ["fallback"]
+    assert calls == ["fallback"]
+
+
+def test_precise_hit_after_winner_miss_restores_order():
+    cache = SelectorCache()
+    query, _ = finder({"broad"})
+    for _ in range(SELECTOR_PROMOTE_STREAK):
+        cache.find("page", "name", SELECTORS, query)
+    assert cache.ordered("page", "name", SELECTORS)[0] == "broad"
+
+    query, _ = finder({"fallback"})
+    cache.find("page", "name", SELECTORS, query)
+    assert cache.ordered("page", "name", SELECTORS)[0] == "fallback"
+
+
+def test_periodic_recheck_demotes_fallback(monkeypatch):
+    monkeypatch.setattr(module, "SELECTOR_RECHECK_EVERY", 5)
+    cache = SelectorCache()
+    query, _ = finder({"broad"})
+    for _ in range(SELECTOR_PROMOTE_STREAK):
+        cache.find("page", "name", SELECTORS, query)
+
+    # Точный селектор снова работает, но закреплённый "broad" маскирует его до перепроверки
+    query, _ = finder({"precise", "broad"})
+    results = [cache.find("page", "name", SELECTORS, query)[0] for _ in range(5)]
+    assert "precise" in results
+    assert cache.ordered("page", "name", SELECTORS) == SELECTORS
+
+
+def test_scopes_and_fields_are_independent():
+    cache = SelectorCache()
+    query, _ = finder({"broad"})
+    for _ in range(SELECTOR_PROMOTE_STREAK):
+        cache.find("apartments", "name", SELECTORS, query)
+    assert cache.ordered("apartments", "price", SELECTORS) == SELECTORS
+    assert cache.ordered("listing", "name", SELECTORS) == SELECTORS
+
+
+def test_record_promotes_only_when_precise_missed_on_whole_page():
+    cache = SelectorCache()
+    # Точный селектор нашёлся хотя бы в одной карточке - порядок не меняется
+    for _ in range(SELECTOR_PROMOTE_STREAK):
+        cache.record("page", "name", SELECTORS, {"precise": 1, "broad": 20})
+    assert cache.ordered("page", "name", SELECTORS) == SELECTORS
+
+    for _ in range(SELECTOR_PROMOTE_STREAK):
+        cache.record("page", "name", SELECTORS, {"fallback": 2, "broad": 20})
+    assert cache.ordered("page", "name", SELECTORS)[0] == "fallback"
+
+    cache.record("page", "name", SELECTORS, {"precise": 1, "fallback": 20})
+    assert cache.ordered("page", "name", SELECTORS) == SELECTORS
+
+
+def test_record_ignores_unknown_selectors():
+    cache = SelectorCache()
+    for _ in range(SELECTOR_PROMOTE_STREAK):
+        cache.record("page", "name", SELECTORS, {"stale": 5})
+    assert cache.ordered("page", "name", SELECTORS) == SELECTORS
+    assert cache.hit_rates() == {}
+
+
+def test_hit_rates_count_first_try_hits():
+    cache = SelectorCache()
+    precise, _ = finder({"precise"})
+    broad, _ = finder({"broad"})
+    cache.find("page", "name", SELECTORS, precise)
+    cache.find("page", "name", SELECTORS, broad)
+    cache.find("page", "name", SELECTORS, finder(set())[0])
+    assert cache.hit_rates() == {"page/name": pytest.approx(1 / 3)}
@@ -0,0 +1,35 @@
+from db_service import SettingsCache
+
+
+def test_put_after_invalidate_is_not_cached():
+    cache = SettingsCache()
+    # Чтение из БД началось до записи настроек...
+    generation = cache.generation(1)
+    cache.invalidate(1)
+    # ...и вернуло старые значения: в кэш они попасть не должны
+    raw, typed = cache.put(1, generation, {"pages": "2"})
+    assert typed == {"pages": 2}
+    assert cache.get(1) is None
+
+    cache.put(1, cache.generation(1), {"pages": "3"})
+    assert cache.get(1)[1] == {"pages": 3}
+
+
+def test_lru_evicts_least_recently_used_user():
+    cache = SettingsCache(max_users=2)
+    for user_id in (1, 2):
+        cache.put(user_id, cache.generation(user_id), {})
+    cache.get(1)
+    cache.put(3, cache.generation(3), {})
+    assert cache.get(2) is None
+    assert cache.get(1) is not None and cache.get(3) is not None
+
+
+def test_handler_refreshes_cache_on_write(sqlite_db):
+    sqlite_db.set_setting(1, "keywords", "дом;баня")
+    assert sqlite_db.list_typed_settings(1)["keywords"] == ["дом", "баня"]
+    assert sqlite_db.cached_settings(1) is not None
+
+    sqlite_db.set_setting(1, "keywords", "дача")
+    assert sqlite_db.cached_settings(1) is None
+    assert sqlite_db.list_typed_settings(1)["keywords"] == ["дача"]
@@ -0,0 +1,136 @@
+import json
+import time
+
+import pytest
+
+from storage import InMemoryDBHandler
+
+AVITO_URL = "https://www.avito.ru/moskva/kvartiry"
+OTHER_URL = "https://www.avito.ru/moskva/doma"
+CIAN_URL = "https://cian.ru/cat.php?offer_type=flat"
+
+
+@pytest.fixture(params=["sqlite", "memory"])
+def backend(request):
+    if request.param == "memory":
+        return InMemoryDBHandler()
+    return request.getfixturevalue("sqlite_db")
+
+
+def run_scenario(db):
+    """Одинаковая последовательность операций; результат сравнивается между движками."""
+    result = {}
+
+    db.add_records([(1, 100), (2, 200), (1, 100)])
+    db.add_cian_records([("c1", 900, CIAN_URL, "Студия у метро")])
+    result["existing"] = db.existing_records([(1, 100), (2, 250), (3, 300)])
+    result["existing_cian"] = db.existing_cian_records([("c1", 900), ("c1", 800)])
+
+    # Как в парсере: цены пишутся при разборе, история сканирования - в конце
+    result["first_prices"] = db.record_prices("avito", AVITO_URL, [("10", 5000), ("13", 100), ("11", 0)])
+    db.save_scan_ids(AVITO_URL, ["10", "11"])
+    db.save_scan_ids(OTHER_URL, ["12"])
+    db.save_cian_scan_ids(CIAN_URL, ["c2"])
+    result["known"] = db.known_ad_ids("avito", [AVITO_URL], ["10", "12", "13"])
+    result["known_viewed"] = db.known_ad_ids("avito", [AVITO_URL], ["1", "10"], include_viewed=True)
+    result["known_cian"] = db.known_ad_ids("cian", [CIAN_URL], ["c1", "c2"], include_viewed=True)
+    result["ad_ids"] = sorted(db.iter_ad_ids("avito"))
+    result["cian_ad_ids"] = sorted(db.iter_ad_ids("cian"))
+
+    # Снижение - только у объявления из истории сканирования этого URL
+    result["drops"] = sorted(db.record_prices("avito", AVITO_URL, [("10", 4000), ("13", 50)]))
+
+    db.index_ads("avito", [("10", "Дом у леса", "Баня, участок", AVITO_URL, 4000)])
+    db.index_ads("cian", [("c1", "Студия у метро", "", CIAN_URL, 900)])
+    result["search"] = db.search_ads("бан")
+    result["search_cian"] = db.search_ads("студ мет", platform="cian")
+    result["search_none"] = db.search_ads("квартира")
+    result["exported"] = sorted((row[0], row[1], row[2]) for row in db.iter_ads())
+
+    db.set_setting(7, "min_price", "1000")
+    db.set_setting(7, "keywords", "дом, баня")
+    db.delete_setting(7, "absent")
+    result["settings"] = db.list_settings(7)
+    result["typed_settings"] = db.list_typed_settings(7)
+    db.delete_setting(7, "keywords")
+    result["setting_after_delete"] = db.get_setting(7, "keywords")
+
+    ids = [db.add_search(7, "avito", [AVITO_URL], {"pages": 2}, name="дома") for _ in range(3)]
+    db.deactivate_search(ids[1])
+    ids.append(db.add_search(8, "cian", [CIAN_URL], {}))
+    result["search_ids"] = ids
+    result["active"] = [
+        (sid, urls, json.loads(settings), name, owner)
+        for sid, urls, settings, name, owner in db.list_active_searches()
+    ]
+    result["active_cian"] = [row[0] for row in db.list_active_searches(platform="cian")]
+    result["active_user"] = [row[0] for row in db.list_active_searches(user_id=7)]
+
+    db.clean_active_searches()
+    result["after_clean"] = db.list_active_searches()
+    result["reused_id"] = db.add_search(7, "avito", [AVITO_URL], {})
+
+    db.clean_scan_history()
+    db.clean_cian_viewed()
+    result["after_clean_history"] = (
+        db.known_ad_ids("avito", [AVITO_URL], ["10"]),
+        db.existing_cian_records([("c1", 900)]),
+    )
+    db.flush()
+    return result
+
+
+def test_backend_contract(backend):
+    result = run_scenario(backend)
+    assert result["existing"] == {(1, 100)}
+    assert result["known"] == {"10"}
+    assert result["known_viewed"] == {"1", "10"}
+    assert result["first_prices"] == []
+    assert result["drops"] == [("10", 5000, 4000)]
+    assert [row[1] for row in result["search"]] == ["10"]
+    assert [row[1] for row in result["search_cian"]] == ["c1"]
+    assert result["typed_settings"]["min_price"] == 1000
+    assert result["search_ids"] == [1, 2, 3, 2]
+    assert result["reused_id"] == 1
+
+
+def test_sqlite_and_memory_backends_agree(sqlite_db):
+    if not sqlite_db.fulltext_enabled:
+        pytest.skip("SQLite собран без FTS5")
+    assert run_scenario(sqlite_db) == run_scenario(InMemoryDBHandler())
+
+
+def test_second_price_change_within_a_second_is_kept(backend, monkeypatch):
+    monkeypatch.setattr(time, "time", lambda: 1_700_000_000.5)
+    backend.save_scan_ids(AVITO_URL, ["10"])
+    backend.record_prices("avito", AVITO_URL, [("10", 5000)])
+    backend.record_prices("avito", OTHER_URL, [("10", 4500)])
+    backend.record_prices("avito", OTHER_URL, [("10", 4500)])
+    backend.flush()
+    assert backend.price_history("avito", "10") == [(1_700_000_000, 4500)]
+    # Следующее сканирование сравнивает с последней ценой, а не с первой за секунду
+    assert backend.record_prices("avito", AVITO_URL, [("10", 4000)]) == [("10", 4500, 4000)]
+
+
+@pytest.mark.parametrize("query, found", [
+    ('студ"', True),
+    ('"студия', True),
+    ('"студия метро"', True),
+    ("мет*", True),
+    ("-метро", True),
+    ("студия NEAR метро", True),
+    ("NEAR(студия метро)", True),
+    ("студия OR дом", False),
+    ("NOT дом", False),
+    ("title:студия", False),
+    ("c++ ^студ", True),
+    ('5"-дюймовый', True),
+    ('" * - ( ) :', False),
+    ("", False),
+])
+def test_search_ignores_fulltext_syntax_in_user_input(backend, query, found):
+    if not getattr(backend, "fulltext_enabled", True):
+        pytest.skip("SQLite собран без FTS5")
+    backend.index_ads("cian", [("c1", "Студия у метро, NEAR парка", 'Экран 5"-дюймовый, c++', CIAN_URL, 900)])
+    backend.flush()
+    assert [row[1] for row in backend.search_ads(query)] == (["c1"] if found else [])